@@ -18,7 +18,35 @@ limitations under the License.
 
 from __future__ import absolute_import
 
+import sys
+from importlib import import_module
+from types import ModuleType
+
 from .loadimpact_cli import *
-from .userscenario_commands import *
-from .organization_commands import *
 from .version import __version__
+
+# Modules whose names used to be exported by the package. They are imported
+# on first access instead, as they import the API client.
+LAZY_EXPORT_MODULES = ('userscenario_commands', 'organization_commands')
+
+
+class LazyExportsModule(ModuleType):
+    """
+    Type of the package module, resolving the names of
+    `LAZY_EXPORT_MODULES` on first access. Unlike a module level
+    `__getattr__`, this works on every supported version of Python.
+    """
+    def __getattr__(self, name):
+        if not name.startswith('_'):
+            for module_name in LAZY_EXPORT_MODULES:
+                module = import_module('.' + module_name, self.__name__)
+                if hasattr(module, name):
+                    return getattr(module, name)
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(self.__name__, name))
+
+
+_package = LazyExportsModule(__name__, __doc__)
+_package.__dict__.update(globals())
+# Keep the original module alive, as its globals are used by its functions.
+_package._original_module = sys.modules[__name__]
+sys.modules[__name__] = _package
@@ -0,0 +1,219 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from .util import replace_file
+
+# Prefixes of the cache file names, allowing to tell apart the entries that
+# never expire from the ones that expire or should be discarded when the data
+# is modified through the API.
+PERMANENT_PREFIX = 'p-'
+VOLATILE_PREFIX = 'v-'
+
+# Fraction of the maximum size the cache is pruned to when it is exceeded
+# on a write, so the following writes do not need to prune it again.
+PRUNE_RATIO = 0.9
+
+
+class ResponseCache(object):
+    """
+    Persistent cache of API responses, storing each entry as a JSON file in
+    `cache_dir`.
+
+    Volatile entries expire after `ttl` seconds, while permanent entries
+    (for data that can never change, such as finished test runs) are only
+    evicted when the size of the cache exceeds `max_size` bytes, in which
+    case the least recently written entries are removed first.
+
+    The cache directory is only scanned by `prune()`, which runs on the first
+    write of the process and then whenever the estimated size of the cache
+    (its size at the last prune plus the size of the entries written since)
+    exceeds `max_size`. It can be shared by several threads.
+    """
+    def __init__(self, cache_dir, ttl=300, max_size=50 * 1024 * 1024):
+        """
+        :param cache_dir: directory where the entries are stored. It is
+        created on the first write.
+        :param ttl: time to live (in seconds) of the volatile entries.
+        :param max_size: maximum size (in bytes) of the cache.
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        # Set `enabled` to False to neither read from nor write to the cache,
+        # and `refresh` to True to write to the cache without reading from it.
+        self.enabled = True
+        self.refresh = False
+        # Estimated size of the cache in bytes, None until the first prune.
+        self._size = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the data stored for `key`, or None if there is no valid
+        entry for it.
+        """
+        if not self.enabled or self.refresh:
+            return None
+
+        for prefix in (VOLATILE_PREFIX, PERMANENT_PREFIX):
+            path = self._path(key, prefix)
+            try:
+                with open(path, 'r') as f:
+                    entry = json.load(f)
+            except (IOError, OSError, ValueError):
+                continue
+
+            if entry.get('key') != key:
+                continue
+            if entry.get('expires') is not None and entry['expires'] < time.time():
+                self._remove(path)
+                continue
+            return entry.get('data')
+
+        return None
+
+    def set(self, key, data, permanent=False):
+        """
+        Store `data` (which must be serializable to JSON) for `key`.
+
+        :param permanent: if True, the entry does not expire.
+        """
+        if not self.enabled:
+            return
+
+        entry = {
+            'key': key,
+            'expires': None if permanent else time.time() + self.ttl,
+            'data': data,
+        }
+        content = json.dumps(entry)
+        try:
+            self._makedirs()
+            path = self._path(key, PERMANENT_PREFIX if permanent else VOLATILE_PREFIX)
+            # Each write uses its own temporary file, as entries may be
+            # written by several threads and processes at once.
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(content)
+                replace_file(tmp_path, path)
+            except (IOError, OSError):
+                self._remove(tmp_path)
+                raise
+
+            with self._lock:
+                if self._size is not None:
+                    self._size += len(content)
+                prune = self._size is None or self._size > self.max_size
+            if prune:
+                self.prune(int(self.max_size * PRUNE_RATIO))
+        except (IOError, OSError):
+            # Failing to cache a response is never fatal.
+            pass
+
+    def clear(self, volatile_only=False):
+        """
+        Remove the entries of the cache.
+
+        :param volatile_only: if True, keep the permanent entries.
+        """
+        for name, _ in self._entries():
+            if not volatile_only or name.startswith(VOLATILE_PREFIX):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    def prune(self, max_size=None):
+        """
+        Remove the expired volatile entries and, if the cache is still larger
+        than `max_size` (by default, the one of the cache), the least recently
+        written entries.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        now = time.time()
+        entries = []
+        for name, stat in self._entries():
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(VOLATILE_PREFIX) and stat.st_mtime + self.ttl < now:
+                self._remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= max_size:
+                break
+            self._remove(path)
+            total_size -= size
+        with self._lock:
+            self._size = total_size
+
+    def _path(self, key, prefix):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, '{0}{1}.json'.format(prefix, digest))
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                yield name, os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+
+    def _makedirs(self):
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError as ex:
+            if not (ex.errno == errno.EEXIST and os.path.isdir(self.cache_dir)):
+                raise
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class CachedResponse(object):
+    """
+    Minimal stand-in for a `requests.Response` of a successful request, built
+    from a cached JSON body.
+    """
+    status_code = 200
+
+    def __init__(self, url, json_data):
+        self.url = url
+        self._json_data = json_data
+
+    @property
+    def text(self):
+        return json.dumps(self._json_data)
+
+    def json(self):
+        return self._json_data
@@ -13,16 +13,219 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import hashlib
+import re
+import threading
+
 import loadimpact3
-import click
-from loadimpact3.exceptions import UnauthorizedError
+import requests
+from loadimpact3.exceptions import CoercionError, ResponseParseError
+from loadimpact3.resources import DataStore, Test, TestRun, UserScenario
+from requests.adapters import HTTPAdapter
 
+from .cache import CachedResponse, ResponseCache
+from .upload import MultipartStream
 from .version import __version__
-from .config import LOADIMPACT_API_TOKEN
+from .config import (CACHE_DIR, get_api_token, get_cache_max_size, get_cache_ttl, get_http_keep_alive,
+                     get_http_pool_size)
+
+# Paths of the read-only API calls whose responses can be cached for a while.
+CACHEABLE_PATH_RE = re.compile(r'^(organizations(/\d+/projects)?|(tests|user-scenarios|data-stores)\?project_id=\d+)$')
+# Paths of the test runs, whose responses can be cached forever once finished.
+TEST_RUN_PATH_RE = re.compile(r'^test-runs/\d+$')
+# Paths of the POST calls that do not modify any data.
+READ_ONLY_POST_PATH_RE = re.compile(r'^test-runs/\d+/(results|result_ids)$')
+
+FINISHED_TEST_RUN_STATUSES = (TestRun.STATUS_FINISHED, TestRun.STATUS_TIMED_OUT, TestRun.STATUS_ABORTED_USER,
+                              TestRun.STATUS_ABORTED_SYSTEM, TestRun.STATUS_ABORTED_SCRIPT_ERROR,
+                              TestRun.STATUS_ABORTED_THRESHOLD, TestRun.STATUS_FAILED_THRESHOLD)
+
+
+def _bind_project(resource_class, project_id):
+    """
+    Return a subclass of `resource_class` bound to `project_id`.
+
+    The SDK `list()` methods store the project id as a class attribute of the
+    resource, which is not safe when listing several projects concurrently
+    (and affects any later call using that resource class). Listing through
+    a throwaway subclass keeps the project id local to each call.
+    """
+    return type(resource_class.__name__, (resource_class,), {'project_id': project_id})
+
+
+def build_session(pool_size=10, keep_alive=True):
+    """
+    Return a `requests.Session` that keeps a pool of up to `pool_size`
+    connections per host, to be shared by all the requests made by the CLI
+    (including the ones made concurrently from several threads).
+
+    :param pool_size: maximum number of connections to each host. Requests
+    exceeding it wait for a connection to be released, so it also caps the
+    number of simultaneous requests to each host.
+    :param keep_alive: if False, connections are closed after each request.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+class CLIClient(loadimpact3.ApiTokenClient):
+    """
+    API client used by the CLI commands. It can be safely shared by several
+    threads.
+
+    If a `ResponseCache` is passed as `cache`, the responses of the read-only
+    calls are cached: listings of organizations, projects, tests, user
+    scenarios and data stores expire after the cache TTL, while finished test
+    runs are kept until evicted. Any call modifying data through the API
+    discards the cached listings.
+
+    All the requests are made through a single pooled `session`, reusing the
+    connections (and their TLS handshakes) between requests.
+    """
+    def __init__(self, api_token=None, cache=None, session=None, *args, **kwargs):
+        super(CLIClient, self).__init__(api_token, *args, **kwargs)
+        self.cache = cache
+        self.session = session if session is not None else build_session()
+
+    def get(self, path, headers=None, params=None):
+        cacheable = (self.cache is not None and params is None and
+                     (CACHEABLE_PATH_RE.match(path) or TEST_RUN_PATH_RE.match(path)))
+        if not cacheable:
+            return super(CLIClient, self).get(path, headers=headers, params=params)
+
+        key = self._cache_key(path)
+        data = self.cache.get(key)
+        if data is not None:
+            return CachedResponse(path, data)
+
+        response = super(CLIClient, self).get(path, headers=headers, params=params)
+        data = response.json()
+        if CACHEABLE_PATH_RE.match(path):
+            self.cache.set(key, data)
+        elif (data.get(TestRun.resource_response_object_name) or {}).get('status') in FINISHED_TEST_RUN_STATUSES:
+            self.cache.set(key, data, permanent=True)
+        return response
+
+    def post(self, path, *args, **kwargs):
+        if not READ_ONLY_POST_PATH_RE.match(path):
+            self._discard_cached_listings()
+        return super(CLIClient, self).post(path, *args, **kwargs)
+
+    def put(self, path, *args, **kwargs):
+        self._discard_cached_listings()
+        return super(CLIClient, self).put(path, *args, **kwargs)
+
+    def delete(self, path, *args, **kwargs):
+        self._discard_cached_listings()
+        return super(CLIClient, self).delete(path, *args, **kwargs)
+
+    def create_data_store(self, data, file_object, compress=False, progress=None):
+        return self._upload_data_store(self.post, DataStore._path(), data, file_object, compress, progress)
+
+    def update_data_store(self, resource_id, data, file_object, compress=False, progress=None):
+        return self._upload_data_store(self.put, DataStore._path(resource_id=resource_id), data, file_object,
+                                       compress, progress)
+
+    def _upload_data_store(self, method, path, data, file_object, compress, progress):
+        """
+        Upload `file_object` as a data store, streaming it (and optionally
+        compressing it with gzip) instead of loading it into memory.
+
+        :param progress: optional callable, called with the number of bytes
+        of the file read each time a chunk is uploaded.
+        """
+        body = MultipartStream(data, 'file', file_object, compress=compress, progress=progress)
+        response = method(path, headers={'Content-Type': body.content_type}, data=body)
+        try:
+            data_store = DataStore(self)
+            data_store._set_fields(response.json().get(DataStore.resource_response_object_name))
+            return data_store
+        except CoercionError as e:
+            raise ResponseParseError(e)
+
+    def list_data_stores(self, project_id):
+        return _bind_project(DataStore, project_id).list(self)
+
+    def list_user_scenarios(self, project_id):
+        return _bind_project(UserScenario, project_id).list(self)
+
+    def list_tests(self, project_id):
+        return _bind_project(Test, project_id).list(self)
+
+    def list_test_runs(self, test_id):
+        """
+        Return the `TestRun`s of the test with id `test_id`.
+        """
+        response = self.get(TestRun._path(), params={'test_id': test_id})
+        test_runs = []
+        try:
+            for obj in response.json().get(TestRun.resource_response_objects_name) or []:
+                test_run = TestRun(self)
+                test_run._set_fields(obj)
+                test_runs.append(test_run)
+        except CoercionError as e:
+            raise ResponseParseError(e)
+        return test_runs
+
+    def _requests_request(self, method, *args, **kwargs):
+        return self.session.request(method, *args, **kwargs)
+
+    def scoped_key(self, key):
+        """
+        Return `key` qualified with the API host and a digest of the API token,
+        so the data stored locally under it is never shared between different
+        users or APIs.
+        """
+        token_digest = hashlib.sha1(self.api_token.encode('utf-8')).hexdigest()
+        return u'{0}|{1}|{2}'.format(token_digest, self.api_base_url, key)
+
+    def _cache_key(self, path):
+        return self.scoped_key(path)
+
+    def _discard_cached_listings(self):
+        if self.cache is not None:
+            self.cache.clear(volatile_only=True)
+
+
+class LazyClient(object):
+    """
+    Proxy for the `CLIClient` shared by the commands, which is only built
+    (reading the config and prompting for the API token if needed) the first
+    time one of its attributes is accessed.
+    """
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_client', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    object.__setattr__(self, '_client', self._factory())
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get_client(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get_client(), name, value)
+
+
+def build_client():
+    response_cache.ttl = get_cache_ttl()
+    response_cache.max_size = get_cache_max_size()
+
+    session = build_session(pool_size=get_http_pool_size(), keep_alive=get_http_keep_alive())
+    client_ = CLIClient(api_token=get_api_token(), cache=response_cache, session=session)
+    client_.user_agent = "LoadImpactCLI/%s" % (__version__)
+    return client_
 
 
-try:
-    client = loadimpact3.ApiTokenClient(api_token=LOADIMPACT_API_TOKEN)
-    client.user_agent = "LoadImpactCLI/%s" % (__version__)
-except UnauthorizedError:
-    click.echo("Authentication failed")
+response_cache = ResponseCache(CACHE_DIR)
+client = LazyClient(build_client)
@@ -24,6 +24,7 @@ import click
 from .errors import CLIError
 
 config = configparser.ConfigParser()
+config_loaded = False
 home = os.path.expanduser("~")
 config_file_path = ''
 
@@ -65,10 +66,20 @@ def get_or_create_config_file_path(config_file_path):
             new_config.write(configfile)
 
 
+def load_config():
+    """Read the config file (creating it if needed), only the first time it is called."""
+    global config_loaded
+    if not config_loaded:
+        get_or_create_config_file_path(config_file_path)
+        config.read(config_file_path)
+        config_loaded = True
+
+
 def get_required_value_from_usersettings(key, env_name):
     """Get value from config or env, if the value is not in the config, prompt the user for it."""
     if os.getenv(env_name):
         return os.getenv(env_name)
+    load_config()
     try:
         return config.get('user_settings', key)
     except configparser.Error:
@@ -83,14 +94,53 @@ def get_optional_value_from_usersettings(key, env_name):
     """Get value from config or env if it exists."""
     if os.getenv(env_name):
         return os.getenv(env_name)
+    load_config()
     try:
         return config.get('user_settings', key)
     except configparser.Error:
         pass
 
 
-get_or_create_config_file_path(config_file_path)
-config.read(config_file_path)
+def get_default_project():
+    return get_optional_value_from_usersettings('default_project', 'LOADIMPACT_DEFAULT_PROJECT')
+
+
+def get_api_token():
+    return get_required_value_from_usersettings('api_token', 'LOADIMPACT_API_V3_TOKEN')
+
+
+def get_cache_ttl():
+    return int(get_optional_value_from_usersettings('cache_ttl', 'LOADIMPACT_CACHE_TTL') or 300)
+
+
+def get_cache_max_size():
+    return int(get_optional_value_from_usersettings('cache_max_size', 'LOADIMPACT_CACHE_MAX_SIZE') or
+               50 * 1024 * 1024)
+
+
+def get_http_pool_size():
+    return int(get_optional_value_from_usersettings('http_pool_size', 'LOADIMPACT_HTTP_POOL_SIZE') or 10)
+
+
+def get_http_keep_alive():
+    value = get_optional_value_from_usersettings('http_keep_alive', 'LOADIMPACT_HTTP_KEEP_ALIVE') or 'true'
+    return value.lower() not in ('0', 'false', 'no', 'off')
+
+
+# Local cache of API responses.
+CACHE_DIR = os.path.join(os.path.dirname(config_file_path), 'cache')
+
+# Local database of test run results.
+RESULTS_DB_PATH = os.path.join(os.path.dirname(config_file_path), 'results.db')
+
+
+def get_results_db_path():
+    return get_optional_value_from_usersettings('results_db', 'LOADIMPACT_RESULTS_DB') or RESULTS_DB_PATH
+
+
+# Hashes of the scripts last pushed by `user-scenario sync`, by API token, API
+# host and scenario id.
+SCENARIO_HASHES_PATH = os.path.join(os.path.dirname(config_file_path), 'scenario_hashes.json')
 
-DEFAULT_PROJECT = get_optional_value_from_usersettings('default_project', 'LOADIMPACT_DEFAULT_PROJECT')
-LOADIMPACT_API_TOKEN = get_required_value_from_usersettings('api_token', 'LOADIMPACT_API_V3_TOKEN')
+# Index of the data stores uploaded, by project and content.
+DATA_STORE_INDEX_PATH = os.path.join(os.path.dirname(config_file_path), 'data_store_index.json')
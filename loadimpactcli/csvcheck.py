@@ -0,0 +1,319 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import mmap
+from collections import Counter, OrderedDict
+
+# Characters of the CSV options of the data stores.
+SEPARATORS = OrderedDict([('comma', b','), ('semicolon', b';'), ('tab', b'\t')])
+DELIMITERS = OrderedDict([('double', b'"'), ('single', b"'")])
+
+CHUNK_SIZE = 1024 * 1024
+# Size of the beginning of the file used to detect its dialect.
+SAMPLE_SIZE = 64 * 1024
+# Maximum number of line numbers reported for each kind of problem.
+MAX_REPORTED_LINES = 10
+
+BLANK_LINES = (b'', b'\r')
+
+
+class CSVReport(object):
+    """
+    Result of checking a CSV file: the dialect used to read it, the number of
+    rows and columns (of the first row read), the problems that prevent
+    converting it and the warnings, which may be intended.
+    """
+    def __init__(self, separator, delimiter, detected):
+        """
+        :param separator: name of the separator used, one of `SEPARATORS`.
+        :param delimiter: name of the delimiter used, one of `DELIMITERS`.
+        :param detected: tuple with the names of the separator and delimiter
+        detected from the beginning of the file.
+        """
+        self.separator = separator
+        self.delimiter = delimiter
+        self.detected = detected
+        self.rows = 0
+        self.columns = None
+        # Tuples with the line number and the number of columns of the first
+        # rows with a different number of columns than the first row read.
+        self.ragged_rows = []
+        self.ragged_count = 0
+        # Numbers of the first lines that could not be decoded.
+        self.encoding_errors = []
+        self.encoding_error_count = 0
+        self.encoding = None
+        # Line of the record whose quoted field is never closed.
+        self.unterminated_quote_line = None
+
+    @property
+    def ok(self):
+        return not self.problems()
+
+    def problems(self):
+        """
+        Return a list with the descriptions of the problems found.
+        """
+        problems = []
+        if not self.rows:
+            problems.append(u'The file has no rows to read')
+        if self.unterminated_quote_line is not None:
+            problems.append(u'The quoted field starting at line {0} is never closed'.format(
+                self.unterminated_quote_line))
+        return problems
+
+    def warnings(self):
+        """
+        Return a list with the descriptions of the lines that are not valid
+        in the expected encoding (which may be another encoding the API
+        accepts) and of the rows with a different number of columns than the
+        first one.
+        """
+        warnings = [u'Line {0} is not valid {1}'.format(line, self.encoding) for line in self.encoding_errors]
+        if self.encoding_error_count > len(self.encoding_errors):
+            warnings.append(u'... and {0} more lines that are not valid {1}'.format(
+                self.encoding_error_count - len(self.encoding_errors), self.encoding))
+        warnings.extend(u'Line {0} has {1} columns, expected {2}'.format(line, columns, self.columns)
+                        for line, columns in self.ragged_rows)
+        if self.ragged_count > len(self.ragged_rows):
+            warnings.append(u'... and {0} more rows with a different number of columns'.format(
+                self.ragged_count - len(self.ragged_rows)))
+        return warnings
+
+
+def check_csv(file_object, separator=None, delimiter=None, fromline=1, encoding='utf-8', chunk_size=CHUNK_SIZE):
+    """
+    Check the CSV file `file_object` (a seekable binary file) without
+    uploading it, returning a `CSVReport`.
+
+    The file is memory mapped when possible and scanned once in chunks of
+    `chunk_size` bytes, so it is never loaded in memory as a whole. The rows
+    are checked with bytes methods on whole chunks, and the lines of a chunk
+    are only split when it contains quotes, blank lines or rows without the
+    expected number of separators.
+
+    :param separator: name of the separator, or None to detect it.
+    :param delimiter: name of the delimiter (ie. the quote character), or
+    None to detect it.
+    :param fromline: number of the first line read, the lines before it are
+    only checked for encoding errors.
+    """
+    sample = next(_iter_chunks(file_object, SAMPLE_SIZE), b'')
+    detected = detect_dialect(sample)
+    report = CSVReport(separator or detected[0], delimiter or detected[1], detected)
+    report.encoding = encoding
+    scanner = _Scanner(report, SEPARATORS[report.separator], DELIMITERS[report.delimiter], fromline)
+    scanner.scan(_iter_chunks(file_object, chunk_size))
+    return report
+
+
+def detect_dialect(sample):
+    """
+    Return a tuple with the names of the separator and the delimiter most
+    likely used by the CSV data `sample` (the beginning of a file).
+
+    The delimiter is the quote character opening most fields, and the
+    separator the one found the same number of times in most lines.
+    Defaults to comma and double quotes.
+    """
+    end = sample.rfind(b'\n')
+    if end >= 0:
+        # The last line may be incomplete.
+        sample = sample[:end]
+    lines = [line for line in sample.split(b'\n') if line not in BLANK_LINES]
+
+    def opening_quotes(name):
+        quote = DELIMITERS[name]
+        return sum(line.startswith(quote) + sum(line.count(sep + quote) for sep in SEPARATORS.values())
+                   for line in lines)
+    delimiter = max(DELIMITERS, key=opening_quotes)
+    quote = DELIMITERS[delimiter]
+
+    def consistency(name):
+        counts = Counter(scan_fields(line, SEPARATORS[name], quote)[0] for line in lines)
+        count, lines_with_count = counts.most_common(1)[0] if counts else (0, 0)
+        return (lines_with_count, count) if count else (0, 0)
+    separator = max(SEPARATORS, key=consistency)
+    if consistency(separator) == (0, 0):
+        separator = next(iter(SEPARATORS))
+    return separator, delimiter
+
+
+def scan_fields(line, separator, quote, quoted=False):
+    """
+    Return a tuple with the number of separators outside quoted fields in
+    `line` and whether it ends inside a quoted field (ie. the field continues
+    in the next line).
+
+    As in the `csv` module, a quote only opens a quoted field at the start of
+    a field, where `quoted` tells whether the line starts inside one. Within
+    a quoted field, doubled quotes are escaped quotes.
+    """
+    separators = 0
+    position = 0
+    field_start = not quoted
+    while True:
+        if quoted:
+            end = line.find(quote, position)
+            if end < 0:
+                return separators, True
+            if line[end + 1:end + 2] == quote:
+                position = end + 2
+            else:
+                quoted = False
+                field_start = False
+                position = end + 1
+        elif field_start and line[position:position + 1] == quote:
+            quoted = True
+            position += 1
+        elif line.find(quote, position) < 0:
+            # No more quoted fields, any quote in the rest of the line is
+            # part of an unquoted field.
+            return separators + line.count(separator, position), False
+        else:
+            end = line.find(separator, position)
+            if end < 0:
+                return separators, False
+            separators += 1
+            field_start = True
+            position = end + 1
+
+
+def _iter_chunks(file_object, chunk_size):
+    """
+    Yield the contents of `file_object` from its current position in chunks
+    of `chunk_size` bytes, leaving the position unchanged.
+    """
+    position = file_object.tell()
+    try:
+        buffer = mmap.mmap(file_object.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, EnvironmentError, ValueError):
+        # Not a real file, or an empty one (which can not be mapped).
+        buffer = None
+
+    if buffer is None:
+        try:
+            for chunk in iter(lambda: file_object.read(chunk_size), b''):
+                yield chunk
+        finally:
+            file_object.seek(position)
+        return
+
+    try:
+        for start in range(position, len(buffer), chunk_size):
+            yield buffer[start:start + chunk_size]
+    finally:
+        buffer.close()
+
+
+class _Scanner(object):
+    """
+    Counts the rows and columns of CSV data fed as chunks of whole lines,
+    keeping the state of the records spanning several lines (with quoted
+    line breaks) between chunks.
+    """
+    def __init__(self, report, separator, quote, fromline):
+        self.report = report
+        self.separator = separator
+        self.quote = quote
+        self.fromline = fromline
+        self.other_bytes = bytes(bytearray(b for b in range(256) if b not in (ord(separator), ord(b'\n'))))
+        # Number of the last line scanned.
+        self.line = 0
+        # First line of the record being scanned, if it continues in the next
+        # line, and the number of separators found in it so far.
+        self.record_line = None
+        self.record_separators = 0
+        self.quoted = False
+
+    def scan(self, chunks):
+        rest = b''
+        for chunk in chunks:
+            data = rest + chunk if rest else chunk
+            end = data.rfind(b'\n')
+            if end < 0:
+                rest = data
+                continue
+            self.scan_lines(data[:end])
+            rest = data[end + 1:]
+        if rest:
+            self.scan_lines(rest)
+        if self.record_line is not None:
+            self.report.unterminated_quote_line = self.record_line
+
+    def scan_lines(self, data):
+        self.check_encoding(data)
+        first_line = self.line + 1
+
+        report = self.report
+        if (self.record_line is None and report.columns is not None and first_line >= self.fromline and
+                self.quote not in data):
+            # Fast path: without quotes nor a record continuing from the
+            # previous chunk, deleting all the bytes but the separators and
+            # line breaks must leave the same separators in every line.
+            kept = data.translate(None, self.other_bytes)
+            lines = kept.count(b'\n') + 1
+            if kept + b'\n' == (self.separator * (report.columns - 1) + b'\n') * lines:
+                self.line += lines
+                report.rows += lines
+                return
+
+        lines = data.split(b'\n')
+        self.line += len(lines)
+        for number, line in enumerate(lines, first_line):
+            self.scan_line(number, line)
+
+    def scan_line(self, number, line):
+        if self.record_line is None:
+            if line in BLANK_LINES:
+                return
+            self.record_line = number
+            self.record_separators = 0
+
+        separators, self.quoted = scan_fields(line, self.separator, self.quote, self.quoted)
+        self.record_separators += separators
+        if not self.quoted:
+            self.end_record(self.record_separators + 1)
+
+    def end_record(self, columns):
+        report = self.report
+        if self.record_line >= self.fromline:
+            report.rows += 1
+            if report.columns is None:
+                report.columns = columns
+            elif columns != report.columns:
+                report.ragged_count += 1
+                if len(report.ragged_rows) < MAX_REPORTED_LINES:
+                    report.ragged_rows.append((self.record_line, columns))
+        self.record_line = None
+
+    def check_encoding(self, data):
+        report = self.report
+        try:
+            data.decode(report.encoding)
+            return
+        except UnicodeDecodeError:
+            pass
+        # Line breaks can not be part of a multibyte character in the
+        # supported encodings, so the lines can be decoded separately.
+        for number, line in enumerate(data.split(b'\n'), self.line + 1):
+            try:
+                line.decode(report.encoding)
+            except UnicodeDecodeError:
+                report.encoding_error_count += 1
+                if len(report.encoding_errors) < MAX_REPORTED_LINES:
+                    report.encoding_errors.append(number)
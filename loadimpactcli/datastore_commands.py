@@ -16,15 +16,22 @@ limitations under the License.
 """
 
 import click
-import requests
-import shutil
-from time import sleep
+import sys
+from contextlib import contextmanager
+from operator import methodcaller
 
-from loadimpact3.exceptions import ConnectionError
+from loadimpact3.exceptions import ConnectionError, NotFoundError
 from loadimpact3 import DataStore
 
 from .client import client
-from .config import DEFAULT_PROJECT
+from .config import DATA_STORE_INDEX_PATH, get_default_project
+from .csvcheck import DELIMITERS, SEPARATORS, check_csv
+from .datastore_index import DataStoreIndex, content_key
+from .download import DEFAULT_CHUNK_SIZE, download_file
+from .errors import DownloadError, PollTimeoutError
+from .polling import MAX_INTERVAL, TIMEOUT_EXIT_CODE, poll
+from .upload import get_file_size
+from .util import concurrent_map
 
 
 @click.group(name='data-store')
@@ -34,7 +41,7 @@ def data_store(ctx):
 
 
 @data_store.command('list', short_help='List datastore.')
-@click.option('--project_id', default=DEFAULT_PROJECT, envvar='DEFAULT_PROJECT', help='Id of the project to list data stores from.')
+@click.option('--project_id', default=get_default_project, envvar='DEFAULT_PROJECT', help='Id of the project to list data stores from.')
 def list_datastore(project_id):
 
     if not project_id:
@@ -52,28 +59,50 @@ def list_datastore(project_id):
 @data_store.command('download', short_help='Get datastore CSV.')
 @click.argument('datastore_id')
 @click.option('--file_name', help='Full path of file to save downloaded datastore in.')
-def download_csv(datastore_id, file_name):
+@click.option('--chunk_size', default=8, type=click.IntRange(1, None),
+              help='Size (in MB) of each of the parts the file is downloaded in.')
+@click.option('--concurrency', default=4, type=click.IntRange(1, None),
+              help='Maximum number of parts downloaded simultaneously.')
+@click.option('--checksum', default=None,
+              help='Expected checksum of the file, as ALGORITHM:HEXDIGEST (eg. sha256:e3b0c4...).')
+def download_csv(datastore_id, file_name, chunk_size, concurrency, checksum):
     try:
         data_store = client.get_data_store(datastore_id)
         file_path = file_name if file_name else "{0}.csv".format(data_store.id)
         click.echo("Downloading CSV file, please wait.")
-        _download_csv(data_store, file_path)
+        _download_csv(data_store, file_path, chunk_size=chunk_size * 1024 * 1024, concurrency=concurrency,
+                      checksum=checksum)
         click.echo("Finished download.")
     except ConnectionError:
         click.echo("Cannot connect to Load impact API")
+    except DownloadError as e:
+        click.echo("Download failed: {0}".format(e))
+        sys.exit(1)
 
 
 @data_store.command('create', short_help='Create datastore.')
 @click.argument('name')
-@click.argument('datastore_file', type=click.File('r'))
+@click.argument('datastore_file', type=click.File('rb'))
 @click.option('--delimiter', default='double', help='CSV file delimiter.')
 @click.option('--separator', default='comma', help='CSV file separator.')
 @click.option('--fromline', default=1, help='CSV file read from line')
-@click.option('--project_id', default=DEFAULT_PROJECT, envvar='DEFAULT_PROJECT', help='Id of the project to create the data store in.')
-def create_datastore(datastore_file, name, project_id, delimiter, separator, fromline):
+@click.option('--project_id', default=get_default_project, envvar='DEFAULT_PROJECT', help='Id of the project to create the data store in.')
+@click.option('--compress', is_flag=True, help='Compress the file with gzip while uploading it.')
+@click.option('--timeout', default=None, type=click.IntRange(1, None),
+              help='Maximum number of seconds to wait for the conversion to finish. Waits forever by default.')
+@click.option('--poll_interval', default=MAX_INTERVAL, type=click.IntRange(1, None),
+              help='Maximum number of seconds between checks of the conversion status.')
+@click.option('--no_dedup', is_flag=True,
+              help='Upload the file even if a data store with identical contents was already created from this '
+                   'machine.')
+@click.option('--no_check', is_flag=True, help='Upload the file without checking it first.')
+def create_datastore(datastore_file, name, project_id, delimiter, separator, fromline, compress, timeout,
+                     poll_interval, no_dedup, no_check):
 
     if not project_id:
         return click.echo('You need to provide a project id.')
+    if not no_check:
+        _check_before_upload(datastore_file, separator, delimiter, fromline)
     try:
         data_store_json = {
             'name': name,
@@ -82,27 +111,57 @@ def create_datastore(datastore_file, name, project_id, delimiter, separator, fro
             'separator': separator,
             'fromline': fromline,
         }
-        data_store = client.create_data_store(data_store_json, datastore_file)
-        data_store = _wait_for_conversion(data_store)
+        index = DataStoreIndex(DATA_STORE_INDEX_PATH)
+        key = None if no_dedup else content_key(datastore_file, data_store_json)
+        if key:
+            data_store = _find_indexed_data_store(index, project_id, key)
+            # A data store with another name is not reused, as it would not
+            # be found by the name given.
+            if data_store and data_store.name == name:
+                return click.echo(u"Reusing data store {0} ('{1}'), which has identical contents".format(
+                                  data_store.id, data_store.name))
+
+        with _upload_progress(datastore_file) as progress:
+            data_store = client.create_data_store(data_store_json, datastore_file, compress=compress,
+                                                  progress=progress)
+        data_store = _wait_for_conversion(data_store, timeout=timeout, max_interval=poll_interval)
+        if key and data_store.status == DataStore.STATUS_FINISHED:
+            index.add(project_id, key, data_store.id)
 
         click.echo("Data store conversion completed with status '{0}'".format(
                    (DataStore.status_code_to_text(data_store.status))))
 
     except ConnectionError:
         click.echo("Cannot connect to Load impact API")
+    except PollTimeoutError as e:
+        click.echo("Data store conversion did not finish: {0}".format(e))
+        sys.exit(TIMEOUT_EXIT_CODE)
 
 
 @data_store.command('update', short_help='Update datastore.')
 @click.argument('id')
-@click.argument('datastore_file', type=click.File('r'))
+@click.argument('datastore_file', type=click.File('rb'))
 @click.option('--name', default=None)
 @click.option('--delimiter', default='double', help='CSV file delimiter.')
 @click.option('--separator', default='comma', help='CSV file separator.')
 @click.option('--fromline', default=1, help='CSV file read from line')
-@click.option('--project_id', default=DEFAULT_PROJECT, envvar='DEFAULT_PROJECT', help='Project id of the data store')
-def update_datastore(id, datastore_file, name, project_id, delimiter, separator, fromline):
+@click.option('--project_id', default=get_default_project, envvar='DEFAULT_PROJECT',
+              help='Project id of the data store')
+@click.option('--compress', is_flag=True, help='Compress the file with gzip while uploading it.')
+@click.option('--timeout', default=None, type=click.IntRange(1, None),
+              help='Maximum number of seconds to wait for the conversion to finish. Waits forever by default.')
+@click.option('--poll_interval', default=MAX_INTERVAL, type=click.IntRange(1, None),
+              help='Maximum number of seconds between checks of the conversion status.')
+@click.option('--no_dedup', is_flag=True,
+              help='Upload the file even if the data store was last updated from this machine with identical '
+                   'contents.')
+@click.option('--no_check', is_flag=True, help='Upload the file without checking it first.')
+def update_datastore(id, datastore_file, name, project_id, delimiter, separator, fromline, compress, timeout,
+                     poll_interval, no_dedup, no_check):
     if not project_id:
         return click.echo('You need to provide a project id.')
+    if not no_check:
+        _check_before_upload(datastore_file, separator, delimiter, fromline)
     try:
         data_store = client.get_data_store(id)
         file_obj = datastore_file
@@ -113,14 +172,29 @@ def update_datastore(id, datastore_file, name, project_id, delimiter, separator,
             'separator': separator,
             'fromline': fromline,
         }
-        data_store = client.update_data_store(id, data_store_json, file_obj)
-        data_store = _wait_for_conversion(data_store)
+        index = DataStoreIndex(DATA_STORE_INDEX_PATH)
+        key = None if no_dedup else content_key(file_obj, data_store_json)
+        if key and not name and index.get(project_id, key) == data_store.id:
+            return click.echo(u"Data store {0} already has identical contents, not updating it".format(
+                              data_store.id))
+
+        # The previous contents of the data store are no longer available.
+        index.discard(data_store.id)
+        with _upload_progress(file_obj) as progress:
+            data_store = client.update_data_store(id, data_store_json, file_obj, compress=compress,
+                                                  progress=progress)
+        data_store = _wait_for_conversion(data_store, timeout=timeout, max_interval=poll_interval)
+        if key and data_store.status == DataStore.STATUS_FINISHED:
+            index.add(project_id, key, data_store.id)
 
         click.echo("Data store conversion completed with status '{0}'".format(
                   (DataStore.status_code_to_text(data_store.status))))
 
     except ConnectionError:
         click.echo("Cannot connect to Load impact API")
+    except PollTimeoutError as e:
+        click.echo("Data store conversion did not finish: {0}".format(e))
+        sys.exit(TIMEOUT_EXIT_CODE)
 
 
 @data_store.command('delete', short_help='Delete data-store.')
@@ -133,20 +207,125 @@ def delete_datastore(datastore_id):
         click.echo("Cannot connect to Load impact API")
 
 
-def _wait_for_conversion(data_store):
-    while not data_store.has_conversion_finished():
-        sleep(3)
+@data_store.command('check', short_help='Check a CSV file.')
+@click.argument('datastore_file', type=click.File('rb'))
+@click.option('--delimiter', type=click.Choice(list(DELIMITERS)), default=None,
+              help='CSV file delimiter. Detected from the file by default.')
+@click.option('--separator', type=click.Choice(list(SEPARATORS)), default=None,
+              help='CSV file separator. Detected from the file by default.')
+@click.option('--fromline', default=1, type=click.IntRange(1, None), help='CSV file read from line')
+def check_datastore(datastore_file, delimiter, separator, fromline):
+    if get_file_size(datastore_file) is None:
+        click.echo('Only regular files can be checked.')
+        sys.exit(1)
+    report = check_csv(datastore_file, separator=separator, delimiter=delimiter, fromline=fromline)
+    click.echo(u"Separator: {0}\nDelimiter: {1}\nRows: {2}\nColumns: {3}".format(
+               report.separator, report.delimiter, report.rows, report.columns or 0))
+    _echo_check_problems(report)
+    if not report.ok:
+        sys.exit(1)
+
+
+def _check_before_upload(file_object, separator, delimiter, fromline):
+    """
+    Check the CSV file `file_object` before uploading it, exiting if it can
+    not be converted and warning about lines that are not valid UTF-8 and
+    rows with a different number of columns. Files that can not be read again (eg. stdin) and unknown CSV
+    options are left for the API to check.
+    """
+    if separator not in SEPARATORS or delimiter not in DELIMITERS or get_file_size(file_object) is None:
+        return
+    report = check_csv(file_object, separator=separator, delimiter=delimiter, fromline=fromline)
+    if not report.ok:
+        click.echo("The file was not uploaded, as it can not be converted:")
+    elif report.warnings():
+        click.echo("Warning, the file may not be converted as expected:")
+    _echo_check_problems(report)
+    if not report.ok:
+        sys.exit(1)
+
+
+def _echo_check_problems(report):
+    for problem in report.problems() + report.warnings():
+        click.echo(u"  {0}".format(problem))
+    if report.detected != (report.separator, report.delimiter) and (not report.ok or report.warnings() or
+                                                                    report.columns == 1):
+        click.echo(u"The file seems to use --separator {0} --delimiter {1}".format(*report.detected))
+
+
+@contextmanager
+def _upload_progress(file_object):
+    """
+    Context manager displaying a progress bar for the upload of `file_object`
+    on stderr, yielding the callback to report the uploaded bytes to (or None
+    if stderr is not a terminal or the size of the file is unknown).
+    """
+    size = get_file_size(file_object)
+    if not size or not sys.stderr.isatty():
+        yield None
+        return
+    with click.progressbar(length=size, label='Uploading', file=sys.stderr) as bar:
+        yield bar.update
+
+
+def _wait_for_conversion(data_store, timeout=None, max_interval=MAX_INTERVAL):
+    """
+    Wait until the conversion of `data_store` has finished, polling its
+    status with an increasing interval of up to `max_interval` seconds.
+
+    :raises PollTimeoutError: if the conversion has not finished after
+    `timeout` seconds.
+    """
+    poll(data_store.has_conversion_finished, timeout=timeout, max_interval=max_interval)
+    return data_store
+
+
+def _find_indexed_data_store(index, project_id, key):
+    """
+    Return the data store of the project with content `key` in `index`, or
+    None if there is none or it is no longer usable (in which case it is
+    removed from the index).
+    """
+    data_store_id = index.get(project_id, key)
+    if data_store_id is None:
+        return None
+    try:
+        data_store = client.get_data_store(data_store_id)
+    except NotFoundError:
+        data_store = None
+    if data_store is None or data_store.status != DataStore.STATUS_FINISHED:
+        index.discard(data_store_id)
+        return None
     return data_store
 
 
-def _download_csv(user_scenario, file_path):
-    response = requests.get(user_scenario.public_url, stream=True)
-    if response.status_code == 200:
-        with open(file_path, 'wb') as f:
-            response.raw.decode_content = True
-            shutil.copyfileobj(response.raw, f)
+def wait_for_conversions(data_stores, timeout=None, max_interval=MAX_INTERVAL, concurrency=8):
+    """
+    Wait until the conversions of all the `data_stores` have finished, with a
+    single poller checking the status of the ones still converting (up to
+    `concurrency` of them simultaneously).
+
+    :raises PollTimeoutError: if some conversion has not finished after
+    `timeout` seconds.
+    """
+    pending = list(data_stores)
+
+    def check():
+        finished = list(concurrent_map(methodcaller('has_conversion_finished'), pending, concurrency))
+        pending[:] = [data_store for data_store, done in zip(pending, finished) if not done]
+        return not pending
+
+    poll(check, timeout=timeout, max_interval=max_interval)
+    return data_stores
+
+
+def _download_csv(data_store, file_path, chunk_size=DEFAULT_CHUNK_SIZE, concurrency=4, checksum=None):
+    return download_file(client.session, data_store.public_url, file_path, chunk_size=chunk_size,
+                         concurrency=concurrency, checksum=checksum)
 
 
 def delete_store(datastore_id):
     datastore = client.get_data_store(datastore_id)
-    return datastore.delete()
+    result = datastore.delete()
+    DataStoreIndex(DATA_STORE_INDEX_PATH).discard(datastore_id)
+    return result
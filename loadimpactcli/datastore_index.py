@@ -0,0 +1,79 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from .upload import hash_file
+from .util import file_lock, read_json_file, write_json_file
+
+
+class DataStoreIndex(object):
+    """
+    Local index of the data stores created from files, stored as JSON in
+    `path`, mapping the content key of each file (see `content_key()`) to the
+    id of its data store, separately for each project. It allows reusing a
+    data store instead of uploading (and converting) an identical file again.
+
+    The index is shared by every process of the machine, so it is only
+    modified while holding the lock file `path`.lock.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = u'{0}.lock'.format(path)
+
+    def get(self, project_id, key):
+        """
+        Return the id of the data store of the project with content `key`,
+        or None if there is none.
+        """
+        return read_json_file(self.path, {}).get(str(project_id), {}).get(key)
+
+    def add(self, project_id, key, data_store_id):
+        """
+        Record that the data store with id `data_store_id` has content `key`,
+        replacing any previous content of the data store.
+        """
+        with file_lock(self.lock_path):
+            index = self._without(read_json_file(self.path, {}), data_store_id)
+            index.setdefault(str(project_id), {})[key] = int(data_store_id)
+            write_json_file(self.path, index)
+
+    def discard(self, data_store_id):
+        """
+        Remove the entries of the data store with id `data_store_id` (eg.
+        because it was deleted or its content changed).
+        """
+        with file_lock(self.lock_path):
+            index = read_json_file(self.path, {})
+            if index:
+                write_json_file(self.path, self._without(index, data_store_id))
+
+    @staticmethod
+    def _without(index, data_store_id):
+        return dict((project_id, dict((key, id_) for key, id_ in entries.items() if id_ != int(data_store_id)))
+                    for project_id, entries in index.items())
+
+
+def content_key(file_object, data_store_json):
+    """
+    Return the key identifying the data store created from `file_object` with
+    the CSV options of `data_store_json`: the SHA-256 hash of the file and the
+    options, which change the converted data. Return None if the file can not
+    be hashed (ie. it is not a regular file).
+    """
+    file_hash = hash_file(file_object)
+    if file_hash is None:
+        return None
+    return u'{0}:{1}:{2}:{3}'.format(file_hash, data_store_json['delimiter'], data_store_json['separator'],
+                                     data_store_json['fromline'])
@@ -0,0 +1,204 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+from requests.exceptions import RequestException
+from six import raise_from
+
+from .errors import DownloadError
+from .util import concurrent_unordered, replace_file
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+BUFFER_SIZE = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes \d+-\d+/(\d+)$')
+
+
+def download_file(session, url, file_path, chunk_size=DEFAULT_CHUNK_SIZE, concurrency=4, checksum=None):
+    """
+    Download the file at `url` into `file_path`.
+
+    If the server supports range requests, the file is downloaded in chunks
+    of `chunk_size` bytes using up to `concurrency` simultaneous requests.
+    The data is written to a `.part` file (along with a `.part.json` file
+    keeping track of the chunks already downloaded), so an interrupted
+    download is resumed by calling this function again with the same
+    arguments. The `.part` file is renamed to `file_path` once complete.
+
+    :param session: `requests.Session` used for the requests.
+    :param checksum: optional expected checksum of the file, in the form
+    'ALGORITHM:HEXDIGEST' (eg. 'sha256:e3b0c4...'), using any algorithm
+    supported by `hashlib`.
+    :return: True if a previous partial download was resumed.
+    :raises DownloadError: if the download fails or the checksum does not
+    match.
+    """
+    if checksum:
+        # Fail early for invalid checksums.
+        _new_hash(checksum)
+
+    part_path = '{0}.part'.format(file_path)
+    state_path = '{0}.json'.format(part_path)
+    resumed = False
+
+    try:
+        # Probe for range support and the file size by requesting its first byte.
+        probe = session.get(url, stream=True, headers={'Range': 'bytes=0-0', 'Accept-Encoding': 'identity'})
+        try:
+            size = _parse_content_range(probe) if probe.status_code == 206 else None
+            if probe.status_code == 200:
+                # No range support: reuse the response for a sequential download.
+                _write_response(probe, part_path, 'wb')
+        finally:
+            probe.close()
+
+        if size is not None:
+            validator = probe.headers.get('ETag') or probe.headers.get('Last-Modified')
+            resumed = _download_ranges(session, url, part_path, state_path, size, validator, chunk_size,
+                                       concurrency)
+        elif probe.status_code in (206, 416):
+            # Unknown size or empty file: fall back to a sequential download.
+            response = session.get(url, stream=True)
+            try:
+                _check_status(response, 200)
+                _write_response(response, part_path, 'wb')
+            finally:
+                response.close()
+        elif probe.status_code != 200:
+            _check_status(probe, 200)
+    except RequestException as e:
+        raise_from(DownloadError(str(e)), None)
+
+    if checksum:
+        try:
+            _verify_checksum(part_path, checksum)
+        except DownloadError:
+            # The downloaded data is unusable: discard it.
+            os.remove(part_path)
+            if os.path.exists(state_path):
+                os.remove(state_path)
+            raise
+
+    replace_file(part_path, file_path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    return resumed
+
+
+def _download_ranges(session, url, part_path, state_path, size, validator, chunk_size, concurrency):
+    """
+    Download the chunks of the file that are not yet on the `.part` file,
+    returning True if some of them had been downloaded previously.
+    """
+    state = {'url': url, 'size': size, 'validator': validator, 'chunk_size': chunk_size, 'done': []}
+    previous_state = _load_state(state_path)
+    if previous_state and os.path.exists(part_path) and \
+            all(previous_state.get(k) == state[k] for k in ('url', 'size', 'validator', 'chunk_size')):
+        state['done'] = previous_state.get('done', [])
+    else:
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+
+    done = set(state['done'])
+    chunks = [(index, start, min(start + chunk_size, size) - 1)
+              for index, start in enumerate(range(0, size, chunk_size)) if index not in done]
+
+    def fetch(chunk):
+        index, start, end = chunk
+        headers = {'Range': 'bytes={0}-{1}'.format(start, end), 'Accept-Encoding': 'identity'}
+        if validator:
+            # Make the server send the whole file (and fail) if it has changed.
+            headers['If-Range'] = validator
+        response = session.get(url, stream=True, headers=headers)
+        try:
+            _check_status(response, 206)
+            written = _write_response(response, part_path, 'r+b', start)
+        finally:
+            response.close()
+        if written != end - start + 1:
+            raise DownloadError('Incomplete download of bytes {0}-{1}'.format(start, end))
+        return index
+
+    for index in concurrent_unordered(fetch, chunks, concurrency):
+        done.add(index)
+        state['done'] = sorted(done)
+        _save_state(state_path, state)
+
+    return len(chunks) < len(range(0, size, chunk_size))
+
+
+def _write_response(response, file_path, mode, offset=0):
+    """
+    Write the body of `response` to `file_path` starting at `offset`,
+    returning the number of bytes written.
+    """
+    written = 0
+    with open(file_path, mode) as f:
+        f.seek(offset)
+        for data in response.iter_content(BUFFER_SIZE):
+            f.write(data)
+            written += len(data)
+    return written
+
+
+def _check_status(response, expected_status_code):
+    if response.status_code != expected_status_code:
+        raise DownloadError('Unexpected response status {0} for {1}'.format(response.status_code, response.url))
+
+
+def _parse_content_range(response):
+    match = CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+
+def _load_state(state_path):
+    try:
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _save_state(state_path, state):
+    tmp_path = '{0}.tmp'.format(state_path)
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    replace_file(tmp_path, state_path)
+
+
+def _new_hash(checksum):
+    algorithm, _, hexdigest = checksum.partition(':')
+    try:
+        if not hexdigest:
+            raise ValueError
+        return hashlib.new(algorithm.lower())
+    except ValueError:
+        raise DownloadError("Invalid checksum '{0}', expected ALGORITHM:HEXDIGEST".format(checksum))
+
+
+def _verify_checksum(file_path, checksum):
+    hash_ = _new_hash(checksum)
+    with open(file_path, 'rb') as f:
+        for data in iter(lambda: f.read(BUFFER_SIZE), b''):
+            hash_.update(data)
+
+    expected = checksum.partition(':')[2].lower()
+    if hash_.hexdigest() != expected:
+        raise DownloadError('Checksum mismatch: expected {0}, got {1}'.format(expected, hash_.hexdigest()))
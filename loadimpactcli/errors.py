@@ -1,2 +1,14 @@
 class CLIError(Exception):
     """All Load Impact CLI exceptions derive from this class."""
+
+
+class DownloadError(CLIError):
+    """A file could not be downloaded."""
+
+
+class PollTimeoutError(CLIError):
+    """An operation did not complete before the polling deadline."""
+
+
+class MissingDependencyError(CLIError):
+    """An optional dependency needed by a command is not installed."""
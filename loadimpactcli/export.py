@@ -0,0 +1,91 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import gzip
+import io
+
+from .errors import MissingDependencyError
+from .output import format_line, format_value
+from .results import timestamp_to_datetime
+
+# Extension of the files of each export format.
+EXPORT_FORMATS = {
+    'csv': '.csv.gz',
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+}
+
+
+def export_series(all_series, file_path, export_format):
+    """
+    Write the `Series` of each metric in `all_series` (dict of raw metric
+    name to `Series`) to `file_path`, as a table with one row per point and
+    the columns `metric`, `timestamp` (UTC) and `value`.
+
+    :param export_format: one of `EXPORT_FORMATS`: 'csv' for a gzipped CSV
+    file, or 'parquet' and 'arrow' for Parquet and Arrow IPC (Feather v2)
+    files, which require `pyarrow`.
+    :return: the number of points written.
+    """
+    if export_format == 'csv':
+        return _export_csv(all_series, file_path)
+    return _export_arrow(all_series, file_path, export_format)
+
+
+def _export_csv(all_series, file_path):
+    points = 0
+    with io.TextIOWrapper(gzip.GzipFile(file_path, 'wb'), encoding='utf-8', newline='') as f:
+        f.write(format_line([u'metric', u'timestamp', u'value'], ','))
+        for name, series in all_series.items():
+            f.writelines(format_line([name, u'{0}Z'.format(timestamp_to_datetime(timestamp).isoformat()),
+                                      format_value(value)], ',')
+                         for timestamp, value in zip(series.timestamps, series.values))
+            points += len(series.timestamps)
+    return points
+
+
+def _export_arrow(all_series, file_path, export_format):
+    try:
+        import pyarrow as pa
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise MissingDependencyError("The {0} format requires pyarrow, install it with "
+                                     "'pip install loadimpact-cli[arrow]'".format(export_format))
+
+    names = []
+    timestamps = []
+    values = []
+    for name, series in all_series.items():
+        names.extend([name] * len(series.timestamps))
+        timestamps.extend(series.timestamps)
+        values.extend(series.values)
+
+    try:
+        value_array = pa.array(values, type=pa.float64())
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        # Non numeric metrics (eg. logs): keep the values as text.
+        value_array = pa.array([None if v is None else format_value(v) for v in values], type=pa.string())
+
+    table = pa.Table.from_arrays([pa.array(names, type=pa.string()).dictionary_encode(),
+                                  pa.array(timestamps, type=pa.timestamp('us', tz='UTC')),
+                                  value_array],
+                                 names=['metric', 'timestamp', 'value'])
+    if export_format == 'parquet':
+        pyarrow.parquet.write_table(table, file_path)
+    else:
+        pyarrow.feather.write_feather(table, file_path)
+    return len(timestamps)
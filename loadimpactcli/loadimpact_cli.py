@@ -15,29 +15,101 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import sys
+from importlib import import_module
+
 import click
 
-from .userscenario_commands import userscenario
-from .organization_commands import organization
-from .datastore_commands import data_store
-from .test_commands import test
-from .metric_commands import metric
 from .version import __version__
 
 
-@click.group()
+class LazyGroup(click.Group):
+    """
+    Group whose subcommands are only imported when they are invoked, so the
+    group (including its help and version) can be used without importing the
+    modules of every command and their dependencies.
+    """
+    def __init__(self, *args, **kwargs):
+        """
+        :param lazy_subcommands: dict mapping the name of each subcommand to
+        the import path of the command (ie. 'package.module.attribute').
+        """
+        self.lazy_subcommands = kwargs.pop('lazy_subcommands', {})
+        super(LazyGroup, self).__init__(*args, **kwargs)
+
+    def list_commands(self, ctx):
+        return sorted(set(super(LazyGroup, self).list_commands(ctx)) | set(self.lazy_subcommands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_subcommands and cmd_name not in self.commands:
+            module_name, attr_name = self.lazy_subcommands[cmd_name].rsplit('.', 1)
+            self.add_command(getattr(import_module(module_name), attr_name), cmd_name)
+        return super(LazyGroup, self).get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        # List the subcommands without importing them.
+        rows = []
+        for cmd_name in self.list_commands(ctx):
+            cmd = self.commands.get(cmd_name)
+            rows.append((cmd_name, (cmd.short_help if cmd else None) or ''))
+        if rows:
+            with formatter.section('Commands'):
+                formatter.write_dl(rows)
+
+    def invoke(self, ctx):
+        try:
+            return super(LazyGroup, self).invoke(ctx)
+        except Exception as e:
+            if not is_authentication_error(e):
+                raise
+            click.echo("Authentication failed")
+            ctx.exit(1)
+
+    def shell_complete(self, ctx, incomplete):
+        # Complete the subcommand names without importing them (click >= 8,
+        # older versions never call this method).
+        try:
+            from click.shell_completion import CompletionItem
+        except ImportError:
+            return []
+
+        results = [CompletionItem(cmd_name) for cmd_name in self.list_commands(ctx)
+                   if cmd_name.startswith(incomplete)]
+        results.extend(click.Command.shell_complete(self, ctx, incomplete))
+        return results
+
+
+def is_authentication_error(exception):
+    """
+    Return whether `exception` was raised because the API token is missing or
+    not valid, without importing the API client for any other exception.
+    """
+    exceptions = sys.modules.get('loadimpact3.exceptions')
+    return exceptions is not None and isinstance(exception, (exceptions.UnauthorizedError,
+                                                             exceptions.MissingApiTokenError))
+
+
+@click.group(cls=LazyGroup, lazy_subcommands={
+    'data-store': 'loadimpactcli.datastore_commands.data_store',
+    'metric': 'loadimpactcli.metric_commands.metric',
+    'organization': 'loadimpactcli.organization_commands.organization',
+    'sync': 'loadimpactcli.sync_commands.sync',
+    'test': 'loadimpactcli.test_commands.test',
+    'user-scenario': 'loadimpactcli.userscenario_commands.userscenario',
+})
 @click.pass_context
 @click.version_option(version=__version__)
-def cli(ctx):
-    pass
+@click.option('--no-cache', is_flag=True, default=False, help='Do not use the local cache of API responses.')
+@click.option('--refresh', is_flag=True, default=False,
+              help='Ignore the local cache of API responses, updating it with fresh responses.')
+def cli(ctx, no_cache, refresh):
+    from .client import response_cache
+
+    response_cache.enabled = not no_cache
+    response_cache.refresh = refresh
 
 
 def run_cli():
-    cli.add_command(userscenario)
-    cli.add_command(organization)
-    cli.add_command(data_store)
-    cli.add_command(test)
-    cli.add_command(metric)
     cli()
 
 if __name__ == '__main__':
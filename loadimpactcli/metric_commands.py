@@ -14,13 +14,24 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import fnmatch
+import json
+import re
+import sys
+from itertools import islice
 from operator import attrgetter
 
 import click
 
 from loadimpact3.exceptions import ConnectionError
 from .client import client
-from .util import Metric
+from .errors import CLIError, MissingDependencyError
+from .export import EXPORT_FORMATS, export_series
+from .output import format_line, format_value
+from .results import fetch_all_series, list_metric_names
+from .stats import STATS, series_stats
+from .store import open_store
+from .util import ColumnFormatter, DefaultMetricType, Metric
 
 # TestRunResults type codes.
 TEXT_TO_TYPE_CODE_MAP = {
@@ -47,18 +58,226 @@ def metric(ctx):
 @click.argument('test_run_id')
 @click.option('--type', '-t', 'metric_types', multiple=True, type=click.Choice(TEXT_TO_TYPE_CODE_MAP.keys()),
               help='Metric type to include on the list.')
-def list_metrics(test_run_id, metric_types):
+@click.option('--match', 'patterns', multiple=True,
+              help='Only list the metrics whose name matches this glob pattern (eg. "__li_url_*:1:*"). Can be '
+                   'given several times.')
+@click.option('--regex', is_flag=True, default=False,
+              help='Interpret the --match patterns as regular expressions, searched anywhere in the name.')
+@click.option('--limit', type=click.IntRange(1, None), help='Maximum number of metrics to list.')
+@click.option('--sort', is_flag=True, default=False,
+              help='Sort the metrics by type and name. By default they are listed as returned by the API.')
+def list_metrics(test_run_id, metric_types, patterns, regex, limit, sort):
+    try:
+        match = build_matcher(patterns, regex)
+    except re.error as e:
+        raise click.BadParameter(u'invalid regular expression: {0}'.format(e), param_hint='--match')
+
     try:
         types = ','.join(str(TEXT_TO_TYPE_CODE_MAP[k]) for k in metric_types)
         result_ids = client.list_test_run_result_ids(test_run_id, data={'types': types})
+        if sort:
+            result_ids = sorted(result_ids, key=attrgetter('type'))
 
         click.echo('NAME:\tARGUMENT NAME:\tTYPE:')
-        for result_id in sorted(result_ids, key=attrgetter('type')):
-            for key, _ in sorted(result_id.ids.items()):
-                metric_ = Metric.from_raw(key)
+        # The names are filtered before being parsed, and printed as they are found.
+        for key, result_id in islice(iter_metric_ids(result_ids, match, sort), limit):
+            metric_ = Metric.from_raw(key)
+
+            click.echo(u'{0}\t{1}\t{2}'.format(key,
+                                               metric_.str_param(),
+                                               result_id.results_type_code_to_text(result_id.type)))
+    except ConnectionError:
+        click.echo("Cannot connect to Load impact API")
+
+
+@metric.command('export', short_help='Export the results of a test run.')
+@click.argument('test_run_id')
+@click.option('--metric', 'standard_metrics', multiple=True,
+              help='Name of the standard metric to export (implies aggregated world load zone).',
+              type=click.Choice([m.name.lower() for m in list(DefaultMetricType)]))
+@click.option('--raw_metric', 'raw_metrics', multiple=True, help='Raw name of the metric to export.')
+@click.option('--type', '-t', 'metric_types', multiple=True, type=click.Choice(TEXT_TO_TYPE_CODE_MAP.keys()),
+              help='Metric type to export, when no metrics are given. All the metrics are exported by default.')
+@click.option('--format', 'export_format', default='csv', type=click.Choice(sorted(EXPORT_FORMATS)),
+              help='Format of the file: gzipped CSV, Parquet or Arrow (the last two require pyarrow).')
+@click.option('--file_name', help='Full path of the file to export the results to.')
+@click.option('--concurrency', default=8, type=click.IntRange(1, None),
+              help='Maximum number of metrics fetched simultaneously.')
+@click.option('--store', is_flag=True, default=False, help='Also save the results to the local results database.')
+@click.option('--test_id', help='Id of the test of the test run, saved to the local results database.')
+def export_metrics(test_run_id, standard_metrics, raw_metrics, metric_types, export_format, file_name,
+                   concurrency, store, test_id):
+    try:
+        names = get_metric_names(test_run_id, standard_metrics, raw_metrics, metric_types)
+        file_path = file_name if file_name else '{0}{1}'.format(test_run_id, EXPORT_FORMATS[export_format])
+        all_series = fetch_all_series(client, test_run_id, names, concurrency)
+        points = export_series(all_series, file_path, export_format)
+        click.echo(u'Exported {0} points of {1} metrics to {2}'.format(points, len(names), file_path))
+
+        if store:
+            with open_store() as store_:
+                store_.save_test_run(test_run_id, test_id=test_id)
+                store_.save_series(test_run_id, all_series)
+            click.echo(u'Saved {0} points to the local results database'.format(points))
+    except ConnectionError:
+        click.echo("Cannot connect to Load impact API")
+    except CLIError as e:
+        click.echo(str(e))
+        sys.exit(1)
+
+
+@metric.command('stats', short_help='Summary statistics of the metrics of a test run.')
+@click.argument('test_run_id')
+@click.option('--metric', 'standard_metrics', multiple=True,
+              help='Name of the standard metric to summarize (implies aggregated world load zone).',
+              type=click.Choice([m.name.lower() for m in list(DefaultMetricType)]))
+@click.option('--raw_metric', 'raw_metrics', multiple=True, help='Raw name of the metric to summarize.')
+@click.option('--type', '-t', 'metric_types', multiple=True, type=click.Choice(TEXT_TO_TYPE_CODE_MAP.keys()),
+              help='Metric type to summarize, when no metrics are given. All the metrics are summarized by default.')
+@click.option('--output', 'output_format', default='table', type=click.Choice(['table', 'json', 'csv']),
+              help='Output format.')
+@click.option('--full_width', 'full_width', is_flag=True, help='Display the full contents of each column.')
+@click.option('--concurrency', default=8, type=click.IntRange(1, None),
+              help='Maximum number of metrics fetched simultaneously.')
+def metric_stats(test_run_id, standard_metrics, raw_metrics, metric_types, output_format, full_width, concurrency):
+    try:
+        names = get_metric_names(test_run_id, standard_metrics, raw_metrics, metric_types)
+        all_series = fetch_all_series(client, test_run_id, names, concurrency)
+        # Metrics that are not numeric have no statistics.
+        all_stats = [(name, series_stats(series) or dict.fromkeys(STATS)) for name, series in all_series.items()]
 
-                click.echo(u'{0}\t{1}\t{2}'.format(key,
-                                                   metric_.str_param(),
-                                                   result_id.results_type_code_to_text(result_id.type)))
+        if output_format == 'json':
+            click.echo(json.dumps([dict(stats, metric=name) for name, stats in all_stats], sort_keys=True))
+        elif output_format == 'csv':
+            click.echo(format_line(['metric'] + list(STATS), ','), nl=False)
+            for name, stats in all_stats:
+                click.echo(format_line([name] + [format_value(stats[s]) for s in STATS], ','), nl=False)
+        else:
+            formatter = get_stats_formatter(full_width)
+            click.echo(formatter.format(*(['METRIC:'] + ['{0}:'.format(s.upper()) for s in STATS])))
+            for name, stats in all_stats:
+                click.echo(formatter.format(name, *[pprint_stat(stats[s]) for s in STATS]))
     except ConnectionError:
         click.echo("Cannot connect to Load impact API")
+    except MissingDependencyError as e:
+        click.echo(str(e))
+        sys.exit(1)
+
+
+@metric.command('query', short_help='Statistics of the results in the local results database.')
+@click.option('--test_id', help='Id of the test whose last test runs are queried.')
+@click.option('--test_run_id', 'test_run_ids', multiple=True, help='Id of a test run to query.')
+@click.option('--last', 'last_runs', default=30, type=click.IntRange(1, None),
+              help='Number of test runs to query, most recent first, when no --test_run_id is given.')
+@click.option('--metric', 'standard_metrics', multiple=True,
+              help='Name of the standard metric to query (implies aggregated world load zone).',
+              type=click.Choice([m.name.lower() for m in list(DefaultMetricType)]))
+@click.option('--raw_metric', 'raw_metrics', multiple=True,
+              help='Raw name of the metric to query. All the stored metrics are queried by default.')
+@click.option('--stat', 'stat_names', multiple=True, type=click.Choice(STATS),
+              help='Statistic to display. All the statistics are displayed by default.')
+@click.option('--output', 'output_format', default='table', type=click.Choice(['table', 'json', 'csv']),
+              help='Output format.')
+@click.option('--full_width', 'full_width', is_flag=True, help='Display the full contents of each column.')
+def query_metrics(test_id, test_run_ids, last_runs, standard_metrics, raw_metrics, stat_names, output_format,
+                  full_width):
+    stat_names = [s for s in STATS if s in stat_names] or list(STATS)
+    names = [Metric.from_raw(m).str_raw(True) for m in standard_metrics + raw_metrics]
+    try:
+        with open_store() as store:
+            if not test_run_ids:
+                test_run_ids = (store.last_test_run_ids(test_id, last_runs) if test_id else
+                                store.test_run_ids()[:last_runs])
+
+            rows = []
+            for test_run_id in test_run_ids:
+                for name in names or store.metric_names(test_run_id):
+                    stats = series_stats(store.load_series(test_run_id, name)) or dict.fromkeys(STATS)
+                    rows.append((int(test_run_id), name, [stats[s] for s in stat_names]))
+
+        if output_format == 'json':
+            click.echo(json.dumps([dict(zip(stat_names, values), test_run_id=test_run_id, metric=name)
+                                   for test_run_id, name, values in rows], sort_keys=True))
+        elif output_format == 'csv':
+            click.echo(format_line(['test_run_id', 'metric'] + stat_names, ','), nl=False)
+            for test_run_id, name, values in rows:
+                click.echo(format_line([str(test_run_id), name] + [format_value(v) for v in values], ','), nl=False)
+        else:
+            formatter = get_query_formatter(full_width, stat_names)
+            click.echo(formatter.format(*(['TEST RUN:', 'METRIC:'] + ['{0}:'.format(s.upper()) for s in stat_names])))
+            for test_run_id, name, values in rows:
+                click.echo(formatter.format(test_run_id, name, *[pprint_stat(v) for v in values]))
+    except CLIError as e:
+        click.echo(str(e))
+        sys.exit(1)
+
+
+def get_stats_formatter(full_width):
+    """
+    Returns a `ColumnFormatter` with sensible values for the column widths for
+    the `metric stats` command.
+    """
+    if full_width:
+        return ColumnFormatter([0] * (len(STATS) + 1), '\t')
+    return ColumnFormatter([48] + [12] * len(STATS), ' ')
+
+
+def get_query_formatter(full_width, stat_names):
+    """
+    Returns a `ColumnFormatter` with sensible values for the column widths for
+    the `metric query` command.
+    """
+    if full_width:
+        return ColumnFormatter([0] * (len(stat_names) + 2), '\t')
+    return ColumnFormatter([10, 48] + [12] * len(stat_names), ' ')
+
+
+def pprint_stat(value):
+    if value is None:
+        return u'-'
+    if isinstance(value, float):
+        return u'{0:.6g}'.format(value)
+    return u'{0}'.format(value)
+
+
+def build_matcher(patterns, regex=False):
+    """
+    Return a function telling whether a metric name matches any of the glob
+    (or, if `regex` is True, regular expression) `patterns`, or None if there
+    are no patterns. The patterns are compiled into a single expression.
+
+    :raise re.error: if a regular expression is not valid.
+    """
+    if not patterns:
+        return None
+    if regex:
+        return re.compile(u'|'.join(u'(?:{0})'.format(p) for p in patterns)).search
+    return re.compile(u'|'.join(u'(?:{0})'.format(fnmatch.translate(p)) for p in patterns)).match
+
+
+def iter_metric_ids(result_ids, match=None, sort=False):
+    """
+    Yield tuples with the name of each metric of `result_ids` that satisfies
+    `match` (if not None) and its result id, sorted by name within each
+    result id if `sort` is True.
+    """
+    for result_id in result_ids:
+        keys = result_id.ids
+        if match is not None:
+            keys = [key for key in keys if match(key)]
+        if sort:
+            keys = sorted(keys)
+        for key in keys:
+            yield key, result_id
+
+
+def get_metric_names(test_run_id, standard_metrics, raw_metrics, metric_types):
+    """
+    Return the raw names of the metrics given as `standard_metrics` and
+    `raw_metrics` or, if there are none, of all the metrics of the test run
+    of the `metric_types`.
+    """
+    if standard_metrics or raw_metrics:
+        return [Metric.from_raw(m).str_raw(True) for m in standard_metrics + raw_metrics]
+    types = ','.join(str(TEXT_TO_TYPE_CODE_MAP[k]) for k in metric_types)
+    return list_metric_names(client, test_run_id, types)
@@ -0,0 +1,131 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+from abc import ABCMeta, abstractmethod
+
+import six
+
+
+@six.add_metaclass(ABCMeta)
+class ResultWriter(object):
+    """
+    Base class for the machine-readable writers of the results of a test
+    run. The results are written in long format: one record per point, with
+    the raw metric name, the timestamp of the point and its unformatted
+    value, so no metric loses the timestamp of its points.
+
+    The records of each frame of results (dict of raw metric name to the
+    list of its new `TestRunMetricPoint`s, as streamed by `ResultStreamer`
+    with `all_points`) are written at once, and the file is only flushed
+    after each frame if `flush` is True (eg. for interactive output).
+    """
+    def __init__(self, file_object, metrics, flush=False):
+        """
+        :param file_object: text file the records are written to.
+        :param metrics: list of `Metric`s, in the order their points are
+        written within each frame.
+        :param flush: if True, flush the file after writing each frame.
+        """
+        self.file_object = file_object
+        self.names = [m.str_raw(True) for m in metrics]
+        self.flush = flush
+
+    def write_header(self):
+        pass
+
+    def write(self, data):
+        """
+        Write a record for each point in the frame `data`.
+        """
+        records = [self.format_record(name, point.timestamp, point.value)
+                   for name in self.names if name in data for point in data[name]]
+        if not records:
+            return
+        self.file_object.write(u''.join(records))
+        if self.flush:
+            self.file_object.flush()
+
+    @abstractmethod
+    def format_record(self, name, timestamp, value):
+        """
+        Return the text of the record of a point, including the line break.
+        """
+
+
+class NDJSONWriter(ResultWriter):
+    """
+    Writes one JSON object per line, with the `metric` name, the ISO 8601
+    `timestamp` and the `value` of a point.
+    """
+    def format_record(self, name, timestamp, value):
+        record = {'metric': name, 'timestamp': timestamp.isoformat(), 'value': value}
+        return u'{0}\n'.format(json.dumps(record, sort_keys=True))
+
+
+class DelimitedWriter(ResultWriter):
+    """
+    Writes a header and one line per point, with the fields separated by
+    `delimiter` and quoted only when needed.
+    """
+    delimiter = None
+
+    def write_header(self):
+        self.file_object.write(format_line([u'metric', u'timestamp', u'value'], self.delimiter))
+
+    def format_record(self, name, timestamp, value):
+        return format_line([name, timestamp.isoformat(), format_value(value)], self.delimiter)
+
+
+class CSVWriter(DelimitedWriter):
+    delimiter = ','
+
+
+class TSVWriter(DelimitedWriter):
+    delimiter = '\t'
+
+
+RESULT_WRITERS = {
+    'ndjson': NDJSONWriter,
+    'csv': CSVWriter,
+    'tsv': TSVWriter,
+}
+
+
+def format_line(fields, delimiter):
+    """
+    Return a line with the text `fields` separated by `delimiter`, quoting
+    (as in CSV) only the fields that need it.
+    """
+    return u'{0}\n'.format(delimiter.join(quote_field(f, delimiter) for f in fields))
+
+
+def quote_field(field, delimiter):
+    if any(c in field for c in (delimiter, '"', '\r', '\n')):
+        return u'"{0}"'.format(field.replace('"', '""'))
+    return field
+
+
+def format_value(value):
+    """
+    Return `value` as text without losing precision (`str()` rounds floats
+    on Python 2), or an empty string if it is None.
+    """
+    if value is None:
+        return u''
+    if isinstance(value, float):
+        return six.text_type(repr(value))
+    return six.text_type(value)
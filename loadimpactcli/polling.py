@@ -0,0 +1,76 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import random
+import time
+
+from .errors import PollTimeoutError
+
+INITIAL_INTERVAL = 1
+MAX_INTERVAL = 15
+BACKOFF_FACTOR = 2
+JITTER = 0.2
+
+# Exit code of the commands giving up waiting for an operation, as used by
+# the `timeout` utility.
+TIMEOUT_EXIT_CODE = 124
+
+
+def backoff_intervals(initial_interval=INITIAL_INTERVAL, max_interval=MAX_INTERVAL, factor=BACKOFF_FACTOR,
+                      jitter=JITTER):
+    """
+    Yield the (endless) sequence of seconds to wait between polls: starting at
+    `initial_interval`, multiplied by `factor` after each poll and capped at
+    `max_interval`.
+
+    Each interval is shortened by a random fraction of up to `jitter`, so
+    several clients polling at the capped interval do not stay in lockstep.
+    """
+    interval = min(initial_interval, max_interval)
+    while True:
+        yield interval * (1 - jitter * random.random())
+        interval = min(interval * factor, max_interval)
+
+
+def poll(check, timeout=None, initial_interval=INITIAL_INTERVAL, max_interval=MAX_INTERVAL,
+         factor=BACKOFF_FACTOR, jitter=JITTER, sleep=time.sleep, clock=time.time):
+    """
+    Call `check` until it returns a true value, and return that value.
+
+    `check` is called right away, and then after each of the intervals given
+    by `backoff_intervals()`. There is no wait once `check` succeeds.
+
+    :param check: callable without arguments.
+    :param timeout: maximum number of seconds to wait, or None to wait
+    forever. `check` is always called one last time when the deadline is
+    reached.
+    :raises PollTimeoutError: if `check` did not succeed before the deadline.
+    """
+    deadline = clock() + timeout if timeout is not None else None
+    intervals = backoff_intervals(initial_interval, max_interval, factor, jitter)
+
+    while True:
+        result = check()
+        if result:
+            return result
+
+        interval = next(intervals)
+        if deadline is not None:
+            remaining = deadline - clock()
+            if remaining <= 0:
+                raise PollTimeoutError('Timed out after {0} seconds'.format(timeout))
+            interval = min(interval, remaining)
+        sleep(interval)
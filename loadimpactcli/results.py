@@ -0,0 +1,84 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from .util import concurrent_map
+
+# Time series of a metric: parallel lists with the timestamps (in
+# microseconds since the epoch, as returned by the API) and the values.
+Series = namedtuple('Series', ['timestamps', 'values'])
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def list_metric_names(client, test_run_id, types=''):
+    """
+    Return the sorted raw names of the metrics of a test run.
+
+    :param types: comma separated result type codes to include, or an empty
+    string for all the types.
+    """
+    result_ids = client.list_test_run_result_ids(test_run_id, data={'types': types})
+    return sorted(name for result_id in result_ids for name in result_id.ids)
+
+
+def fetch_series(client, test_run_id, name):
+    """
+    Return the whole `Series` of the metric with raw name `name`.
+
+    The points are requested from the offset of the last point received
+    onwards until no new points are returned, so series longer than a
+    single response are retrieved in several pages.
+    """
+    timestamps = []
+    values = []
+    offset = -1
+    while True:
+        results = client.list_test_run_results(test_run_id, {'ids': '{0}|{1}'.format(name, offset)})
+        result = next((r for r in results if r.sid == name), None)
+        if result is None or result.offset <= offset or not result.data:
+            break
+        offset = result.offset
+
+        last_timestamp = timestamps[-1] if timestamps else None
+        for point in result.data:
+            timestamp = point['timestamp']
+            if last_timestamp is not None and timestamp <= last_timestamp:
+                # Already received in a previous page.
+                continue
+            timestamps.append(timestamp)
+            values.append(next(iter(point['data'].values()), None))
+
+    return Series(timestamps, values)
+
+
+def fetch_all_series(client, test_run_id, names, concurrency):
+    """
+    Return an `OrderedDict` mapping each of the raw metric `names` to its
+    `Series`, fetching up to `concurrency` metrics simultaneously.
+    """
+    series = concurrent_map(lambda name: fetch_series(client, test_run_id, name), names, concurrency)
+    return OrderedDict(zip(names, series))
+
+
+def timestamp_to_datetime(timestamp):
+    """
+    Return the naive UTC `datetime` of an API `timestamp` (in microseconds
+    since the epoch).
+    """
+    return EPOCH + timedelta(microseconds=timestamp)
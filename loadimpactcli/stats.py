@@ -0,0 +1,170 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import math
+from collections import OrderedDict
+
+from .errors import MissingDependencyError
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Names of the statistics returned by `series_stats()`, in display order.
+STATS = ('count', 'min', 'mean', 'stddev', 'twa') + tuple('p{0}'.format(p) for p in PERCENTILES) + ('max',)
+
+
+def import_numpy():
+    """
+    Return the `numpy` module, which is an optional dependency.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise MissingDependencyError("Computing statistics requires numpy, install it with "
+                                     "'pip install loadimpact-cli[stats]'")
+    return numpy
+
+
+def series_arrays(series):
+    """
+    Return a tuple with the timestamps (in seconds) and the values of the
+    numeric points of `series` as numpy arrays, or None if the metric is not
+    numeric.
+    """
+    np = import_numpy()
+    try:
+        # Missing values (None) are converted to NaN.
+        values = np.array(series.values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    timestamps = np.array(series.timestamps, dtype=np.float64) / 10 ** 6
+
+    valid = ~np.isnan(values)
+    return timestamps[valid], values[valid]
+
+
+def series_stats(series):
+    """
+    Return an `OrderedDict` with the statistics of `STATS` for a `Series`, or
+    None if the metric is not numeric.
+
+    The time-weighted average (`twa`) weighs each value by the time until the
+    next point, so it is not biased by points being reported more often at
+    some moments of the test (the last value, having no duration, is only
+    used when the series has a single point). The standard deviation is the
+    population one.
+    """
+    np = import_numpy()
+    arrays = series_arrays(series)
+    if arrays is None:
+        return None
+    timestamps, values = arrays
+
+    stats = OrderedDict((name, None) for name in STATS)
+    stats['count'] = len(values)
+    if not len(values):
+        return stats
+
+    stats['min'] = float(values.min())
+    stats['max'] = float(values.max())
+    stats['mean'] = float(values.mean())
+    stats['stddev'] = float(values.std())
+    for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        stats['p{0}'.format(p)] = float(value)
+
+    durations = np.diff(timestamps)
+    if len(values) > 1 and durations.sum() > 0:
+        stats['twa'] = float(np.dot(values[:-1], durations) / durations.sum())
+    else:
+        stats['twa'] = stats['mean']
+    return stats
+
+
+def series_origin(all_series):
+    """
+    Return the timestamp (in seconds) of the first point of any of the
+    `Series` in `all_series`, used as the start of a test run when aligning
+    it with another one, or None if there are no points.
+    """
+    firsts = [series.timestamps[0] for series in all_series if series.timestamps]
+    return min(firsts) / 10.0 ** 6 if firsts else None
+
+
+def compare_series(series_a, series_b, origin_a, origin_b):
+    """
+    Compare the values of a metric in two test runs, returning an
+    `OrderedDict` with the number of points, mean and 95th percentile in each
+    run, the change of the mean (in percent of the first one) and the p-value
+    of a two-sided Mann-Whitney U test, or None if the metric is not numeric.
+
+    The series are aligned by the time offset from the start of each test run
+    (`origin_a` and `origin_b`, in seconds), and only the points within the
+    duration covered by both series are compared.
+    """
+    np = import_numpy()
+    arrays_a = series_arrays(series_a)
+    arrays_b = series_arrays(series_b)
+    if arrays_a is None or arrays_b is None:
+        return None
+    offsets_a, values_a = arrays_a[0] - (origin_a or 0), arrays_a[1]
+    offsets_b, values_b = arrays_b[0] - (origin_b or 0), arrays_b[1]
+
+    if len(values_a) and len(values_b):
+        end = min(offsets_a.max(), offsets_b.max())
+        values_a = values_a[offsets_a <= end]
+        values_b = values_b[offsets_b <= end]
+
+    result = OrderedDict([('count_a', len(values_a)), ('count_b', len(values_b)), ('mean_a', None),
+                          ('mean_b', None), ('change', None), ('p95_a', None), ('p95_b', None), ('p_value', None)])
+    if not len(values_a) or not len(values_b):
+        return result
+
+    result['mean_a'] = float(values_a.mean())
+    result['mean_b'] = float(values_b.mean())
+    if result['mean_a']:
+        result['change'] = 100.0 * (result['mean_b'] - result['mean_a']) / abs(result['mean_a'])
+    result['p95_a'] = float(np.percentile(values_a, 95))
+    result['p95_b'] = float(np.percentile(values_b, 95))
+    result['p_value'] = mann_whitney_u(values_a, values_b)[1]
+    return result
+
+
+def mann_whitney_u(values_a, values_b):
+    """
+    Two-sided Mann-Whitney U test of the samples `values_a` and `values_b`
+    (numpy arrays), using the normal approximation with tie and continuity
+    corrections. Return a tuple with the U statistic of `values_a` and the
+    p-value.
+    """
+    np = import_numpy()
+    n_a, n_b = len(values_a), len(values_b)
+    n = n_a + n_b
+    values = np.concatenate([values_a, values_b])
+
+    # Rank the values, giving tied values the average of their ranks.
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    average_ranks = np.cumsum(counts) - (counts - 1) / 2.0
+    ranks = average_ranks[inverse.ravel()]
+
+    u = float(ranks[:n_a].sum() - n_a * (n_a + 1) / 2.0)
+    mean = n_a * n_b / 2.0
+    tie_correction = float((counts ** 3 - counts).sum()) / (n * (n - 1)) if n > 1 else 0.0
+    variance = n_a * n_b / 12.0 * ((n + 1) - tie_correction)
+    if variance <= 0:
+        # All the values are equal.
+        return u, 1.0
+
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+    return u, min(1.0, math.erfc(max(z, 0) / math.sqrt(2)))
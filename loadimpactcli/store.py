@@ -0,0 +1,204 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import errno
+import os
+import sqlite3
+from functools import wraps
+
+from six import raise_from
+
+from .config import get_results_db_path
+from .errors import CLIError
+from .results import Series
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS test_runs (
+    id INTEGER PRIMARY KEY,
+    test_id INTEGER,
+    queued TEXT,
+    status INTEGER
+);
+CREATE INDEX IF NOT EXISTS test_runs_test_id ON test_runs (test_id, id);
+CREATE TABLE IF NOT EXISTS points (
+    test_run_id INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    value,
+    PRIMARY KEY (test_run_id, metric, timestamp)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sync_marks (
+    project_id INTEGER PRIMARY KEY,
+    test_run_id INTEGER NOT NULL
+);
+'''
+
+
+def database_errors(method):
+    """
+    Decorator of the `ResultStore` methods, raising a `CLIError` for the
+    errors of the database (eg. when it is locked, or a value can not be
+    stored).
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except (sqlite3.Error, OverflowError) as ex:
+            raise_from(CLIError("Error using the results database {0}: {1}".format(self.path, ex)), ex)
+    return wrapper
+
+
+def open_store():
+    """
+    Return the `ResultStore` of the local results database, whose path can be
+    set with the `results_db` setting.
+    """
+    return ResultStore(get_results_db_path())
+
+
+class ResultStore(object):
+    """
+    Local SQLite database of the results of test runs, so they can be
+    queried again without downloading them.
+
+    The points of each metric are indexed by test run, metric (raw name) and
+    timestamp, so reading the series of a metric of a test run is a range
+    scan. The test runs are indexed by test, to find the last runs of a test.
+    """
+    def __init__(self, path):
+        """
+        :param path: path of the database file. It (and its directory) is
+        created when first used.
+        """
+        self.path = path
+        self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            try:
+                if directory:
+                    os.makedirs(directory)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise_from(CLIError("Unable to create directory {0}".format(directory)), ex)
+            try:
+                self._connection = sqlite3.connect(self.path, timeout=30)
+                self._connection.executescript(SCHEMA)
+            except sqlite3.Error as ex:
+                raise_from(CLIError("Unable to open the results database {0}: {1}".format(self.path, ex)), ex)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @database_errors
+    def save_test_run(self, test_run_id, test_id=None, queued=None, status=None):
+        """
+        Add a test run, or update the fields given (not None) of a stored one.
+        """
+        with self.connection as connection:
+            connection.execute('INSERT OR IGNORE INTO test_runs (id) VALUES (?)', (int(test_run_id),))
+            connection.execute('UPDATE test_runs SET test_id = COALESCE(?, test_id), '
+                               'queued = COALESCE(?, queued), status = COALESCE(?, status) WHERE id = ?',
+                               (None if test_id is None else int(test_id),
+                                None if queued is None else str(queued), status, int(test_run_id)))
+
+    @database_errors
+    def save_series(self, test_run_id, all_series):
+        """
+        Store the `Series` of each metric in `all_series` (dict of raw metric
+        name to `Series`), replacing any stored points with the same
+        timestamps. Returns the number of points stored.
+        """
+        test_run_id = int(test_run_id)
+        points = 0
+        with self.connection as connection:
+            connection.execute('INSERT OR IGNORE INTO test_runs (id) VALUES (?)', (test_run_id,))
+            for name, series in all_series.items():
+                connection.executemany('INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?)',
+                                       ((test_run_id, name, timestamp, value)
+                                        for timestamp, value in zip(series.timestamps, series.values)))
+                points += len(series.timestamps)
+        return points
+
+    @database_errors
+    def load_series(self, test_run_id, name):
+        """
+        Return the stored `Series` of the metric with raw name `name`.
+        """
+        rows = self.connection.execute('SELECT timestamp, value FROM points WHERE test_run_id = ? AND metric = ? '
+                                       'ORDER BY timestamp', (int(test_run_id), name)).fetchall()
+        return Series([row[0] for row in rows], [row[1] for row in rows])
+
+    @database_errors
+    def metric_names(self, test_run_id):
+        """
+        Return the sorted raw names of the metrics stored for a test run.
+        """
+        rows = self.connection.execute('SELECT DISTINCT metric FROM points WHERE test_run_id = ? ORDER BY metric',
+                                       (int(test_run_id),))
+        return [row[0] for row in rows]
+
+    @database_errors
+    def last_test_run_ids(self, test_id, limit):
+        """
+        Return the ids of the last (up to `limit`) stored test runs of a test,
+        most recent first.
+        """
+        rows = self.connection.execute('SELECT id FROM test_runs WHERE test_id = ? ORDER BY id DESC LIMIT ?',
+                                       (int(test_id), limit))
+        return [row[0] for row in rows]
+
+    @database_errors
+    def test_run_ids(self):
+        """
+        Return the ids of all the stored test runs, most recent first.
+        """
+        return [row[0] for row in self.connection.execute('SELECT id FROM test_runs ORDER BY id DESC')]
+
+    @database_errors
+    def test_run_statuses(self):
+        """
+        Return a dict mapping the ids of the stored test runs to their status
+        (None if unknown).
+        """
+        return dict(self.connection.execute('SELECT id, status FROM test_runs'))
+
+    @database_errors
+    def get_sync_mark(self, project_id):
+        """
+        Return the id of the last test run of a project saved by `sync`, or
+        None if the project has never been synced.
+        """
+        row = self.connection.execute('SELECT test_run_id FROM sync_marks WHERE project_id = ?',
+                                      (int(project_id),)).fetchone()
+        return row[0] if row else None
+
+    @database_errors
+    def set_sync_mark(self, project_id, test_run_id):
+        with self.connection as connection:
+            connection.execute('INSERT OR REPLACE INTO sync_marks VALUES (?, ?)', (int(project_id), int(test_run_id)))
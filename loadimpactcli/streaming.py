@@ -0,0 +1,191 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import sys
+import threading
+from collections import deque
+
+from loadimpact3.exceptions import ApiError
+from loadimpact3.resources import TestRunMetricPoint
+from six import reraise
+
+from .polling import MAX_INTERVAL, backoff_intervals
+
+DEFAULT_POLL_RATE = 3
+# Maximum number of frames waiting to be rendered.
+MAX_PENDING_FRAMES = 10
+# Number of polls without new results to make once the test run is done, as
+# the last results may be available slightly after the test run finishes.
+POST_POLLS = 2
+
+
+class FrameQueue(object):
+    """
+    Queue of result frames (dicts of metric name to `TestRunMetricPoint`, or
+    to lists of them) passed from the fetching thread to the rendering
+    thread.
+
+    Putting a frame never blocks: if the queue holds `maxsize` frames, the
+    frame is merged into the most recent pending one (keeping the latest
+    point of each metric), so a slow consumer skips intermediate frames
+    instead of slowing down the fetching. If `maxsize` is None, the queue is
+    unbounded and frames are never merged.
+    """
+    def __init__(self, maxsize=MAX_PENDING_FRAMES):
+        self.maxsize = maxsize
+        self.coalesced = 0
+        self._frames = deque()
+        self._closed = False
+        self._exc_info = None
+        self._cond = threading.Condition()
+
+    def put(self, frame):
+        with self._cond:
+            if self.maxsize is not None and len(self._frames) >= self.maxsize:
+                self._frames[-1].update(frame)
+                self.coalesced += 1
+            else:
+                self._frames.append(dict(frame))
+            self._cond.notify()
+
+    def close(self, exc_info=None):
+        """
+        Mark the end of the frames, optionally with the `sys.exc_info()` of
+        an error to be raised in the consumer.
+        """
+        with self._cond:
+            self._closed = True
+            self._exc_info = exc_info
+            self._cond.notify()
+
+    def __iter__(self):
+        while True:
+            with self._cond:
+                while not self._frames and not self._closed:
+                    # Wait with a timeout, so the consumer can be interrupted.
+                    self._cond.wait(1)
+                if self._frames:
+                    frame = self._frames.popleft()
+                elif self._exc_info:
+                    reraise(*self._exc_info)
+                else:
+                    return
+            yield frame
+
+
+class ResultStreamer(object):
+    """
+    Stream the results of a test run, fetching them in a background thread
+    so rendering them (eg. to a slow terminal or pipe) never delays the
+    polling of the API.
+
+    The results are polled every `poll_rate` seconds while new results keep
+    arriving. When a poll returns no new results, the interval backs off (up
+    to `max_interval` seconds) until new results arrive. The status of the
+    test run is only requested when there are no new results, so most polls
+    make a single request.
+
+    Iterating the streamer starts the polling and yields dicts mapping the
+    metric names to their latest `TestRunMetricPoint`, until the test run is
+    done. Frames are skipped if the consumer falls behind, which suits
+    displaying the results. With `all_points`, the frames map the metric
+    names to the lists of all their new points instead, and are never
+    skipped, so no results are lost (eg. when writing them to a file).
+    """
+    def __init__(self, client, test_run, result_ids, poll_rate=DEFAULT_POLL_RATE, max_interval=None,
+                 raise_api_errors=False, max_pending=MAX_PENDING_FRAMES, all_points=False):
+        self.client = client
+        self.test_run = test_run
+        self.result_ids = result_ids
+        self.poll_rate = poll_rate
+        self.max_interval = max(poll_rate, MAX_INTERVAL) if max_interval is None else max_interval
+        self.raise_api_errors = raise_api_errors
+        self.all_points = all_points
+        self.frames = FrameQueue(None if all_points else max_pending)
+        self._offsets = dict((rid, -1) for rid in result_ids)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __iter__(self):
+        self.start()
+        try:
+            for frame in self.frames:
+                yield frame
+        finally:
+            self.stop()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def fetch(self):
+        """
+        Request the results newer than the last ones fetched, returning a
+        (possibly empty) frame with the latest point of each metric, or with
+        the list of all the new points of each metric if `all_points`.
+        """
+        ids = ','.join('{0}|{1}'.format(rid, self._offsets[rid]) for rid in self.result_ids)
+        try:
+            results = self.client.list_test_run_results(self.test_run.id, {'ids': ids})
+        except ApiError:
+            if self.raise_api_errors:
+                raise
+            return {}
+
+        frame = {}
+        for result in results:
+            if result.sid in self._offsets and result.offset > self._offsets[result.sid] and result.data:
+                if self.all_points:
+                    frame[result.sid] = [TestRunMetricPoint(None, **point) for point in result.data]
+                else:
+                    frame[result.sid] = TestRunMetricPoint(None, **result.data[-1])
+                self._offsets[result.sid] = result.offset
+        return frame
+
+    def _run(self):
+        try:
+            self._poll()
+            self.frames.close()
+        except Exception:
+            self.frames.close(sys.exc_info())
+
+    def _poll(self):
+        intervals = self._intervals()
+        post_polls = None
+        while True:
+            frame = self.fetch()
+            if frame:
+                self.frames.put(frame)
+                intervals = self._intervals()
+            elif post_polls is None and self.test_run.is_done(raise_api_errors=self.raise_api_errors):
+                post_polls = POST_POLLS
+                intervals = self._intervals()
+
+            if post_polls is not None:
+                if post_polls <= 0:
+                    return
+                post_polls -= 1
+
+            if self._stopped.wait(next(intervals)):
+                return
+
+    def _intervals(self):
+        return backoff_intervals(self.poll_rate, self.max_interval, jitter=0)
@@ -0,0 +1,113 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import sys
+from collections import OrderedDict
+
+import click
+
+from loadimpact3.exceptions import ApiError, ConnectionError
+from loadimpact3.resources import TestRun
+from .client import client
+from .errors import CLIError
+from .results import fetch_series
+from .store import open_store
+from .test_commands import get_metrics, list_project_ids
+from .util import DefaultMetricType, concurrent_map
+
+# Statuses of the test runs that are done, whose results can be saved.
+DONE_STATUSES = [TestRun.STATUS_FINISHED, TestRun.STATUS_TIMED_OUT, TestRun.STATUS_ABORTED_USER,
+                 TestRun.STATUS_ABORTED_SYSTEM, TestRun.STATUS_ABORTED_SCRIPT_ERROR,
+                 TestRun.STATUS_ABORTED_THRESHOLD, TestRun.STATUS_FAILED_THRESHOLD]
+
+
+@click.command('sync', short_help='Save the results of new test runs to the local results database.')
+@click.option('--project_id', 'project_ids', multiple=True,
+              help='Id of the project to sync. All the projects are synced by default.')
+@click.option('--metric', 'standard_metrics', multiple=True,
+              help='Name of the standard metric to save (implies aggregated world load zone).',
+              type=click.Choice([m.name.lower() for m in list(DefaultMetricType)]))
+@click.option('--raw_metric', 'raw_metrics', multiple=True, help='Raw name of the metric to save.')
+@click.option('--concurrency', default=8, type=click.IntRange(1, None),
+              help='Maximum number of simultaneous requests.')
+def sync(project_ids, standard_metrics, raw_metrics, concurrency):
+    names = [m.str_raw(True) for m in get_metrics(standard_metrics, raw_metrics)]
+    errors = False
+    try:
+        project_ids = list(project_ids) or list_project_ids(concurrency)
+        with open_store() as store:
+            for project_id in project_ids:
+                try:
+                    saved, pending = sync_project(store, project_id, names, concurrency)
+                except ApiError as e:
+                    errors = True
+                    click.echo(u"Project {0} could not be synced: {1}".format(project_id, e))
+                    continue
+                click.echo(u"Project {0}: {1} new test run(s) saved{2}".format(
+                    project_id, saved, u', {0} still running'.format(pending) if pending else u''))
+    except ConnectionError:
+        click.echo("Cannot connect to Load impact API")
+        sys.exit(1)
+    except CLIError as e:
+        click.echo(str(e))
+        sys.exit(1)
+
+    if errors:
+        sys.exit(1)
+
+
+def sync_project(store, project_id, names, concurrency):
+    """
+    Save the results of the metrics with raw names `names` of the test runs
+    of a project that are newer than its sync mark (the last test run saved
+    by a previous sync), and advance the mark.
+
+    Only the tests whose last run (`last_test_run_id`) is newer than the mark
+    can have new test runs, and all their test runs newer than the mark are
+    listed, so runs made between two syncs are not missed. Test runs that are
+    not done yet are skipped, and the mark is kept below them so they are
+    saved by a later sync.
+
+    :return: a tuple with the number of test runs saved and still running.
+    """
+    mark = store.get_sync_mark(project_id) or 0
+    tests = [t for t in client.list_tests(project_id=project_id) if t.last_test_run_id and t.last_test_run_id > mark]
+    test_runs = concurrent_map(lambda t: [r for r in client.list_test_runs(t.id) if r.id > mark],
+                               tests, concurrency)
+    test_runs = [(t, r) for t, runs in zip(tests, test_runs) for r in runs]
+
+    # Test runs already saved (eg. by an interrupted sync) are not fetched again.
+    statuses = store.test_run_statuses()
+    saved = [r.id for _, r in test_runs if statuses.get(r.id) in DONE_STATUSES]
+    done = [(t, r) for t, r in test_runs if r.status in DONE_STATUSES and r.id not in saved]
+    pending = [r.id for _, r in test_runs if r.status not in DONE_STATUSES]
+
+    # Fetch the metrics of all the test runs with bounded concurrency, saving
+    # each test run as soon as all of its metrics have been fetched.
+    pairs = [(r.id, name) for _, r in done for name in names]
+    all_series = concurrent_map(lambda pair: fetch_series(client, *pair), pairs, concurrency)
+    for test_, test_run in done:
+        series = OrderedDict((name, next(all_series)) for name in names)
+        # The status is saved last, marking the test run as completely saved.
+        store.save_series(test_run.id, series)
+        store.save_test_run(test_run.id, test_id=test_.id, queued=test_run.queued, status=test_run.status)
+
+    new_mark = max([mark] + saved + [r.id for _, r in done])
+    if pending:
+        new_mark = max(mark, min(new_mark, min(pending) - 1))
+    if new_mark != mark:
+        store.set_sync_mark(project_id, new_mark)
+    return len(done), len(pending)
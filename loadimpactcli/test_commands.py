@@ -14,15 +14,31 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from operator import attrgetter, methodcaller
+import io
+import os
+from operator import methodcaller
 
 import click
 import sys
+from six.moves import zip
 
 from loadimpact3.resources import TestRun
-from loadimpact3.exceptions import ConnectionError
+from loadimpact3.exceptions import ApiError, ConnectionError
 from .client import client
-from .util import TestRunStatus, Metric, DefaultMetricType, ColumnFormatter
+from .errors import CLIError, MissingDependencyError
+from .output import RESULT_WRITERS
+from .polling import poll
+from .results import fetch_all_series, fetch_series
+from .stats import compare_series, series_origin
+from .store import open_store
+from .streaming import DEFAULT_POLL_RATE, ResultStreamer
+from .util import (TestRunStatus, Metric, DefaultMetricType, ColumnFormatter, concurrent_map,
+                   concurrent_unordered, top_n)
+
+# Statuses of the test runs that make the `run` commands exit with an error,
+# from most to least severe. The status itself is used as the exit code.
+FAILED_STATUSES = [TestRun.STATUS_ABORTED_SCRIPT_ERROR, TestRun.STATUS_ABORTED_SYSTEM,
+                   TestRun.STATUS_ABORTED_THRESHOLD, TestRun.STATUS_FAILED_THRESHOLD]
 
 
 @click.group()
@@ -35,31 +51,23 @@ def test(ctx):
 @click.option('--project_id', 'project_ids', multiple=True, help='Id of the project to list tests from.')
 @click.option('--limit', 'display_limit', default=20, help='Maximum number of tests to display.')
 @click.option('--full_width', 'full_width', is_flag=True, help='Display the full contents of each column.')
-def list_tests(project_ids, display_limit, full_width):
+@click.option('--concurrency', default=8, type=click.IntRange(1, None),
+              help='Maximum number of concurrent requests to the API.')
+def list_tests(project_ids, display_limit, full_width, concurrency):
     try:
-        if not project_ids:
-            # If no project_id is specified, retrieve all projects the user has access to.
-            orgs = client.list_organizations()
-            projs = []
-            for org in orgs:
-                projs.extend(client.list_organization_projects(org_id=org.id))
-            project_ids = [proj.id for proj in projs]
-
-        tests = []
-        for id_ in set(project_ids):
-            tests.extend(client.list_tests(project_id=id_))
+        # Select the tests to display, sorted by descending test_run ID, and
+        # limit the list according to the display_limit argument.
+        displayed_tests, tests_count = top_n(iter_tests(project_ids, concurrency), display_limit,
+                                             key=lambda t: t.last_test_run_id or 0)
 
         # Output formatting.
-        formatter = get_list_tests_formatter(full_width, tests)
+        formatter = get_list_tests_formatter(full_width, displayed_tests)
         click.echo(formatter.format('ID:', 'NAME:', 'LAST RUN DATE:', 'LAST RUN STATUS:', 'CONFIG:'))
 
-        # Display the tests sorted by descending test_run ID, and limit the
-        # list according to the display_limit argument.
-        tests = sorted(tests, key=attrgetter('last_test_run_id'), reverse=True)
-        for test_ in tests[:display_limit]:
+        last_runs = concurrent_map(get_last_test_run, displayed_tests, concurrency)
+        for test_, last_run in zip(displayed_tests, last_runs):
             last_run_date = last_run_status = '-'
-            if test_.last_test_run_id:
-                last_run = client.get_test_run(test_.last_test_run_id)
+            if last_run:
                 last_run_date = last_run.queued
                 last_run_status_text = last_run.status_text if full_width else '{:22}'.format(last_run.status_text)
                 last_run_status = click.style(last_run_status_text, fg=TestRunStatus(last_run.status).style.value)
@@ -67,9 +75,9 @@ def list_tests(project_ids, display_limit, full_width):
             click.echo(formatter.format(test_.id, test_.name, last_run_date, last_run_status,
                                         summarize_config(test_.config)))
 
-        if len(tests) > display_limit:
+        if tests_count > display_limit:
             click.echo("Only the first {0} tests (out of {1}) are displayed. This behaviour can be"
-                       "changed using the --limit argument.".format(display_limit, len(tests)))
+                       "changed using the --limit argument.".format(display_limit, tests_count))
     except ConnectionError:
         click.echo("Cannot connect to Load impact API")
 
@@ -84,45 +92,369 @@ def list_tests(project_ids, display_limit, full_width):
               type=click.Choice([m.name.lower() for m in list(DefaultMetricType)]))
 @click.option('--raw_metric', 'raw_metrics', multiple=True, help='Raw name of the metric to stream.')
 @click.option('--full_width', 'full_width', is_flag=True, help='Display the full contents of each column.')
-def run_test(test_id, no_ignore_errors, quiet, standard_metrics, raw_metrics, full_width):
+@click.option('--poll_rate', default=DEFAULT_POLL_RATE, type=click.IntRange(1, None),
+              help='Number of seconds between requests for new results. The interval grows while no new '
+                   'results are available.')
+@click.option('--output', 'output_format', default='table', type=click.Choice(['table'] + sorted(RESULT_WRITERS)),
+              help='Format of the streamed metrics. Other formats than table are meant for machines: the values '
+                   'are neither padded nor truncated, and the other messages are printed to stderr.')
+@click.option('--output_file', default='-', type=click.File('w', encoding='utf-8'),
+              help='File to write the streamed metrics to, when using an --output other than table. Defaults to '
+                   'stdout.')
+@click.option('--flush', is_flag=True, default=False,
+              help='Flush the --output_file after each frame of results, eg. when it is read while being written. '
+                   'Always done when writing to a terminal.')
+@click.option('--store', is_flag=True, default=False,
+              help='Save the full results of the metrics to the local results database once the test run is done.')
+def run_test(test_id, no_ignore_errors, quiet, standard_metrics, raw_metrics, full_width, poll_rate, output_format,
+             output_file, flush, store):
+    # Keep stdout for the metrics when it is read by a machine.
+    err = output_format != 'table'
     try:
         test_ = client.get_test(test_id)
         test_run = test_.start_test_run()
-        click.echo('TEST_RUN_ID:\n{0}'.format(test_run.id))
+        click.echo('TEST_RUN_ID:\n{0}'.format(test_run.id), err=err)
 
         try:
-            if not quiet:
-                # Prepare metrics.
-                metrics = sorted([Metric.from_raw(m) for m in standard_metrics + raw_metrics],
-                                 key=methodcaller('str_raw', True))
-                if not metrics:
-                    metrics = [Metric(DefaultMetricType.CLIENTS_ACTIVE, ['1']),
-                               Metric(DefaultMetricType.REQUESTS_PER_SECOND, ['1']),
-                               Metric(DefaultMetricType.BANDWIDTH, ['1']),
-                               Metric(DefaultMetricType.USER_LOAD_TIME, ['1']),
-                               Metric(DefaultMetricType.FAILURE_RATE, ['1'])]
+            # Prepare metrics.
+            metrics = get_metrics(standard_metrics, raw_metrics)
 
+            if not quiet:
                 # Output formatting.
                 formatter = get_run_test_formatter(full_width, metrics)
 
-                stream = test_run.result_stream([m.str_raw(True) for m in metrics], raise_api_errors=no_ignore_errors)
-                click.echo('Initializing test ...')
-
-                for i, data in enumerate(stream(poll_rate=3)):
-                    if i % 20 == 0:
-                        click.echo(pprint_header(formatter, metrics))
-                    click.echo(pprint_row(formatter, data, metrics))
-
-            if test_run.status in [TestRun.STATUS_ABORTED_SYSTEM, TestRun.STATUS_ABORTED_SCRIPT_ERROR,
-                                   TestRun.STATUS_FAILED_THRESHOLD, TestRun.STATUS_ABORTED_THRESHOLD]:
+                # Results are fetched in the background, so slow output does not delay polling. Only the
+                # table skips results when the output falls behind.
+                stream = ResultStreamer(client, test_run, [m.str_raw(True) for m in metrics], poll_rate=poll_rate,
+                                        raise_api_errors=no_ignore_errors, all_points=output_format != 'table')
+                click.echo('Initializing test ...', err=err)
+
+                if output_format == 'table':
+                    for i, data in enumerate(stream):
+                        if i % 20 == 0:
+                            click.echo(pprint_header(formatter, metrics))
+                        click.echo(pprint_row(formatter, data, metrics))
+                else:
+                    flush = flush or output_file.isatty()
+                    writer = RESULT_WRITERS[output_format](output_file, metrics, flush=flush)
+                    writer.write_header()
+                    for data in stream:
+                        writer.write(data)
+
+            if store:
+                if quiet:
+                    poll(lambda: test_run.is_done(raise_api_errors=no_ignore_errors), initial_interval=poll_rate)
+                try:
+                    store_results(test_id, test_run, metrics)
+                    click.echo('Results saved to the local results database', err=err)
+                except CLIError as e:
+                    click.echo(str(e), err=err)
+                    sys.exit(1)
+
+            if test_run.status in FAILED_STATUSES:
                 sys.exit(test_run.status)  # We return status as exit code
         except KeyboardInterrupt:
-            click.echo("Aborting test run!")
+            click.echo("Aborting test run!", err=err)
+            test_run.abort()
+
+    except ConnectionError:
+        click.echo("Cannot connect to Load impact API", err=err)
+        sys.exit(1)
+
+
+@test.command('run-many', short_help='Run several tests concurrently.')
+@click.argument('test_ids', nargs=-1)
+@click.option('--file', 'ids_file', type=click.File('r'),
+              help='File with the ids of the tests to run, one per line. Empty lines and lines starting '
+                   'with "#" are ignored.')
+@click.option('--output_dir', default='.', type=click.Path(file_okay=False),
+              help='Directory to write the results of each test run to.')
+@click.option('--no-ignore-errors', is_flag=True, default=False,
+              help='Fail on any errors returned by API while streaming results.')
+@click.option('--metric', 'standard_metrics', multiple=True,
+              help='Name of the standard metric to stream (implies aggregated world load zone).',
+              type=click.Choice([m.name.lower() for m in list(DefaultMetricType)]))
+@click.option('--raw_metric', 'raw_metrics', multiple=True, help='Raw name of the metric to stream.')
+@click.option('--output', 'output_format', default='tsv', type=click.Choice(sorted(RESULT_WRITERS)),
+              help='Format of the files the results are written to.')
+@click.option('--poll_rate', default=DEFAULT_POLL_RATE, type=click.IntRange(1, None),
+              help='Number of seconds between requests for new results. The interval grows while no new '
+                   'results are available.')
+@click.option('--concurrency', default=8, type=click.IntRange(1, None),
+              help='Maximum number of test runs started simultaneously.')
+def run_many_tests(test_ids, ids_file, output_dir, no_ignore_errors, standard_metrics, raw_metrics, output_format,
+                   poll_rate, concurrency):
+    test_ids = list(test_ids) + (read_test_ids(ids_file) if ids_file else [])
+    if not test_ids:
+        return click.echo('You need to provide the ids of the tests to run.')
+
+    metrics = get_metrics(standard_metrics, raw_metrics)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    # Start all the test runs before streaming the results of any of them.
+    test_runs = []
+    errors = False
+    for test_id, test_run, error in concurrent_map(start_test_run, test_ids, concurrency):
+        if error:
+            errors = True
+            click.echo(u"Test {0} could not be started: {1}".format(test_id, error))
+        else:
+            test_runs.append((test_id, test_run))
+            click.echo(u"Test {0} started, TEST_RUN_ID: {1}".format(test_id, test_run.id))
+
+    def stream_results(item):
+        test_id, test_run = item
+        file_path = os.path.join(output_dir, 'test-{0}-run-{1}.{2}'.format(test_id, test_run.id, output_format))
+        try:
+            write_results(test_run, metrics, file_path, RESULT_WRITERS[output_format], no_ignore_errors, poll_rate)
+            return test_id, test_run, file_path, None
+        except ApiError as e:
+            return test_id, test_run, file_path, e
+
+    try:
+        # Every test run is streamed while it runs, as the streams only
+        # return the latest results. The connection pool of the client caps
+        # the simultaneous requests.
+        for test_id, test_run, file_path, error in concurrent_unordered(stream_results, test_runs,
+                                                                        len(test_runs)):
+            if error:
+                errors = True
+                click.echo(u"Results of test run {0} (test {1}) could not be retrieved: {2}".format(
+                    test_run.id, test_id, error))
+            else:
+                click.echo(u"Test run {0} (test {1}) finished with status '{2}', results written to {3}".format(
+                    test_run.id, test_id, test_run.status_text, file_path))
+    except KeyboardInterrupt:
+        click.echo("Aborting test runs!")
+        for _, test_run in test_runs:
             test_run.abort()
+        errors = True
+
+    sys.exit(get_exit_code([test_run.status for _, test_run in test_runs], errors))
+
+
+@test.command('compare', short_help='Compare the metrics of two test runs.')
+@click.argument('test_run_a')
+@click.argument('test_run_b')
+@click.option('--metric', 'standard_metrics', multiple=True,
+              help='Name of the standard metric to compare (implies aggregated world load zone).',
+              type=click.Choice([m.name.lower() for m in list(DefaultMetricType)]))
+@click.option('--raw_metric', 'raw_metrics', multiple=True, help='Raw name of the metric to compare.')
+@click.option('--threshold', 'thresholds', multiple=True, callback=lambda ctx, param, value: parse_thresholds(value),
+              help='Maximum change of the mean of a metric from the first to the second test run, as '
+                   'METRIC=PERCENT (eg. user_load_time=10). A negative PERCENT is the maximum decrease '
+                   '(eg. requests_per_second=-5). The metric is compared even if not given with --metric.')
+@click.option('--alpha', default=0.05, type=float, callback=lambda ctx, param, value: check_alpha(value),
+              help='Significance level: changes past a threshold are only regressions if the p-value of '
+                   'the Mann-Whitney U test is lower.')
+@click.option('--full_width', 'full_width', is_flag=True, help='Display the full contents of each column.')
+@click.option('--concurrency', default=8, type=click.IntRange(1, None),
+              help='Maximum number of metrics fetched simultaneously.')
+def compare_test_runs(test_run_a, test_run_b, standard_metrics, raw_metrics, thresholds, alpha, full_width,
+                      concurrency):
+    names = [m.str_raw(True) for m in get_metrics(standard_metrics, raw_metrics)]
+    names += [name for name, _ in thresholds if name not in names]
+    max_changes = dict(thresholds)
 
+    try:
+        # Fetch the metrics of both test runs at once.
+        pairs = [(test_run_id, name) for test_run_id in (test_run_a, test_run_b) for name in names]
+        all_series = list(concurrent_map(lambda pair: fetch_series(client, *pair), pairs, concurrency))
+        series_a, series_b = all_series[:len(names)], all_series[len(names):]
+        origin_a, origin_b = series_origin(series_a), series_origin(series_b)
+
+        formatter = get_compare_formatter(full_width)
+        click.echo(formatter.format('METRIC:', 'MEAN A:', 'MEAN B:', 'CHANGE:', 'P95 A:', 'P95 B:', 'P-VALUE:',
+                                    'RESULT:'))
+        regressions = 0
+        for name, a, b in zip(names, series_a, series_b):
+            comparison = compare_series(a, b, origin_a, origin_b)
+            if comparison is None:
+                click.echo(formatter.format(name, *(['-'] * 7)))
+                continue
+
+            result = '-'
+            if name in max_changes:
+                if is_regression(comparison, max_changes[name], alpha):
+                    result = 'regression'
+                    regressions += 1
+                else:
+                    result = 'ok'
+            click.echo(formatter.format(name, pprint_value(comparison['mean_a']),
+                                        pprint_value(comparison['mean_b']),
+                                        pprint_change(comparison['change']),
+                                        pprint_value(comparison['p95_a']),
+                                        pprint_value(comparison['p95_b']),
+                                        pprint_value(comparison['p_value']),
+                                        result))
     except ConnectionError:
         click.echo("Cannot connect to Load impact API")
         sys.exit(1)
+    except MissingDependencyError as e:
+        click.echo(str(e))
+        sys.exit(1)
+
+    if regressions:
+        click.echo(u'{0} metric(s) regressed past their threshold'.format(regressions))
+        sys.exit(TestRunStatus.STATUS_FAILED_THRESHOLD.value)
+
+
+def parse_thresholds(values):
+    """
+    Return a list of tuples with the raw metric name and the maximum change
+    (in percent) of each of the METRIC=PERCENT threshold `values`.
+    """
+    thresholds = []
+    for value in values:
+        name, _, percent = value.rpartition('=')
+        try:
+            if not name:
+                raise ValueError
+            thresholds.append((Metric.from_raw(name).str_raw(True), float(percent)))
+        except ValueError:
+            raise click.BadParameter(u"'{0}' is not METRIC=PERCENT".format(value))
+    return thresholds
+
+
+def check_alpha(value):
+    """
+    Return the significance level `value`, which must be between 0 and 1.
+    """
+    if not 0 <= value <= 1:
+        raise click.BadParameter(u'{0} is not between 0 and 1'.format(value))
+    return value
+
+
+def is_regression(comparison, max_change, alpha):
+    """
+    Return whether the change of the mean in `comparison` (as returned by
+    `compare_series()`) exceeds `max_change` percent (or is below it, if it is
+    negative) and is significant at the `alpha` level.
+    """
+    change, p_value = comparison['change'], comparison['p_value']
+    if change is None or p_value is None or p_value >= alpha:
+        return False
+    return change < max_change if max_change < 0 else change > max_change
+
+
+def get_metrics(standard_metrics, raw_metrics):
+    """
+    Return the `Metric`s to stream, sorted by raw name, or the default
+    metrics if no metrics are given.
+    """
+    metrics = sorted([Metric.from_raw(m) for m in standard_metrics + raw_metrics],
+                     key=methodcaller('str_raw', True))
+    if not metrics:
+        metrics = [Metric(DefaultMetricType.CLIENTS_ACTIVE, ['1']),
+                   Metric(DefaultMetricType.REQUESTS_PER_SECOND, ['1']),
+                   Metric(DefaultMetricType.BANDWIDTH, ['1']),
+                   Metric(DefaultMetricType.USER_LOAD_TIME, ['1']),
+                   Metric(DefaultMetricType.FAILURE_RATE, ['1'])]
+    return metrics
+
+
+def read_test_ids(ids_file):
+    """
+    Return the test ids listed in `ids_file`, one per line, skipping empty
+    lines and comments.
+    """
+    with ids_file as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def start_test_run(test_id):
+    """
+    Start a run of the test with id `test_id`, returning a tuple with the test
+    id, the `TestRun` and the `ApiError` raised if it could not be started.
+    """
+    try:
+        return test_id, client.get_test(test_id).start_test_run(), None
+    except ApiError as e:
+        return test_id, None, e
+
+
+def write_results(test_run, metrics, file_path, writer_class, raise_api_errors, poll_rate=DEFAULT_POLL_RATE):
+    """
+    Stream the results of `test_run` for `metrics` until it finishes, writing
+    them to `file_path` using a `ResultWriter` of class `writer_class`.
+    """
+    stream = ResultStreamer(client, test_run, [m.str_raw(True) for m in metrics], poll_rate=poll_rate,
+                            raise_api_errors=raise_api_errors, all_points=True)
+    with io.open(file_path, 'w', encoding='utf-8') as f:
+        writer = writer_class(f, metrics)
+        writer.write_header()
+        for data in stream:
+            writer.write(data)
+
+
+def store_results(test_id, test_run, metrics):
+    """
+    Save the whole series of `metrics` of the finished `test_run` of the test
+    with id `test_id` to the local results database.
+    """
+    all_series = fetch_all_series(client, test_run.id, [m.str_raw(True) for m in metrics], len(metrics))
+    with open_store() as store:
+        store.save_series(test_run.id, all_series)
+        store.save_test_run(test_run.id, test_id=test_id, queued=getattr(test_run, 'queued', None),
+                            status=test_run.status)
+
+
+def get_exit_code(statuses, errors=False):
+    """
+    Return the exit code for a set of test runs with `statuses`: 1 if
+    `errors` is True (some test could not be run to completion), otherwise
+    the most severe of the `FAILED_STATUSES` among `statuses`, or 0 if none
+    of them failed.
+    """
+    if errors:
+        return 1
+    for status in FAILED_STATUSES:
+        if status in statuses:
+            return status
+    return 0
+
+
+def iter_tests(project_ids, concurrency):
+    """
+    Yield the tests of the projects with id in `project_ids`, or of all the
+    projects the user has access to if no project ids are given.
+
+    The organizations, projects and tests are retrieved using up to
+    `concurrency` simultaneous requests, and the tests of each project are
+    yielded as soon as they are available.
+    """
+    if not project_ids:
+        # If no project_id is specified, retrieve all projects the user has access to.
+        project_ids = list_project_ids(concurrency)
+
+    project_tests = concurrent_unordered(lambda id_: client.list_tests(project_id=id_),
+                                         set(project_ids), concurrency)
+    for tests in project_tests:
+        for test_ in tests:
+            yield test_
+
+
+def list_project_ids(concurrency):
+    """
+    Return the ids of all the projects the user has access to, retrieving
+    the projects of up to `concurrency` organizations simultaneously.
+    """
+    orgs = client.list_organizations()
+    org_projects = concurrent_unordered(lambda org: client.list_organization_projects(org_id=org.id),
+                                        orgs, concurrency)
+    return [proj.id for projs in org_projects for proj in projs]
+
+
+def get_last_test_run(test_):
+    """
+    Return the last `TestRun` of `test_`, or None if the test has never been
+    run.
+    """
+    if test_.last_test_run_id:
+        return client.get_test_run(test_.last_test_run_id)
+    return None
 
 
 def get_list_tests_formatter(full_width, tests):
@@ -134,7 +466,7 @@ def get_list_tests_formatter(full_width, tests):
         return ColumnFormatter([0] * 5, '\t')
     else:
         # Setup the formatter using sensible column widths for each field.
-        column_widths = (max(len('ID:'), max([len(str(t.id)) for t in tests])),
+        column_widths = (max([len('ID:')] + [len(str(t.id)) for t in tests]),
                          32,  # width for test name (arbitrary)
                          25,  # last run date (YYYY-MM-DD HH:mm:ss+ZZ:zz)
                          22,  # len('Aborted (by threshold)')
@@ -185,6 +517,28 @@ def pprint_row(formatter, data, returned_metrics):
     return formatter.format(*parts)
 
 
+def get_compare_formatter(full_width):
+    """
+    Returns a `ColumnFormatter` with sensible values for the column widths for
+    the `test compare` command.
+    """
+    if full_width:
+        return ColumnFormatter([0] * 8, '\t')
+    return ColumnFormatter([48, 12, 12, 10, 12, 12, 12, 10], ' ')
+
+
+def pprint_value(value):
+    if value is None:
+        return u'-'
+    return u'{0:.6g}'.format(value)
+
+
+def pprint_change(change):
+    if change is None:
+        return u'-'
+    return u'{0:+.1f}%'.format(change)
+
+
 def summarize_config(config):
     try:
         str_schedules = [u'{0} users {1}s'.format(schedule[u'users'], schedule[u'duration'])
@@ -0,0 +1,153 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hashlib
+import os
+import stat
+import uuid
+import zlib
+
+import six
+
+BUFFER_SIZE = 64 * 1024
+
+
+class MultipartStream(object):
+    """
+    File-like object producing a `multipart/form-data` body with some form
+    `fields` and a single file, reading (and optionally compressing) the file
+    in small chunks as the body is consumed. This allows uploading files of
+    any size using a bounded amount of memory.
+
+    The length of the body is known in advance (and available as the `len`
+    attribute, as expected by `requests`) unless the file is compressed or is
+    not a regular file, in which case `requests` sends the body using chunked
+    transfer encoding.
+    """
+    def __init__(self, fields, file_field, file_object, file_name=None, compress=False, progress=None):
+        """
+        :param fields: dict with the (non file) form fields.
+        :param file_field: name of the form field for the file.
+        :param file_object: file object, opened in binary mode.
+        :param file_name: name of the file sent to the server. Defaults to
+        the base name of `file_object.name`.
+        :param compress: if True, the file is compressed with gzip and sent
+        with a `.gz` suffix and an `application/gzip` content type.
+        :param progress: optional callable, called with the number of bytes
+        of the file read each time a chunk is read.
+        """
+        self.boundary = uuid.uuid4().hex
+        self.file_object = file_object
+        self.compress = compress
+        self.progress = progress
+
+        file_name = file_name or os.path.basename(getattr(file_object, 'name', 'file'))
+        file_content_type = 'application/octet-stream'
+        if compress:
+            file_name = u'{0}.gz'.format(file_name)
+            file_content_type = 'application/gzip'
+
+        parts = []
+        for name, value in sorted(fields.items()):
+            parts.append(u'--{0}\r\nContent-Disposition: form-data; name="{1}"\r\n\r\n{2}\r\n'.format(
+                self.boundary, name, value))
+        parts.append(u'--{0}\r\nContent-Disposition: form-data; name="{1}"; filename="{2}"\r\n'
+                     u'Content-Type: {3}\r\n\r\n'.format(self.boundary, file_field, file_name, file_content_type))
+        self._preamble = u''.join(parts).encode('utf-8')
+        self._epilogue = u'\r\n--{0}--\r\n'.format(self.boundary).encode('utf-8')
+
+        self.file_size = get_file_size(file_object)
+        if not compress and self.file_size is not None:
+            self.len = len(self._preamble) + self.file_size + len(self._epilogue)
+
+        self._chunks = self._iter_chunks()
+        self._buffer = b''
+
+    @property
+    def content_type(self):
+        return 'multipart/form-data; boundary={0}'.format(self.boundary)
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield chunk
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _iter_chunks(self):
+        yield self._preamble
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if self.compress else None
+        while True:
+            data = self.file_object.read(BUFFER_SIZE)
+            if not data:
+                break
+            if isinstance(data, six.text_type):
+                data = data.encode('utf-8')
+            if self.progress:
+                self.progress(len(data))
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+        if compressor:
+            yield compressor.flush()
+
+        yield self._epilogue
+
+
+def get_file_size(file_object):
+    """
+    Return the number of bytes left to be read from `file_object`, or None if
+    it is unknown (ie. it is not a regular file).
+    """
+    try:
+        file_stat = os.fstat(file_object.fileno())
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+        return file_stat.st_size - file_object.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+
+
+def hash_file(file_object, algorithm='sha256', buffer_size=1024 * 1024):
+    """
+    Return the hex digest of the contents left to be read from `file_object`,
+    reading it in chunks of `buffer_size` bytes and then rewinding it to its
+    initial position, or None if it is not a regular file (eg. a pipe, which
+    could not be read again).
+    """
+    if get_file_size(file_object) is None:
+        return None
+    position = file_object.tell()
+    digest = hashlib.new(algorithm)
+    while True:
+        chunk = file_object.read(buffer_size)
+        if not chunk:
+            break
+        digest.update(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+    file_object.seek(position)
+    return digest.hexdigest()
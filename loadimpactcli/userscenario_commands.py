@@ -15,14 +15,27 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from time import sleep
+import hashlib
+import io
+import json
+import os
+import sys
+
 import click
 from tzlocal import get_localzone
 
-from loadimpact3.exceptions import ConnectionError
+from loadimpact3 import DataStore
+from loadimpact3.exceptions import ApiError, ConnectionError
 
 from .client import client
-from .config import DEFAULT_PROJECT
+from .config import SCENARIO_HASHES_PATH, get_default_project
+from .datastore_commands import wait_for_conversions
+from .errors import CLIError, PollTimeoutError
+from .polling import MAX_INTERVAL, TIMEOUT_EXIT_CODE, poll
+from .util import concurrent_map, concurrent_unordered, read_json_file, write_json_file
+
+# Default name of the manifest of `user-scenario sync`, in the synced directory.
+MANIFEST_NAME = 'scenarios.json'
 
 
 @click.group(name='user-scenario')
@@ -42,7 +55,7 @@ def get_scenario(id):
 
 
 @userscenario.command('list', short_help='List user-scenarios.')
-@click.option('--project_id', default=DEFAULT_PROJECT, envvar='DEFAULT_PROJECT', help='Id of the project to list scenarios from.')
+@click.option('--project_id', default=get_default_project, envvar='DEFAULT_PROJECT', help='Id of the project to list scenarios from.')
 def list_scenarios(project_id):
     if not project_id:
         return click.echo('You need to provide a project id.')
@@ -58,10 +71,18 @@ def list_scenarios(project_id):
 @userscenario.command('create', short_help='Create user-scenario.')
 @click.argument('script_file', type=click.File('r'))
 @click.argument('name')
-@click.option('--project_id', default=DEFAULT_PROJECT, envvar='DEFAULT_PROJECT', help='Id of the project the scenario should be in.')
-@click.option('--datastore_file', type=click.File('r'), multiple=True, help='A CSV file to be used as a new data store for the user scenario. The file is read from line 1 expecting comma (,) as a separator and double quotes (") as a delimiter and the name of the file is used as a name for the data store. Multiple files can be provided by repeating the option.')
+@click.option('--project_id', default=get_default_project, envvar='DEFAULT_PROJECT', help='Id of the project the scenario should be in.')
+@click.option('--datastore_file', type=click.File('rb'), multiple=True, help='A CSV file to be used as a new data store for the user scenario. The file is read from line 1 expecting comma (,) as a separator and double quotes (") as a delimiter and the name of the file is used as a name for the data store. Multiple files can be provided by repeating the option.')
 @click.option('--datastore_id', type=int, multiple=True, help='The ID of an existing data store to be linked to the user scenario. Multiple IDs can be provided by repeating the option.')
-def create_scenario(script_file, name, project_id, datastore_file, datastore_id):
+@click.option('--concurrency', default=4, type=click.IntRange(1, None),
+              help='Maximum number of data store files uploaded simultaneously.')
+@click.option('--timeout', default=None, type=click.IntRange(1, None),
+              help='Maximum number of seconds to wait for the conversion of the data stores to finish. Waits forever '
+                   'by default.')
+@click.option('--poll_interval', default=MAX_INTERVAL, type=click.IntRange(1, None),
+              help='Maximum number of seconds between checks of the conversion status.')
+def create_scenario(script_file, name, project_id, datastore_file, datastore_id, concurrency, timeout,
+                    poll_interval):
     if not project_id:
         return click.echo('You need to provide a project id.')
     script = read_file(script_file)
@@ -73,19 +94,24 @@ def create_scenario(script_file, name, project_id, datastore_file, datastore_id)
     data_store_ids = []
 
     if datastore_file:
-        for data_store_file in datastore_file:
-            data_store_json = {
-                'name': data_store_file.name,
-                'project_id': project_id,
-                'delimiter': 'double',
-                'separator': 'comma',
-                'fromline': 1,
-            }
-            try:
-                data_store = client.create_data_store(data_store_json, data_store_file)
-                data_store_ids.append(data_store.id)
-            except ConnectionError:
-                click.echo("Cannot connect to Load impact API")
+        # The user scenario is only created once all its data stores are ready.
+        try:
+            data_stores = create_data_stores(datastore_file, project_id, concurrency)
+            wait_for_conversions(data_stores, timeout=timeout, max_interval=poll_interval, concurrency=concurrency)
+        except ConnectionError:
+            click.echo("Cannot connect to Load impact API")
+            sys.exit(1)
+        except PollTimeoutError as e:
+            click.echo("Data store conversion did not finish: {0}".format(e))
+            sys.exit(TIMEOUT_EXIT_CODE)
+
+        failed = [data_store for data_store in data_stores if data_store.status != DataStore.STATUS_FINISHED]
+        for data_store in failed:
+            click.echo(u"Data store {0} ({1}) conversion finished with status '{2}'".format(
+                data_store.name, data_store.id, DataStore.status_code_to_text(data_store.status)))
+        if failed:
+            sys.exit(1)
+        data_store_ids = [data_store.id for data_store in data_stores]
 
     data_store_ids += datastore_id
 
@@ -122,14 +148,107 @@ def delete_scenario(scenario_id):
 
 @userscenario.command('validate', short_help='Validate user-scenario script.')
 @click.argument('scenario_id')
-def validate_scenario(scenario_id):
+@click.option('--timeout', default=None, type=click.IntRange(1, None),
+              help='Maximum number of seconds to wait for the validation to finish. Waits forever by default.')
+@click.option('--poll_interval', default=MAX_INTERVAL, type=click.IntRange(1, None),
+              help='Maximum number of seconds between checks of the validation status.')
+def validate_scenario(scenario_id, timeout, poll_interval):
     try:
         user_scenario = client.get_user_scenario(scenario_id)
         validation = get_validation(user_scenario)
-        validation_results = get_validation_results(validation)
-        click.echo(get_formatted_validation_results(validation_results))
+        get_validation_results(validation, timeout=timeout, max_interval=poll_interval,
+                               on_result=lambda result: click.echo(get_formatted_validation_result(result)))
     except ConnectionError:
         click.echo("Cannot connect to Load impact API")
+    except PollTimeoutError as e:
+        click.echo("Validation did not finish: {0}".format(e))
+        sys.exit(TIMEOUT_EXIT_CODE)
+
+
+@userscenario.command('sync', short_help='Update the user-scenarios whose script files changed.')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--manifest', type=click.Path(dir_okay=False),
+              help='JSON file mapping the script files (relative to DIRECTORY) to the ids of their user scenarios, '
+                   'eg. {"checkout.lua": 123}. Defaults to scenarios.json in DIRECTORY.')
+@click.option('--force', is_flag=True, default=False,
+              help='Update all the user scenarios, even if their scripts did not change.')
+@click.option('--dry_run', is_flag=True, default=False, help='Only list the user scenarios that would be updated.')
+@click.option('--concurrency', default=8, type=click.IntRange(1, None),
+              help='Maximum number of user scenarios updated simultaneously.')
+def sync_scenarios(directory, manifest, force, dry_run, concurrency):
+    try:
+        scenarios = read_manifest(manifest or os.path.join(directory, MANIFEST_NAME))
+    except CLIError as e:
+        click.echo(str(e))
+        sys.exit(1)
+
+    # Hashes of the scripts last pushed, assumed to be the remote scripts. The
+    # same ids refer to other user scenarios with another account or API.
+    hashes = read_json_file(SCENARIO_HASHES_PATH, {})
+    changed = []
+    unchanged = errors = 0
+    for file_name, scenario_id in scenarios:
+        try:
+            with io.open(os.path.join(directory, file_name), 'r', encoding='utf-8') as f:
+                script = f.read()
+        except (IOError, OSError) as e:
+            errors += 1
+            click.echo(u"Cannot read {0}: {1}".format(file_name, e))
+            continue
+        script_hash = hash_script(script)
+        if force or hashes.get(client.scoped_key(scenario_id)) != script_hash:
+            changed.append((file_name, scenario_id, script, script_hash))
+        else:
+            unchanged += 1
+
+    if dry_run:
+        for file_name, scenario_id, _, _ in changed:
+            click.echo(u"Would update user scenario {0} from {1}".format(scenario_id, file_name))
+        return
+
+    def push(item):
+        try:
+            update_user_scenario_script(item[1], item[2])
+            return item, None
+        except ApiError as e:
+            return item, e
+
+    updated = 0
+    try:
+        for (file_name, scenario_id, _, script_hash), error in concurrent_unordered(push, changed, concurrency):
+            if error:
+                errors += 1
+                click.echo(u"User scenario {0} could not be updated from {1}: {2}".format(scenario_id, file_name,
+                                                                                          error))
+            else:
+                updated += 1
+                hashes[client.scoped_key(scenario_id)] = script_hash
+                click.echo(u"Updated user scenario {0} from {1}".format(scenario_id, file_name))
+    finally:
+        # Keep the hashes of the scripts pushed, even if interrupted.
+        write_json_file(SCENARIO_HASHES_PATH, hashes)
+
+    click.echo(u"{0} updated, {1} unchanged, {2} failed".format(updated, unchanged, errors))
+    if errors:
+        sys.exit(1)
+
+
+def create_data_stores(data_store_files, project_id, concurrency):
+    """
+    Create a data store from each of the CSV `data_store_files`, uploading up
+    to `concurrency` files simultaneously, and return them in the same order.
+    """
+    def create(data_store_file):
+        data_store_json = {
+            'name': data_store_file.name,
+            'project_id': project_id,
+            'delimiter': 'double',
+            'separator': 'comma',
+            'fromline': 1,
+        }
+        return client.create_data_store(data_store_json, data_store_file)
+
+    return list(concurrent_map(create, data_store_files, concurrency))
 
 
 def delete_user_scenario(scenario_id):
@@ -139,8 +258,33 @@ def delete_user_scenario(scenario_id):
 
 def update_user_scenario_script(scenario_id, script):
     userscenario = client.get_user_scenario(scenario_id)
-    userscenario.update_scenario({'script': script})
-    return client.get_user_scenario(scenario_id)
+    if userscenario.script == script:
+        return userscenario
+    # The response of the update contains the updated user scenario.
+    return userscenario.update_scenario({'script': script})
+
+
+def read_manifest(path):
+    """
+    Return a list of tuples with the script file name and the user scenario
+    id of each entry of the JSON manifest in `path`, sorted by file name.
+    """
+    try:
+        with io.open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (IOError, OSError) as e:
+        raise CLIError(u"Cannot read the manifest {0}: {1}".format(path, e))
+    except ValueError as e:
+        raise CLIError(u"Invalid manifest {0}: {1}".format(path, e))
+
+    if not isinstance(manifest, dict) or not all(isinstance(v, int) for v in manifest.values()):
+        raise CLIError(u"Invalid manifest {0}: expected an object mapping file names to user scenario ids"
+                       .format(path))
+    return sorted(manifest.items())
+
+
+def hash_script(script):
+    return hashlib.sha256(script.encode('utf-8')).hexdigest()
 
 
 def get_validation(user_scenario):
@@ -148,28 +292,56 @@ def get_validation(user_scenario):
     return validation
 
 
-def get_validation_results(validation):
-    poll_rate = 10
+def get_validation_results(validation, timeout=None, max_interval=MAX_INTERVAL, on_result=None):
+    """
+    Wait until `validation` is done and return its results.
+
+    :param timeout: maximum number of seconds to wait, or None to wait
+    forever.
+    :param max_interval: maximum number of seconds between checks of the
+    validation status.
+    :param on_result: optional callable, called with each result as soon as
+    it is available (ie. while the validation is still running).
+    :raises PollTimeoutError: if the validation is not done after `timeout`
+    seconds.
+    """
+    state = {'validation': validation, 'results': []}
+
+    def update_results():
+        results = client.get_user_scenario_validation_result(validation.id)
+        for result in results[len(state['results']):]:
+            on_result(result)
+        state['results'] = results
 
-    while not validation.is_done():
-        validation = client.get_user_scenario_validation(validation.id)
-        sleep(poll_rate)
+    def check():
+        if not state['validation'].is_done():
+            state['validation'] = client.get_user_scenario_validation(validation.id)
+        if on_result:
+            update_results()
+        return state['validation'].is_done()
 
-    validation_results = client.get_user_scenario_validation_result(validation.id)
-    return validation_results
+    poll(check, timeout=timeout, max_interval=max_interval)
+
+    if not on_result:
+        state['results'] = client.get_user_scenario_validation_result(validation.id)
+    return state['results']
 
 
 def get_formatted_validation_results(validation_results):
     formatted_validations = ''
     for result in validation_results:
-        result_in_local_time = get_timestamp_as_local_time(result.timestamp)
-        result_level_formatted = ''
-        if result.level:
-            result_level_formatted = '{0} '.format(result.level)
-        formatted_validations += u"{0}[{1}] {2}\n".format(result_level_formatted, result_in_local_time, result.message)
+        formatted_validations += u"{0}\n".format(get_formatted_validation_result(result))
     return formatted_validations
 
 
+def get_formatted_validation_result(result):
+    result_in_local_time = get_timestamp_as_local_time(result.timestamp)
+    result_level_formatted = ''
+    if result.level:
+        result_level_formatted = '{0} '.format(result.level)
+    return u"{0}[{1}] {2}".format(result_level_formatted, result_in_local_time, result.message)
+
+
 def get_timestamp_as_local_time(timestamp):
     return timestamp.astimezone(get_localzone())
 
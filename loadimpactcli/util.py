@@ -15,10 +15,19 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import sys
+import errno
+import heapq
+import json
+import os
+import time
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
 from click import unstyle
 from enum import Enum
+from six import text_type
+
+from .errors import CLIError
 
 
 class Style(Enum):
@@ -102,8 +111,11 @@ class DefaultMetricType(Enum):
 
 
 class OtherMetricType(object):
+    __slots__ = ('metric_id', '_str_ui')
+
     def __init__(self, metric_id):
         self.metric_id = metric_id
+        self._str_ui = self._build_str_ui()
 
     def str_param(self):
         return '-'
@@ -112,6 +124,9 @@ class OtherMetricType(object):
         return self.metric_id
 
     def str_ui(self):
+        return self._str_ui
+
+    def _build_str_ui(self):
         if self.metric_id.startswith('__li_url') or self.metric_id.startswith('__li_page'):
             return self.metric_id.replace('__li_', '').split('_')[0]
         elif self.metric_id.startswith('__server_metric'):
@@ -122,7 +137,18 @@ class OtherMetricType(object):
         return self.metric_id
 
     def __eq__(self, other):
-            return self.metric_id == other.metric_id
+        return isinstance(other, OtherMetricType) and self.metric_id == other.metric_id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.metric_id)
+
+
+# Maximum number of raw strings whose parsed `Metric` is kept by
+# `Metric.from_raw()`.
+METRIC_CACHE_SIZE = 10000
 
 
 class Metric(object):
@@ -130,13 +156,46 @@ class Metric(object):
     Utility class for representing a Metric, allowing to obtain the different
     string representations (`str_raw()`, `str_param()`, `str_ui()`) and access
     the metric type and parameters.
+
+    The string representations are computed once, when the metric is
+    created, so metrics should not be modified afterwards. `from_raw()` interns
+    the metrics it parses: parsing the same metric again returns the same
+    object.
     """
+    __slots__ = ('metric_type', 'params', '_str_raw', '_str_raw_params', '_str_ui', '_str_ui_params')
+
+    # Parsed metrics, by raw string (as given to `from_raw()` and canonical).
+    _cache = {}
+
     def __init__(self, metric_type, params):
         self.metric_type = metric_type
         self.params = params
 
+        self._str_raw = metric_type.str_raw()
+        self._str_raw_params = u':'.join([self._str_raw] + params)
+        self._str_ui = metric_type.str_ui()
+        if params:
+            self._str_ui_params = u'{0} [{1}]'.format(self._str_ui, u' '.join(params))
+        else:
+            self._str_ui_params = self._str_ui
+
     @classmethod
     def from_raw(cls, str_raw):
+        try:
+            return cls._cache[str_raw]
+        except KeyError:
+            pass
+
+        metric = cls._parse(str_raw)
+        if len(cls._cache) >= METRIC_CACHE_SIZE:
+            cls._cache.clear()
+        # Equal metrics parsed from different strings share the same object.
+        metric = cls._cache.setdefault(metric._str_raw_params, metric)
+        cls._cache[str_raw] = metric
+        return metric
+
+    @classmethod
+    def _parse(cls, str_raw):
         # Split the string into metric id and parameters.
         str_raw = str_raw.split('|')[0]
         str_parts = str_raw.split(':')
@@ -163,27 +222,31 @@ class Metric(object):
         """
         Return the "raw" representation of the metric, as used by the API.
         """
-        if with_params:
-            return u':'.join([self.metric_type.str_raw()] + self.params)
-        else:
-            return self.metric_type.str_raw()
+        return self._str_raw_params if with_params else self._str_raw
 
     def str_ui(self, with_params=False):
         """
         Return the representation of the metric for display purposes.
         """
-        if with_params and self.params:
-            return u'{0} [{1}]'.format(self.metric_type.str_ui(), u' '.join(self.params))
-        else:
-            return self.metric_type.str_ui()
+        return self._str_ui_params if with_params else self._str_ui
 
     def __eq__(self, other):
-            return self.metric_type == other.metric_type and self.params == other.params
+        return isinstance(other, Metric) and self._str_raw_params == other._str_raw_params
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._str_raw_params)
 
 
 class ColumnFormatter(object):
     """
     Helper class for formatting text into columns with fixed width.
+
+    The formatting of each column is prepared when the formatter is created,
+    so formatting rows (eg. while streaming results) only does the work that
+    depends on the values.
     """
     def __init__(self, widths, separator):
         """
@@ -194,6 +257,7 @@ class ColumnFormatter(object):
         """
         self.widths = widths
         self.separator = separator
+        self._cell_formatters = [self._build_cell_formatter(width) for width in widths]
 
     def format(self, *args):
         """
@@ -213,21 +277,168 @@ class ColumnFormatter(object):
         attribute.
         :return: a string with the resulting row
         """
-        def format_cell(val_, width_):
-            if len(val_) != len(unstyle(val_)) or width_ == 0:
-                # For styled strings, assume they have been already prepared.
-                # For width == 0, ignore formatting completely.
-                return val_
+        return self.separator.join([format_cell(val)
+                                    for format_cell, val in zip(self._cell_formatters, args)]).rstrip()
 
-            if len(val_) > width_:
-                val_ = val_[:width_ - 3] + '...'
+    @staticmethod
+    def _build_cell_formatter(width):
+        """
+        Return a function formatting a value for a column of `width` chars.
+        """
+        if width == 0:
+            # For width == 0, ignore formatting completely.
+            return text_type
 
-            return u'{:{width}}'.format(val_, width=width_)
+        truncated_width = width - 3
 
-        if sys.version_info >= (3, 0):
-            decode = str
-        else:
-            decode = unicode
+        def format_cell(val):
+            val = text_type(val)
+            # Only strings with escape characters need the (slower) check for
+            # styles. Styled strings are assumed to be already prepared.
+            if u'\x1b' in val and len(val) != len(unstyle(val)):
+                return val
+            if len(val) > width:
+                return val[:truncated_width] + u'...'
+            return val.ljust(width)
 
-        return self.separator.join([format_cell(decode(val), width)
-                                    for width, val in zip(self.widths, args)]).rstrip()
+        return format_cell
+
+
+def concurrent_map(func, iterable, concurrency, ordered=True):
+    """
+    Apply `func` to each item of `iterable` using up to `concurrency` worker
+    threads, yielding the results in the same order as the items. Results
+    are yielded as soon as they (and all the preceding ones) are available.
+
+    :param func: callable receiving a single item.
+    :param iterable: items to be processed.
+    :param concurrency: maximum number of concurrent calls to `func`. A value
+    of 1 (or lower) processes the items sequentially in the calling thread.
+    :param ordered: if False, yield each result as soon as it is available
+    (ie. not necessarily in the same order as the items).
+    """
+    if concurrency <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+
+    pool = ThreadPool(concurrency)
+    try:
+        for result in (pool.imap if ordered else pool.imap_unordered)(func, iterable):
+            yield result
+    finally:
+        pool.terminate()
+
+
+def concurrent_unordered(func, iterable, concurrency):
+    """
+    Like `concurrent_map()`, but yielding each result as soon as it is
+    available.
+    """
+    return concurrent_map(func, iterable, concurrency, ordered=False)
+
+
+def top_n(iterable, n, key):
+    """
+    Return a tuple with the `n` largest items of `iterable` (sorted in
+    descending order according to `key`) and the total number of items.
+
+    The items are consumed in a single pass, keeping at most `n` of them in
+    memory at any time.
+    """
+    count = [0]
+
+    def counted(items):
+        for item in items:
+            count[0] += 1
+            yield item
+
+    largest = heapq.nlargest(n, counted(iterable), key=key)
+    return largest, count[0]
+
+
+def replace_file(src, dst):
+    """
+    Rename the file `src` to `dst`, replacing `dst` if it already exists.
+    """
+    try:
+        os.rename(src, dst)
+    except OSError:
+        # On Windows, rename() fails if the destination already exists.
+        os.remove(dst)
+        os.rename(src, dst)
+
+
+def read_json_file(path, default=None):
+    """
+    Return the data stored as JSON in `path`, or `default` if the file does
+    not exist or can not be read.
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def write_json_file(path, data):
+    """
+    Store `data` as JSON in `path`, creating its directory if needed. The file
+    is replaced at once, so it is never left half written.
+    """
+    make_parent_directory(path)
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, sort_keys=True)
+    replace_file(tmp_path, path)
+
+
+def make_parent_directory(path):
+    """
+    Create the directory of `path` if it does not exist.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError as ex:
+            if not (ex.errno == errno.EEXIST and os.path.isdir(directory)):
+                raise
+
+
+@contextmanager
+def file_lock(path, timeout=10, stale_after=60, poll_interval=0.05):
+    """
+    Hold the lock file `path` for the duration of the block, so that several
+    processes can update a file shared between them. The lock file is created
+    exclusively, waiting up to `timeout` seconds for other processes to remove
+    it. A lock file older than `stale_after` seconds was left by a process that
+    died, and is removed.
+    """
+    make_parent_directory(path)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        try:
+            if time.time() - os.path.getmtime(path) > stale_after:
+                os.remove(path)
+                continue
+        except OSError:
+            # Removed by its owner (or another process) in the meantime.
+            continue
+        if time.time() > deadline:
+            raise CLIError(u"Timed out waiting for the lock file {0}".format(path))
+        time.sleep(poll_interval)
+    try:
+        os.close(fd)
+        yield
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
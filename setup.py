@@ -43,6 +43,12 @@ setup(
         'mock',
         'enum34'
     ],
+    extras_require={
+        # Parquet and Arrow formats of `metric export`.
+        'arrow': ['pyarrow'],
+        # `metric stats`.
+        'stats': ['numpy'],
+    },
     test_requires=['coverage'],
     entry_points={
         'console_scripts': [
@@ -0,0 +1,45 @@
+# coding=utf-8
+
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from collections import namedtuple
+
+try:
+    from unittest.mock import MagicMock
+except ImportError:
+    from mock import MagicMock
+
+# Results of a metric, as returned by `client.list_test_run_results`.
+Result = namedtuple('Result', ['sid', 'offset', 'data'])
+
+MockedTest = namedtuple('MockedTest', ['id', 'start_test_run'])
+MockedTestRun = namedtuple('MockedTestRun', ['id', 'status', 'status_text', 'queued', 'is_done', 'abort'])
+
+
+def mocked_test_run(test_run_id, status=0, queued=None):
+    """
+    Return a test run that is done, with `status`.
+    """
+    return MockedTestRun(test_run_id, status, 'status {0}'.format(status), queued, MagicMock(return_value=True),
+                         MagicMock())
+
+
+def mocked_test(test_id, test_run):
+    """
+    Return a test whose `start_test_run()` returns `test_run`.
+    """
+    return MockedTest(test_id, MagicMock(return_value=test_run))
@@ -0,0 +1,124 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+# Without this the config will prompt for a token
+import os
+os.environ['LOADIMPACT_API_V3_TOKEN'] = 'token'
+
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from loadimpactcli.cache import ResponseCache
+
+try:
+    from unittest.mock import MagicMock
+except ImportError:
+    from mock import MagicMock
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = os.path.join(tempfile.mkdtemp(), 'cache')
+        self.cache = ResponseCache(self.cache_dir, ttl=60, max_size=1024 * 1024)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.cache_dir))
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', {'a': [1, 2]})
+        self.assertEqual(self.cache.get('key'), {'a': [1, 2]})
+        self.assertIsNone(self.cache.get('other key'))
+
+    def test_expiration(self):
+        self.cache.set('volatile', 1)
+        self.cache.set('permanent', 2, permanent=True)
+
+        self.cache.ttl = -1
+        self.cache.set('expired', 3)
+        self.cache.prune()
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertIsNone(self.cache.get('volatile'))
+        self.assertEqual(self.cache.get('permanent'), 2)
+
+    def test_clear(self):
+        self.cache.set('volatile', 1)
+        self.cache.set('permanent', 2, permanent=True)
+
+        self.cache.clear(volatile_only=True)
+        self.assertIsNone(self.cache.get('volatile'))
+        self.assertEqual(self.cache.get('permanent'), 2)
+
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('permanent'))
+
+    def test_max_size(self):
+        for i in range(5):
+            self.cache.set('key {0}'.format(i), 'x' * 100, permanent=True)
+            # Make sure the entries have different modification times.
+            path = self.cache._path('key {0}'.format(i), 'p-')
+            os.utime(path, (time.time() - 10 + i, time.time() - 10 + i))
+
+        self.cache.max_size = 300
+        self.cache.prune()
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        self.assertIsNone(self.cache.get('key 0'))
+        self.assertEqual(self.cache.get('key 4'), 'x' * 100)
+
+    def test_prune_on_estimated_size(self):
+        self.cache.set('key', 'x' * 100, permanent=True)
+        entry_size = os.path.getsize(self.cache._path('key', 'p-'))
+        self.cache.max_size = 20 * entry_size
+        prune = self.cache.prune
+        self.cache.prune = MagicMock(side_effect=prune)
+
+        # The cache is not scanned again until the entries written exceed
+        # the size limit, and then it is pruned below it.
+        for i in range(18):
+            self.cache.set('key {0}'.format(i), 'x' * 100, permanent=True)
+        self.assertEqual(self.cache.prune.call_count, 0)
+        for i in range(18, 60):
+            self.cache.set('key {0}'.format(i), 'x' * 100, permanent=True)
+        self.assertLess(self.cache.prune.call_count, 21)
+        self.assertLessEqual(sum(os.path.getsize(os.path.join(self.cache_dir, name))
+                                 for name in os.listdir(self.cache_dir)), self.cache.max_size)
+
+    def test_concurrent_writes(self):
+        threads = [threading.Thread(target=self.cache.set, args=('key', {'value': i})) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIn(self.cache.get('key'), [{'value': i} for i in range(10)])
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_disabled(self):
+        self.cache.enabled = False
+        self.cache.set('key', 1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_refresh(self):
+        self.cache.set('key', 1)
+        self.cache.refresh = True
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', 2)
+        self.cache.refresh = False
+        self.assertEqual(self.cache.get('key'), 2)
@@ -0,0 +1,216 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+# Without this the config will prompt for a token
+import os
+os.environ['LOADIMPACT_API_V3_TOKEN'] = 'token'
+
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+from loadimpact3.exceptions import UnauthorizedError
+from loadimpact3.resources import Test, TestRun
+from loadimpactcli import organization_commands
+from loadimpactcli.loadimpact_cli import cli
+from loadimpactcli.cache import ResponseCache
+from loadimpactcli.client import CLIClient, LazyClient, build_session
+from loadimpactcli.upload import MultipartStream
+
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+
+class MockResponse(object):
+
+    def __init__(self, json_data, status_code=200):
+        self.json_data = json_data
+        self.status_code = status_code
+        self.text = ''
+        self.url = ''
+
+    def json(self):
+        return self.json_data
+
+
+class TestCLIClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = CLIClient(api_token='token')
+
+    def test_list_tests_project_scoped(self):
+        """
+        Test that listing the tests of a project does not leak the project id
+        to other calls.
+        """
+        self.client.get = MagicMock(side_effect=[
+            MockResponse({'tests': [{'id': 1, 'name': 'Test1'}]}),
+            MockResponse({'tests': [{'id': 2, 'name': 'Test2'}, {'id': 3, 'name': 'Test3'}]})])
+
+        tests_1 = self.client.list_tests(project_id=10)
+        tests_2 = self.client.list_tests(project_id=20)
+
+        self.assertEqual([t.id for t in tests_1], [1])
+        self.assertEqual([t.id for t in tests_2], [2, 3])
+        self.assertEqual(self.client.get.call_args_list[0][0][0], 'tests?project_id=10')
+        self.assertEqual(self.client.get.call_args_list[1][0][0], 'tests?project_id=20')
+        self.assertIsNone(Test.project_id)
+        self.assertEqual(Test._path(1), 'tests/1')
+
+    def test_list_test_runs(self):
+        self.client.get = MagicMock(return_value=MockResponse({'test_runs': [{'id': 5, 'status': 3},
+                                                                             {'id': 6, 'status': 2}]}))
+        test_runs = self.client.list_test_runs(10)
+        self.assertEqual([(r.id, r.status) for r in test_runs], [(5, 3), (6, 2)])
+        self.client.get.assert_called_once_with('test-runs', params={'test_id': 10})
+
+    def test_shared_session(self):
+        """
+        Test that all the requests are made through the pooled session.
+        """
+        self.client.session.request = MagicMock(side_effect=[MockResponse({'tests': []}),
+                                                             MockResponse({'test_run': {'id': 1}})])
+        self.client.list_tests(project_id=1)
+        self.client.get_test_run(1)
+
+        self.assertEqual(self.client.session.request.call_count, 2)
+        self.assertEqual(self.client.session.request.call_args_list[0][0][0], 'get')
+        self.assertEqual(self.client.session.request.call_args_list[0][1]['auth'], ('token', ''))
+
+    def test_build_session(self):
+        session = build_session(pool_size=4)
+        adapter = session.get_adapter('https://api.loadimpact.com/v3/')
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertTrue(adapter._pool_block)
+        self.assertEqual(session.headers['Connection'], 'keep-alive')
+
+        session = build_session(keep_alive=False)
+        self.assertEqual(session.headers['Connection'], 'close')
+
+    def test_create_data_store_streamed(self):
+        """
+        Test that data stores are uploaded as a streamed multipart body.
+        """
+        self.client.session.request = MagicMock(return_value=MockResponse({'data_store': {'id': 1, 'status': 0}}))
+        with open('tests/datastore.csv', 'rb') as f:
+            data_store = self.client.create_data_store({'name': 'Datastore'}, f)
+
+        self.assertEqual(data_store.id, 1)
+        args, kwargs = self.client.session.request.call_args
+        self.assertEqual(args[0], 'post')
+        self.assertTrue(args[1].endswith('/data-stores'))
+        self.assertIsNone(kwargs['files'])
+        self.assertTrue(kwargs['headers']['Content-Type'].startswith('multipart/form-data; boundary='))
+        self.assertIsInstance(kwargs['data'], MultipartStream)
+
+
+class TestCLIClientCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.client = CLIClient(api_token='token', cache=ResponseCache(self.cache_dir))
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def _test_run_response(self, status):
+        return MockResponse({'test_run': {'id': 1, 'status': status, 'status_text': 'status'}})
+
+    def test_cache_listings(self):
+        """
+        Test that listings are cached, and discarded when modifying data.
+        """
+        self.client._requests_request = MagicMock(return_value=MockResponse({'tests': [{'id': 1}]}))
+
+        self.assertEqual([t.id for t in self.client.list_tests(project_id=1)], [1])
+        self.assertEqual([t.id for t in self.client.list_tests(project_id=1)], [1])
+        self.assertEqual(self.client._requests_request.call_count, 1)
+
+        # Different project.
+        self.client.list_tests(project_id=2)
+        self.assertEqual(self.client._requests_request.call_count, 2)
+
+        # Reading results does not discard the listings.
+        self.client._requests_request.return_value = MockResponse({'test_run_result_ids': []})
+        self.client.list_test_run_result_ids(1, data={'types': ''})
+        self.client.list_tests(project_id=1)
+        self.assertEqual(self.client._requests_request.call_count, 3)
+
+        # Creating a test run discards the listings.
+        self.client._requests_request.return_value = MockResponse({'test_run': {'id': 1}})
+        self.client.create_test_run({'test_id': 1})
+        self.client._requests_request.return_value = MockResponse({'tests': [{'id': 1}]})
+        self.client.list_tests(project_id=1)
+        self.assertEqual(self.client._requests_request.call_count, 5)
+
+    def test_cache_finished_test_runs(self):
+        """
+        Test that test runs are only cached once finished.
+        """
+        self.client._requests_request = MagicMock(return_value=self._test_run_response(TestRun.STATUS_RUNNING))
+        self.client.get_test_run(1)
+        self.client.get_test_run(1)
+        self.assertEqual(self.client._requests_request.call_count, 2)
+
+        self.client._requests_request.return_value = self._test_run_response(TestRun.STATUS_FINISHED)
+        self.client.get_test_run(1)
+        test_run = self.client.get_test_run(1)
+        self.assertEqual(self.client._requests_request.call_count, 3)
+        self.assertEqual(test_run.status, TestRun.STATUS_FINISHED)
+
+        # Finished test runs are kept when modifying data.
+        self.client.cache.ttl = -1
+        self.client.delete('tests/1')
+        self.client.get_test_run(1)
+        self.assertEqual(self.client._requests_request.call_count, 4)
+
+    def test_no_cache(self):
+        self.client.cache.enabled = False
+        self.client._requests_request = MagicMock(return_value=self._test_run_response(TestRun.STATUS_FINISHED))
+        self.client.get_test_run(1)
+        self.client.get_test_run(1)
+        self.assertEqual(self.client._requests_request.call_count, 2)
+
+
+class TestLazyClient(unittest.TestCase):
+
+    def test_lazy_client(self):
+        """
+        Test that the client is only built when it is first used.
+        """
+        client = CLIClient(api_token='token')
+        factory = MagicMock(return_value=client)
+        lazy_client = LazyClient(factory)
+        self.assertEqual(factory.call_count, 0)
+
+        lazy_client.timeout = 10
+        self.assertEqual(lazy_client.timeout, 10)
+        self.assertEqual(client.timeout, 10)
+        self.assertEqual(factory.call_count, 1)
+
+    def test_authentication_failed(self):
+        """
+        Test that an invalid API token is reported without a traceback.
+        """
+        client = MagicMock()
+        client.list_organizations.side_effect = UnauthorizedError('Unauthorized')
+        with patch.object(organization_commands, 'client', client):
+            result = CliRunner().invoke(cli, ['organization', 'list'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertEqual(result.output, 'Authentication failed\n')
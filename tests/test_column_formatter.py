@@ -0,0 +1,66 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+
+import click
+
+from loadimpactcli import util
+from loadimpactcli.util import ColumnFormatter
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+# Number of metric columns and rows formatted, similar to streaming many
+# metrics for a while.
+ROWS_COLUMNS = 50
+ROWS = 200
+
+
+class TestColumnFormatter(unittest.TestCase):
+
+    def test_format(self):
+        formatter = ColumnFormatter([8, 10, 4], '|')
+        self.assertEqual(formatter.format('0123456789', '0123456789', 'abc'), u'01234...|0123456789|abc')
+        self.assertEqual(formatter.format(1, 2.5, None), u'1       |2.5       |None')
+
+    def test_format_unlimited_width(self):
+        formatter = ColumnFormatter([0, 0], '\t')
+        self.assertEqual(formatter.format('0123456789', 1), u'0123456789\t1')
+
+    def test_format_styled(self):
+        formatter = ColumnFormatter([4, 4], ' ')
+        styled = click.style('finished', fg='green')
+        # Styled strings are neither truncated nor padded.
+        self.assertEqual(formatter.format(styled, u'x'), u'{0} x'.format(styled))
+
+    def test_precompiled_columns(self):
+        """
+        Test that the formatting of each column is prepared once, and that
+        only the styled cells are unstyled, when formatting many rows.
+        """
+        with patch.object(ColumnFormatter, '_build_cell_formatter',
+                          side_effect=ColumnFormatter._build_cell_formatter) as build, \
+                patch.object(util, 'unstyle', side_effect=util.unstyle) as unstyle:
+            formatter = ColumnFormatter([30] + [20] * ROWS_COLUMNS, ' ')
+            for i in range(ROWS):
+                formatter.format(click.style(u'finished', fg='green'),
+                                 *[u'{0}'.format(i * 1.5 + j) for j in range(ROWS_COLUMNS)])
+
+        self.assertEqual(build.call_count, ROWS_COLUMNS + 1)
+        self.assertEqual(unstyle.call_count, ROWS)
@@ -0,0 +1,127 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from loadimpactcli.csvcheck import MAX_REPORTED_LINES, _Scanner, check_csv, detect_dialect
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+# Rows of the file checked for the use of the fast path.
+ROWS = 10000
+
+
+class TestCheckCSV(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, content):
+        file_path = os.path.join(self.tmp_dir, 'datastore.csv')
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        return file_path
+
+    def _check(self, content, **kwargs):
+        # Small chunks, so records and lines span several of them.
+        return check_csv(io.BytesIO(content), chunk_size=5, **kwargs)
+
+    def test_detect_dialect(self):
+        self.assertEqual(detect_dialect(b'a,b\n1,2\n'), ('comma', 'double'))
+        self.assertEqual(detect_dialect(b'a;b,c\n1;2,3\n4;5\n'), ('semicolon', 'double'))
+        self.assertEqual(detect_dialect(b"a\tb\n'1\t2'\t3\n"), ('tab', 'single'))
+        self.assertEqual(detect_dialect(b'name\nx\n'), ('comma', 'double'))
+        self.assertEqual(detect_dialect(b''), ('comma', 'double'))
+
+    def test_check(self):
+        report = self._check(b'user,password\r\njoe,secret\r\n\r\nbill,secret2\r\n')
+        self.assertTrue(report.ok)
+        self.assertEqual((report.separator, report.delimiter), ('comma', 'double'))
+        self.assertEqual((report.rows, report.columns), (3, 2))
+
+    def test_quoted_fields(self):
+        report = self._check(b'a,b,c\n"1,2",3,"multi\nline, ""quoted"""\n4,5,6', delimiter='double')
+        self.assertEqual(report.problems(), [])
+        self.assertEqual((report.rows, report.columns), (3, 3))
+
+        # Quotes only open quoted fields at the start of a field.
+        content = b'name,size\nscreen,27"\nphone,6\nsay "hi",1\n'
+        report = self._check(content)
+        self.assertEqual(report.problems(), [])
+        self.assertEqual(report.warnings(), [])
+        self.assertEqual(report.rows, len(list(csv.reader(io.StringIO(content.decode('utf-8'))))))
+
+        report = self._check(b'a,b\n1,"2\n3,4\n')
+        self.assertEqual(report.problems(), [u'The quoted field starting at line 2 is never closed'])
+
+    def test_ragged_rows(self):
+        content = b'a,b\n' + b'1,2\n' * 3 + b'1,2,3\n' * (MAX_REPORTED_LINES + 2) + b'1\n'
+        report = self._check(content)
+        self.assertEqual(report.rows, MAX_REPORTED_LINES + 7)
+        self.assertEqual(report.ragged_count, MAX_REPORTED_LINES + 3)
+        self.assertEqual(report.ragged_rows[0], (5, 3))
+        self.assertEqual(report.problems(), [])
+        self.assertEqual(report.warnings()[-1], u'... and 3 more rows with a different number of columns')
+
+    def test_fromline(self):
+        report = self._check(b'exported data\n\na,b\n1,2\n', fromline=3)
+        self.assertTrue(report.ok)
+        self.assertEqual((report.rows, report.columns), (2, 2))
+
+        report = self._check(b'a,b\n', fromline=2)
+        self.assertEqual(report.problems(), [u'The file has no rows to read'])
+
+    def test_encoding_errors(self):
+        report = self._check(u'namn\nåsa\n'.encode('utf-8') + b'\xe5sa\n')
+        self.assertTrue(report.ok)
+        self.assertEqual(report.warnings(), [u'Line 3 is not valid utf-8'])
+        self.assertTrue(self._check(b'namn\n\xe5sa\n', encoding='latin-1').ok)
+
+    def test_file(self):
+        content = b'a;b\n' + b'1;2\n' * 10000 + b'1;2;3\n'
+        with open(self._write(content), 'rb') as f:
+            f.readline()
+            report = check_csv(f, chunk_size=1000)
+            self.assertEqual(f.tell(), 4)
+        self.assertEqual((report.separator, report.rows, report.columns), ('semicolon', 10001, 2))
+        self.assertEqual(report.ragged_rows, [(10001, 3)])
+
+        with open(self._write(b''), 'rb') as f:
+            self.assertEqual(check_csv(f).rows, 0)
+
+    def test_fast_path(self):
+        """
+        Test that the lines are only split for the chunks that need it.
+        """
+        content = b'id,name\n' + b''.join(b'%d,user%d\n' % (i, i) for i in range(ROWS)) + b'1,"x"\n'
+        with patch.object(_Scanner, 'scan_line', autospec=True, side_effect=_Scanner.scan_line) as scan_line:
+            report = check_csv(io.BytesIO(content), chunk_size=1000)
+        self.assertEqual((report.rows, report.columns), (ROWS + 2, 2))
+        # Only the lines of the first chunk (before the number of columns is
+        # known) and of the last one (which has quotes) are split.
+        self.assertLess(scan_line.call_count, 2 * 1000 / len(b'1,user1\n'))
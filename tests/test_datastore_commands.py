@@ -19,16 +19,22 @@ limitations under the License.
 import os
 os.environ['LOADIMPACT_API_V3_TOKEN'] = 'token'
 
+import shutil
+import tempfile
+import threading
 import unittest
 from collections import namedtuple
 
 from click.testing import CliRunner
-from loadimpactcli import datastore_commands
+from loadimpactcli import datastore_commands, util
+from loadimpactcli.datastore_index import DataStoreIndex, content_key
+from loadimpactcli.errors import CLIError, PollTimeoutError
+from loadimpactcli.polling import TIMEOUT_EXIT_CODE
 
 try:
-    from unittest.mock import MagicMock
+    from unittest.mock import MagicMock, patch
 except ImportError:
-    from mock import MagicMock
+    from mock import MagicMock, patch
 
 
 class TestDataStores(unittest.TestCase):
@@ -39,6 +45,18 @@ class TestDataStores(unittest.TestCase):
         self.datastore1 = DataStore(1, u'First datastore', 'status1', 'www.example.com')
         self.datastore2 = DataStore(2, u'Second datastore', 'status2', 'www.example.com')
         self.datastore3 = DataStore(3, u'ÅÄÖåäö', 'status3', 'www.example.com')
+        self.finished_datastore = DataStore(4, u'Finished datastore', 2, 'www.example.com')
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.tmp_dir, 'data_store_index.json')
+        index_patch = patch.object(datastore_commands, 'DATA_STORE_INDEX_PATH', self.index_path)
+        index_patch.start()
+        self.addCleanup(index_patch.stop)
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def _csv_key(self):
+        with open('tests/datastore.csv', 'rb') as f:
+            return content_key(f, {'delimiter': 'double', 'separator': 'comma', 'fromline': 1})
 
     def test_download_csv(self):
         client = datastore_commands.client
@@ -90,6 +108,20 @@ class TestDataStores(unittest.TestCase):
         assert result.exit_code == 0
         assert result.output == "{0}\n".format("Data store conversion completed with status 'unknown'")
 
+    def test_create_datastore_timeout(self):
+        client = datastore_commands.client
+        client.create_data_store = MagicMock(return_value=self.datastore1)
+        datastore_commands._wait_for_conversion = MagicMock(side_effect=PollTimeoutError('Timed out after 5 seconds'))
+        result = self.runner.invoke(datastore_commands.create_datastore, ['NewDatastore',
+                                                                          'tests/script',
+                                                                          '--project_id',
+                                                                          '1',
+                                                                          '--timeout',
+                                                                          '5'])
+        assert result.exit_code == TIMEOUT_EXIT_CODE
+        assert result.output == "Data store conversion did not finish: Timed out after 5 seconds\n"
+        assert datastore_commands._wait_for_conversion.call_args[1]['timeout'] == 5
+
     def test_create_datastore_missing_params(self):
         client = datastore_commands.client
         client.DEFAULT_PROJECT = 1
@@ -136,3 +168,194 @@ class TestDataStores(unittest.TestCase):
     def test_delete_datastore_no_params(self):
         result = self.runner.invoke(datastore_commands.delete_datastore, [])
         assert result.exit_code == 2
+
+    def test_create_datastore_records_finished_conversion(self):
+        client = datastore_commands.client
+        client.create_data_store = MagicMock(return_value=self.finished_datastore)
+        datastore_commands._wait_for_conversion = MagicMock(return_value=self.finished_datastore)
+        result = self.runner.invoke(datastore_commands.create_datastore, ['NewDatastore', 'tests/datastore.csv',
+                                                                          '--project_id', '1'])
+        assert result.exit_code == 0
+        assert DataStoreIndex(self.index_path).get(1, self._csv_key()) == 4
+
+    def test_create_datastore_reuses_identical_file(self):
+        DataStoreIndex(self.index_path).add(1, self._csv_key(), 4)
+        client = datastore_commands.client
+        client.get_data_store = MagicMock(return_value=self.finished_datastore)
+        client.create_data_store = MagicMock(return_value=self.finished_datastore)
+        result = self.runner.invoke(datastore_commands.create_datastore, ['Finished datastore', 'tests/datastore.csv',
+                                                                          '--project_id', '1'])
+        assert result.exit_code == 0
+        assert result.output == "Reusing data store 4 ('Finished datastore'), which has identical contents\n"
+        client.get_data_store.assert_called_once_with(4)
+        client.create_data_store.assert_not_called()
+
+    def test_create_datastore_other_name_uploads(self):
+        DataStoreIndex(self.index_path).add(1, self._csv_key(), 4)
+        renamed_datastore = self.finished_datastore._replace(id=5, name=u'NewDatastore')
+        client = datastore_commands.client
+        client.get_data_store = MagicMock(return_value=self.finished_datastore)
+        client.create_data_store = MagicMock(return_value=renamed_datastore)
+        datastore_commands._wait_for_conversion = MagicMock(return_value=renamed_datastore)
+        result = self.runner.invoke(datastore_commands.create_datastore, ['NewDatastore', 'tests/datastore.csv',
+                                                                          '--project_id', '1'])
+        assert result.exit_code == 0
+        assert 'Reusing' not in result.output
+        assert client.create_data_store.call_args[0][0]['name'] == 'NewDatastore'
+        assert DataStoreIndex(self.index_path).get(1, self._csv_key()) == 5
+
+    def test_create_datastore_other_project_or_options_uploads(self):
+        DataStoreIndex(self.index_path).add(2, self._csv_key(), 4)
+        client = datastore_commands.client
+        client.get_data_store = MagicMock(return_value=self.finished_datastore)
+        client.create_data_store = MagicMock(return_value=self.datastore1)
+        datastore_commands._wait_for_conversion = MagicMock(return_value=self.datastore1)
+        for args in (['--project_id', '1'], ['--project_id', '2', '--fromline', '2'],
+                     ['--project_id', '2', '--no_dedup']):
+            result = self.runner.invoke(datastore_commands.create_datastore,
+                                        ['NewDatastore', 'tests/datastore.csv'] + args)
+            assert result.exit_code == 0
+        assert client.create_data_store.call_count == 3
+
+    def test_create_datastore_stale_index_entry(self):
+        DataStoreIndex(self.index_path).add(1, self._csv_key(), 3)
+        client = datastore_commands.client
+        client.get_data_store = MagicMock(return_value=self.datastore3)
+        client.create_data_store = MagicMock(return_value=self.finished_datastore)
+        datastore_commands._wait_for_conversion = MagicMock(return_value=self.finished_datastore)
+        result = self.runner.invoke(datastore_commands.create_datastore, ['NewDatastore', 'tests/datastore.csv',
+                                                                          '--project_id', '1'])
+        assert result.exit_code == 0
+        assert client.create_data_store.call_count == 1
+        assert DataStoreIndex(self.index_path).get(1, self._csv_key()) == 4
+
+    def test_update_datastore_skips_identical_file(self):
+        DataStoreIndex(self.index_path).add(1, self._csv_key(), 4)
+        client = datastore_commands.client
+        client.get_data_store = MagicMock(return_value=self.finished_datastore)
+        client.update_data_store = MagicMock(return_value=self.finished_datastore)
+        result = self.runner.invoke(datastore_commands.update_datastore,
+                                    ['4', 'tests/datastore.csv', '--project_id', '1'])
+        assert result.exit_code == 0
+        assert result.output == "Data store 4 already has identical contents, not updating it\n"
+        client.update_data_store.assert_not_called()
+
+    def test_update_datastore_replaces_index_entry(self):
+        DataStoreIndex(self.index_path).add(1, 'other', 4)
+        client = datastore_commands.client
+        client.get_data_store = MagicMock(return_value=self.finished_datastore)
+        client.update_data_store = MagicMock(return_value=self.finished_datastore)
+        datastore_commands._wait_for_conversion = MagicMock(return_value=self.finished_datastore)
+        result = self.runner.invoke(datastore_commands.update_datastore,
+                                    ['4', 'tests/datastore.csv', '--project_id', '1'])
+        assert result.exit_code == 0
+        index = DataStoreIndex(self.index_path)
+        assert index.get(1, 'other') is None
+        assert index.get(1, self._csv_key()) == 4
+
+    def test_check_datastore(self):
+        result = self.runner.invoke(datastore_commands.check_datastore, ['tests/datastore.csv'])
+        assert result.exit_code == 0
+        assert result.output == "Separator: comma\nDelimiter: double\nRows: 6\nColumns: 2\n"
+
+    def test_check_datastore_detects_dialect(self):
+        file_path = os.path.join(self.tmp_dir, 'ragged.csv')
+        with open(file_path, 'wb') as f:
+            f.write(b'a;b\n1;2\n3;4;5\n')
+        result = self.runner.invoke(datastore_commands.check_datastore, [file_path, '--separator', 'comma'])
+        assert result.exit_code == 0
+        assert result.output == ("Separator: comma\nDelimiter: double\nRows: 3\nColumns: 1\n"
+                                 "The file seems to use --separator semicolon --delimiter double\n")
+
+        result = self.runner.invoke(datastore_commands.check_datastore, [file_path])
+        assert result.exit_code == 0
+        assert result.output == ("Separator: semicolon\nDelimiter: double\nRows: 3\nColumns: 2\n"
+                                 "  Line 3 has 3 columns, expected 2\n")
+
+    def test_create_datastore_check_fails(self):
+        file_path = os.path.join(self.tmp_dir, 'ragged.csv')
+        with open(file_path, 'wb') as f:
+            f.write(b'a,b\n1,2\n3,4,5\n"6,7\n')
+        client = datastore_commands.client
+        client.create_data_store = MagicMock(return_value=self.datastore1)
+        result = self.runner.invoke(datastore_commands.create_datastore, ['NewDatastore', file_path,
+                                                                          '--project_id', '1'])
+        assert result.exit_code == 1
+        assert result.output == ("The file was not uploaded, as it can not be converted:\n"
+                                 "  The quoted field starting at line 4 is never closed\n"
+                                 "  Line 3 has 3 columns, expected 2\n")
+        client.create_data_store.assert_not_called()
+
+        datastore_commands._wait_for_conversion = MagicMock(return_value=self.datastore1)
+        result = self.runner.invoke(datastore_commands.create_datastore, ['NewDatastore', file_path,
+                                                                          '--project_id', '1', '--no_check'])
+        assert result.exit_code == 0
+        client.create_data_store.assert_called_once()
+
+    def test_create_datastore_ragged_rows_warning(self):
+        file_path = os.path.join(self.tmp_dir, 'ragged.csv')
+        with open(file_path, 'wb') as f:
+            f.write(b'a,b\n1,2\n3,4,5\n')
+        client = datastore_commands.client
+        client.create_data_store = MagicMock(return_value=self.datastore1)
+        datastore_commands._wait_for_conversion = MagicMock(return_value=self.datastore1)
+        result = self.runner.invoke(datastore_commands.create_datastore, ['NewDatastore', file_path,
+                                                                          '--project_id', '1'])
+        assert result.exit_code == 0
+        assert result.output == ("Warning, the file may not be converted as expected:\n"
+                                 "  Line 3 has 3 columns, expected 2\n"
+                                 "Data store conversion completed with status 'unknown'\n")
+        client.create_data_store.assert_called_once()
+
+    def test_create_datastore_latin1_warning(self):
+        file_path = os.path.join(self.tmp_dir, 'latin1.csv')
+        with open(file_path, 'wb') as f:
+            f.write(u'namn,stad\nÅsa,Malmö\n'.encode('latin-1'))
+        client = datastore_commands.client
+        client.create_data_store = MagicMock(return_value=self.datastore1)
+        datastore_commands._wait_for_conversion = MagicMock(return_value=self.datastore1)
+        result = self.runner.invoke(datastore_commands.create_datastore, ['NewDatastore', file_path,
+                                                                          '--project_id', '1'])
+        assert result.exit_code == 0
+        assert result.output == ("Warning, the file may not be converted as expected:\n"
+                                 "  Line 2 is not valid utf-8\n"
+                                 "Data store conversion completed with status 'unknown'\n")
+        client.create_data_store.assert_called_once()
+
+
+class TestDataStoreIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.index = DataStoreIndex(os.path.join(self.tmp_dir, 'data_store_index.json'))
+
+    def test_concurrent_adds(self):
+        threads = [threading.Thread(target=self.index.add, args=(1, 'key{0}'.format(i), i)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [self.index.get(1, 'key{0}'.format(i)) for i in range(20)] == list(range(20))
+        assert not os.path.exists(self.index.lock_path)
+
+    def test_locked(self):
+        open(self.index.lock_path, 'w').close()
+        with patch.object(util.time, 'sleep') as sleep:
+            sleep.side_effect = lambda seconds: os.remove(self.index.lock_path)
+            self.index.add(1, 'key', 4)
+        assert sleep.call_count == 1
+        assert self.index.get(1, 'key') == 4
+
+    def test_lock_timeout(self):
+        open(self.index.lock_path, 'w').close()
+        with patch.object(util.time, 'time', side_effect=[0, 1, 20]), patch.object(util.time, 'sleep'):
+            self.assertRaises(CLIError, self.index.add, 1, 'key', 4)
+        assert self.index.get(1, 'key') is None
+
+    def test_stale_lock(self):
+        open(self.index.lock_path, 'w').close()
+        old = os.path.getmtime(self.index.lock_path) - 120
+        os.utime(self.index.lock_path, (old, old))
+        self.index.add(1, 'key', 4)
+        assert self.index.get(1, 'key') == 4
@@ -0,0 +1,141 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+# Without this the config will prompt for a token
+import os
+os.environ['LOADIMPACT_API_V3_TOKEN'] = 'token'
+
+import hashlib
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+
+from loadimpactcli.download import download_file
+from loadimpactcli.errors import DownloadError
+
+
+class MockResponse(object):
+
+    def __init__(self, status_code, body=b'', headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.url = 'http://www.example.com/file.csv'
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class MockSession(object):
+    """
+    Session serving `content`, optionally supporting range requests and
+    failing the requests for the ranges starting at `fail_offsets`.
+    """
+    def __init__(self, content, ranges=True, fail_offsets=()):
+        self.content = content
+        self.ranges = ranges
+        self.fail_offsets = set(fail_offsets)
+        self.requested_ranges = []
+        self.lock = threading.Lock()
+
+    def get(self, url, stream=False, headers=None):
+        range_header = (headers or {}).get('Range')
+        if not self.ranges or not range_header:
+            return MockResponse(200, self.content)
+
+        start, end = [int(x) for x in re.match(r'bytes=(\d+)-(\d+)', range_header).groups()]
+        with self.lock:
+            self.requested_ranges.append((start, end))
+        if start in self.fail_offsets:
+            return MockResponse(500)
+        return MockResponse(206, self.content[start:end + 1],
+                            {'Content-Range': 'bytes {0}-{1}/{2}'.format(start, end, len(self.content)),
+                             'ETag': '"etag"'})
+
+
+class TestDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, 'datastore.csv')
+        self.content = b''.join(b'row,' + str(i).encode('ascii') + b'\n' for i in range(1000))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read(self):
+        with open(self.file_path, 'rb') as f:
+            return f.read()
+
+    def test_download_ranges(self):
+        session = MockSession(self.content)
+        resumed = download_file(session, 'url', self.file_path, chunk_size=1000, concurrency=3)
+
+        self.assertFalse(resumed)
+        self.assertEqual(self._read(), self.content)
+        # Probe plus one request per chunk.
+        self.assertEqual(len(session.requested_ranges), 1 + len(range(0, len(self.content), 1000)))
+        self.assertEqual(os.listdir(self.tmp_dir), ['datastore.csv'])
+
+    def test_download_no_ranges(self):
+        session = MockSession(self.content, ranges=False)
+        download_file(session, 'url', self.file_path, chunk_size=1000)
+        self.assertEqual(self._read(), self.content)
+
+    def test_resume_download(self):
+        session = MockSession(self.content, fail_offsets=[3000])
+        with self.assertRaises(DownloadError):
+            download_file(session, 'url', self.file_path, chunk_size=1000, concurrency=1)
+
+        self.assertFalse(os.path.exists(self.file_path))
+        self.assertTrue(os.path.exists(self.file_path + '.part'))
+        self.assertTrue(os.path.exists(self.file_path + '.part.json'))
+
+        # Only the chunks not downloaded in the first attempt are requested.
+        session.fail_offsets = set()
+        session.requested_ranges = []
+        resumed = download_file(session, 'url', self.file_path, chunk_size=1000, concurrency=2)
+
+        self.assertTrue(resumed)
+        self.assertEqual(self._read(), self.content)
+        self.assertEqual(sorted(session.requested_ranges)[1:],
+                         [(start, min(start + 1000, len(self.content)) - 1)
+                          for start in range(3000, len(self.content), 1000)])
+        self.assertEqual(os.listdir(self.tmp_dir), ['datastore.csv'])
+
+    def test_checksum(self):
+        checksum = 'sha256:{0}'.format(hashlib.sha256(self.content).hexdigest())
+        download_file(MockSession(self.content), 'url', self.file_path, chunk_size=1000, checksum=checksum)
+        self.assertEqual(self._read(), self.content)
+
+    def test_checksum_mismatch(self):
+        checksum = 'md5:{0}'.format(hashlib.md5(b'other content').hexdigest())
+        with self.assertRaises(DownloadError):
+            download_file(MockSession(self.content), 'url', self.file_path, chunk_size=1000, checksum=checksum)
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_invalid_checksum(self):
+        session = MockSession(self.content)
+        for checksum in ('abcdef', 'foo:abcdef'):
+            with self.assertRaises(DownloadError):
+                download_file(session, 'url', self.file_path, checksum=checksum)
+        self.assertEqual(session.requested_ranges, [])
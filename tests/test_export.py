@@ -0,0 +1,78 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+from loadimpactcli.export import export_series
+from loadimpactcli.results import Series
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.all_series = OrderedDict([
+            (u'__li_user_load_time:1', Series([1483326245000000, 1483326248000000], [1.0 / 3, 250])),
+            (u'foöbår:1', Series([1483326245000000], [2.5])),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_export_csv(self):
+        file_path = os.path.join(self.tmp_dir, 'export.csv.gz')
+        points = export_series(self.all_series, file_path, 'csv')
+
+        self.assertEqual(points, 3)
+        with io.TextIOWrapper(gzip.GzipFile(file_path, 'rb'), encoding='utf-8') as f:
+            self.assertEqual(f.read().splitlines(), [
+                u'metric,timestamp,value',
+                u'__li_user_load_time:1,2017-01-02T03:04:05Z,{0!r}'.format(1.0 / 3),
+                u'__li_user_load_time:1,2017-01-02T03:04:08Z,250',
+                u'foöbår:1,2017-01-02T03:04:05Z,2.5',
+            ])
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_export_parquet_and_arrow(self):
+        for export_format, read in (('parquet', pyarrow.parquet.read_table),
+                                    ('arrow', pyarrow.feather.read_table)):
+            file_path = os.path.join(self.tmp_dir, 'export.{0}'.format(export_format))
+            self.assertEqual(export_series(self.all_series, file_path, export_format), 3)
+
+            table = read(file_path).to_pydict()
+            self.assertEqual([str(m) for m in table['metric']],
+                             [u'__li_user_load_time:1', u'__li_user_load_time:1', u'foöbår:1'])
+            self.assertEqual(table['value'], [1.0 / 3, 250.0, 2.5])
+            self.assertEqual(table['timestamp'][0].isoformat(), '2017-01-02T03:04:05+00:00')
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_export_non_numeric(self):
+        file_path = os.path.join(self.tmp_dir, 'export.parquet')
+        export_series({'log': Series([1483326245000000, 1483326246000000], [u'error', None])}, file_path, 'parquet')
+        self.assertEqual(pyarrow.parquet.read_table(file_path).to_pydict()['value'], [u'error', None])
@@ -19,6 +19,10 @@ limitations under the License.
 import os
 os.environ['LOADIMPACT_API_V3_TOKEN'] = 'token'
 
+import gzip
+import json
+import shutil
+import tempfile
 import unittest
 from collections import namedtuple
 
@@ -26,11 +30,18 @@ from click.testing import CliRunner
 from loadimpactcli import metric_commands
 from loadimpactcli.util import Metric
 
+from .helpers import Result
+
 try:
     from unittest.mock import MagicMock
 except ImportError:
     from mock import MagicMock
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 TestRunResultId = namedtuple('TestRunResultId', ['type', 'ids', 'results_type_code_to_text'])
 MetricRepresentation = namedtuple('MetricRepresentation', ['full', 'raw', 'as_param', 'args'])
@@ -90,6 +101,39 @@ class TestMetric(unittest.TestCase):
         self.assertEqual(output[2], 'result_id_1_2\t-\ttext_for_type_1')
         self.assertEqual(output[3], 'result_id_2_1\t-\ttext_for_type_2')
 
+    def test_list_metric_match(self):
+        """
+        Test "test metric" filtering the metrics by name.
+        """
+        client = metric_commands.client
+        client.list_test_run_result_ids = MagicMock(return_value=self.result_ids)
+
+        result = self.runner.invoke(metric_commands.list_metrics, ['1', '--match', 'result_id_*_1'])
+        self.assertEqual(result.output.splitlines()[1:], ['result_id_1_1\t-\ttext_for_type_1',
+                                                          'result_id_2_1\t-\ttext_for_type_2'])
+
+        result = self.runner.invoke(metric_commands.list_metrics, ['1', '--match', '_2$', '--match', '^x',
+                                                                   '--regex'])
+        self.assertEqual(result.output.splitlines()[1:], ['result_id_1_2\t-\ttext_for_type_1'])
+
+        result = self.runner.invoke(metric_commands.list_metrics, ['1', '--match', '(', '--regex'])
+        self.assertEqual(result.exit_code, 2)
+
+    def test_list_metric_sort_limit(self):
+        """
+        Test "test metric" sorting and limiting the metrics.
+        """
+        client = metric_commands.client
+        client.list_test_run_result_ids = MagicMock(return_value=[
+            TestRunResultId(2, {'b': '', 'a': ''}, self._results_type_code_to_text),
+            TestRunResultId(1, {'d': '', 'c': ''}, self._results_type_code_to_text)])
+
+        result = self.runner.invoke(metric_commands.list_metrics, ['1', '--limit', '3'])
+        self.assertEqual([line.split('\t')[0] for line in result.output.splitlines()[1:]], ['b', 'a', 'd'])
+
+        result = self.runner.invoke(metric_commands.list_metrics, ['1', '--sort'])
+        self.assertEqual([line.split('\t')[0] for line in result.output.splitlines()[1:]], ['c', 'd', 'a', 'b'])
+
     def test_list_metric_invalid_type(self):
         """
         Test "test metric" specifying an invalid metric type.
@@ -173,3 +217,108 @@ class TestMetric(unittest.TestCase):
         expected_metric_4 = MetricRepresentation(u'foöbår:0:ßåŕ', u'foöbår', '-', ['0', u'ßåŕ'])
         metric_4 = Metric.from_raw(expected_metric_4.full)
         self._assertExpectedMetric(expected_metric_4, metric_4)
+
+    def test_interned_metric(self):
+        """
+        Test that parsing equal metrics returns the same object.
+        """
+        metric_1 = Metric.from_raw('__li_url_abc:1:225:200:GET')
+        self.assertIs(Metric.from_raw('__li_url_abc:1:225:200:GET|1:2'), metric_1)
+        self.assertIs(Metric.from_raw('bandwidth'), Metric.from_raw('__li_bandwidth:1'))
+        self.assertEqual(metric_1.str_ui(True), u'url [1 225 200 GET]')
+
+        # Metrics can be used as keys, and created directly.
+        self.assertEqual({metric_1: 1}[Metric(metric_1.metric_type, ['1', '225', '200', 'GET'])], 1)
+        self.assertFalse(hasattr(metric_1, '__dict__'))
+
+
+class TestMetricExport(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = CliRunner()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, 'export.csv.gz')
+
+        def list_test_run_results(test_run_id, data):
+            name, offset = data['ids'].rsplit('|', 1)
+            if offset != '-1':
+                return []
+            return [Result(name, 1, [{'timestamp': 1483326245000000, 'data': {'value': 1}},
+                                     {'timestamp': 1483326248000000, 'data': {'value': 2}}])]
+
+        metric_commands.client.list_test_run_results = MagicMock(side_effect=list_test_run_results)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read_export(self):
+        with gzip.open(self.file_path, 'rb') as f:
+            return f.read().decode('utf-8').splitlines()
+
+    def test_export_metrics(self):
+        result = self.runner.invoke(metric_commands.export_metrics, ['1', '--metric', 'user_load_time',
+                                                                     '--raw_metric', '__li_url_abc:1:225:200:GET',
+                                                                     '--file_name', self.file_path])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output, u'Exported 4 points of 2 metrics to {0}\n'.format(self.file_path))
+        lines = self._read_export()
+        self.assertEqual(len(lines), 1 + 4)
+        self.assertEqual(lines[1], u'__li_user_load_time:1,2017-01-02T03:04:05Z,1')
+        self.assertEqual(lines[3], u'__li_url_abc:1:225:200:GET,2017-01-02T03:04:05Z,1')
+
+    def test_export_all_metrics(self):
+        metric_commands.client.list_test_run_result_ids = MagicMock(return_value=[
+            TestRunResultId(1, {'__li_clients_active:1': '', '__li_bandwidth:1': ''}, None)])
+        result = self.runner.invoke(metric_commands.export_metrics, ['1', '--type', 'common',
+                                                                     '--file_name', self.file_path])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(metric_commands.client.list_test_run_result_ids.call_args[1], {'data': {'types': '1'}})
+        self.assertEqual([line.split(',')[0] for line in self._read_export()[1:]],
+                         ['__li_bandwidth:1'] * 2 + ['__li_clients_active:1'] * 2)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_metric_stats(self):
+        result = self.runner.invoke(metric_commands.metric_stats, ['1', '--metric', 'user_load_time', '--output',
+                                                                   'json'])
+
+        self.assertEqual(result.exit_code, 0)
+        stats = json.loads(result.output)
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['metric'], '__li_user_load_time:1')
+        self.assertEqual(stats[0]['count'], 2)
+        self.assertEqual(stats[0]['mean'], 1.5)
+        self.assertEqual(stats[0]['twa'], 1)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_metric_stats_table(self):
+        result = self.runner.invoke(metric_commands.metric_stats, ['1', '--metric', 'user_load_time',
+                                                                   '--full_width'])
+
+        output = result.output.splitlines()
+        self.assertEqual(output[0].split('\t'), ['METRIC:', 'COUNT:', 'MIN:', 'MEAN:', 'STDDEV:', 'TWA:', 'P50:',
+                                                 'P90:', 'P95:', 'P99:', 'MAX:'])
+        self.assertEqual(output[1].split('\t')[:4], ['__li_user_load_time:1', '2', '1', '1.5'])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_export_store_and_query(self):
+        os.environ['LOADIMPACT_RESULTS_DB'] = os.path.join(self.tmp_dir, 'results.db')
+        try:
+            for test_run_id in ('1', '2'):
+                result = self.runner.invoke(metric_commands.export_metrics, [
+                    test_run_id, '--metric', 'user_load_time', '--file_name', self.file_path, '--store',
+                    '--test_id', '10'])
+                self.assertEqual(result.exit_code, 0)
+                self.assertIn(u'Saved 2 points to the local results database', result.output)
+
+            result = self.runner.invoke(metric_commands.query_metrics, ['--test_id', '10', '--last', '5',
+                                                                        '--stat', 'p95', '--stat', 'count',
+                                                                        '--output', 'csv'])
+        finally:
+            del os.environ['LOADIMPACT_RESULTS_DB']
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output.splitlines(), ['test_run_id,metric,count,p95',
+                                                      '2,__li_user_load_time:1,2,1.95',
+                                                      '1,__li_user_load_time:1,2,1.95'])
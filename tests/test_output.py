@@ -0,0 +1,96 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import io
+import json
+import unittest
+from collections import namedtuple
+from datetime import datetime
+
+from loadimpactcli.output import CSVWriter, NDJSONWriter, ResultWriter, TSVWriter
+from loadimpactcli.util import Metric
+
+try:
+    from unittest.mock import MagicMock
+except ImportError:
+    from mock import MagicMock
+
+StreamData = namedtuple('StreamData', ['timestamp', 'value'])
+
+
+class TestResultWriters(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = [Metric.from_raw('clients_active'), Metric.from_raw(u'foöbår:1')]
+        self.timestamp = datetime(2017, 1, 2, 3, 4, 5)
+        self.data = {'__li_clients_active:1': [StreamData(self.timestamp, 1.0 / 3)]}
+
+    def _write(self, writer_class, *frames, **kwargs):
+        f = io.StringIO()
+        writer = writer_class(f, self.metrics, **kwargs)
+        writer.write_header()
+        for frame in frames:
+            writer.write(frame)
+        return f.getvalue()
+
+    def test_ndjson(self):
+        data = dict(self.data)
+        data[u'foöbår:1'] = [StreamData(datetime(2017, 1, 2, 3, 4, 5, 250000), None)]
+        output = self._write(NDJSONWriter, data, {})
+        self.assertEqual([json.loads(line) for line in output.splitlines()], [
+            {'metric': '__li_clients_active:1', 'timestamp': '2017-01-02T03:04:05', 'value': 1.0 / 3},
+            {'metric': u'foöbår:1', 'timestamp': '2017-01-02T03:04:05.250000', 'value': None},
+        ])
+
+    def test_csv(self):
+        data = dict(self.data)
+        data[u'foöbår:1'] = [StreamData(self.timestamp, u'a,"b"')]
+        output = self._write(CSVWriter, data)
+        self.assertEqual(output.splitlines(), [
+            u'metric,timestamp,value',
+            u'__li_clients_active:1,2017-01-02T03:04:05,{0!r}'.format(1.0 / 3),
+            u'foöbår:1,2017-01-02T03:04:05,"a,""b"""',
+        ])
+
+    def test_tsv(self):
+        output = self._write(TSVWriter, self.data)
+        self.assertEqual(output.splitlines(), [
+            u'metric\ttimestamp\tvalue',
+            u'__li_clients_active:1\t2017-01-02T03:04:05\t{0!r}'.format(1.0 / 3),
+        ])
+
+    def test_several_points(self):
+        data = {'__li_clients_active:1': [StreamData(self.timestamp, 1), StreamData(datetime(2017, 1, 2, 3, 4, 8), 2)]}
+        output = self._write(TSVWriter, data)
+        self.assertEqual(output.splitlines(), [
+            u'metric\ttimestamp\tvalue',
+            u'__li_clients_active:1\t2017-01-02T03:04:05\t1',
+            u'__li_clients_active:1\t2017-01-02T03:04:08\t2',
+        ])
+
+    def test_flush(self):
+        f = MagicMock()
+        writer = TSVWriter(f, self.metrics)
+        writer.write(self.data)
+        f.flush.assert_not_called()
+
+        writer = TSVWriter(f, self.metrics, flush=True)
+        writer.write(self.data)
+        writer.write({})
+        f.flush.assert_called_once_with()
+
+    def test_abstract(self):
+        self.assertRaises(TypeError, ResultWriter, io.StringIO(), self.metrics)
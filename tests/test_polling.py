@@ -0,0 +1,78 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+from itertools import islice
+
+from loadimpactcli.errors import PollTimeoutError
+from loadimpactcli.polling import backoff_intervals, poll
+
+
+class FakeClock(object):
+    """
+    Clock advanced by calls to `sleep()`, recording the sleeps.
+    """
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestPolling(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def _poll(self, check, **kwargs):
+        return poll(check, sleep=self.clock.sleep, clock=self.clock.time, **kwargs)
+
+    def test_backoff_intervals(self):
+        intervals = list(islice(backoff_intervals(1, 10, 2, jitter=0), 6))
+        self.assertEqual(intervals, [1, 2, 4, 8, 10, 10])
+
+        for interval in islice(backoff_intervals(1, 10, 2, jitter=0.5), 10, 100):
+            self.assertTrue(5 <= interval <= 10)
+
+    def test_poll(self):
+        results = iter([False, None, False, 'done'])
+        result = self._poll(lambda: next(results), initial_interval=1, max_interval=3, jitter=0)
+
+        self.assertEqual(result, 'done')
+        self.assertEqual(self.clock.sleeps, [1, 2, 3])
+
+    def test_poll_no_wait_when_done(self):
+        self.assertTrue(self._poll(lambda: True))
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_poll_timeout(self):
+        calls = []
+
+        def check():
+            calls.append(self.clock.time())
+            return False
+
+        with self.assertRaises(PollTimeoutError):
+            self._poll(check, timeout=10, initial_interval=1, max_interval=4, jitter=0)
+
+        # Checked one last time at the deadline.
+        self.assertEqual(self.clock.sleeps, [1, 2, 4, 3])
+        self.assertEqual(calls[-1], 1010.0)
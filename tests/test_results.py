@@ -0,0 +1,89 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import re
+import unittest
+from datetime import datetime
+
+from loadimpactcli.results import fetch_all_series, fetch_series, timestamp_to_datetime
+
+from .helpers import Result
+
+
+class MockResultsClient(object):
+    """
+    Client serving the results of several metrics, `page_size` points per
+    request starting after the requested offset.
+    """
+    def __init__(self, series, page_size=3):
+        self.series = series
+        self.page_size = page_size
+        self.requests = []
+
+    def list_test_run_results(self, test_run_id, data):
+        name, offset = re.match(r'^(.*)\|(-?\d+)$', data['ids']).groups()
+        self.requests.append((name, int(offset)))
+        points = self.series.get(name, [])[int(offset) + 1:int(offset) + 1 + self.page_size]
+        if not points:
+            return []
+        return [Result(name, int(offset) + len(points),
+                       [{'timestamp': t, 'data': {'value': v}} for t, v in points])]
+
+
+class TestResults(unittest.TestCase):
+
+    def setUp(self):
+        self.series = {
+            'a': [(1000000 * i, float(i)) for i in range(10)],
+            'b': [(1000000 * i, i * 2) for i in range(2)],
+        }
+
+    def test_fetch_series_pages(self):
+        client = MockResultsClient(self.series, page_size=3)
+        series = fetch_series(client, 1, 'a')
+
+        self.assertEqual(series.timestamps, [t for t, _ in self.series['a']])
+        self.assertEqual(series.values, [v for _, v in self.series['a']])
+        self.assertEqual(client.requests, [('a', -1), ('a', 2), ('a', 5), ('a', 8), ('a', 9)])
+
+    def test_fetch_series_overlapping_pages(self):
+        """
+        Test that points returned again in a later page are skipped.
+        """
+        client = MockResultsClient(self.series, page_size=3)
+        list_results = client.list_test_run_results
+
+        def overlapping(test_run_id, data):
+            results = list_results(test_run_id, data)
+            if client.requests[-1][1] >= 0:
+                previous = self.series['a'][client.requests[-1][1]]
+                results = [r._replace(data=[{'timestamp': previous[0], 'data': {'value': previous[1]}}] + r.data)
+                           for r in results]
+            return results
+
+        client.list_test_run_results = overlapping
+        self.assertEqual(fetch_series(client, 1, 'a').values, [v for _, v in self.series['a']])
+
+    def test_fetch_all_series(self):
+        client = MockResultsClient(self.series)
+        all_series = fetch_all_series(client, 1, ['b', 'a', 'c'], concurrency=3)
+
+        self.assertEqual(list(all_series.keys()), ['b', 'a', 'c'])
+        self.assertEqual(all_series['b'].values, [0, 2])
+        self.assertEqual(all_series['c'].timestamps, [])
+
+    def test_timestamp_to_datetime(self):
+        self.assertEqual(timestamp_to_datetime(1483326245000001), datetime(2017, 1, 2, 3, 4, 5, 1))
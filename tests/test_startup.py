@@ -0,0 +1,116 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from loadimpactcli import organization_commands, userscenario_commands
+
+# Modules that should not be imported unless a command that needs them is run.
+HEAVY_MODULES = ['requests', 'loadimpact3', 'tzlocal']
+
+# Generous upper bound (in seconds) for importing the CLI and displaying the
+# help, measured without the startup of the interpreter, in order to detect
+# regressions such as importing every command module eagerly.
+MAX_STARTUP_TIME = 1.0
+
+# The scripts print the heavy modules imported and the time it took.
+STARTUP_SCRIPT = """
+import json
+import sys
+import time
+start = time.time()
+from loadimpactcli.loadimpact_cli import cli
+try:
+    cli(sys.argv[1:], prog_name='loadimpact')
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps([[m for m in {0} if m in sys.modules], time.time() - start]))
+""".format(HEAVY_MODULES)
+
+IMPORT_SCRIPT = """
+import json
+import sys
+import time
+start = time.time()
+import loadimpactcli
+sys.stderr.write(json.dumps([[m for m in {0} if m in sys.modules], time.time() - start]))
+""".format(HEAVY_MODULES)
+
+
+class TestStartup(unittest.TestCase):
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.env = dict(os.environ)
+        self.env.pop('LOADIMPACT_API_V3_TOKEN', None)
+        self.env['HOME'] = self.home
+        self.env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def tearDown(self):
+        shutil.rmtree(self.home)
+
+    def _run(self, script, *args):
+        """
+        Run `script` in a new interpreter, returning the heavy modules that
+        were imported and the time it took.
+        """
+        with open(os.devnull, 'r') as devnull:
+            process = subprocess.Popen([sys.executable, '-c', script] + list(args),
+                                       stdin=devnull, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       env=self.env)
+            _, err = process.communicate()
+        return json.loads(err.decode('utf-8').splitlines()[-1])
+
+    def test_help_and_version(self):
+        """
+        Test that the help and version can be displayed without importing the
+        network libraries, reading the config or prompting for a token.
+        """
+        for args in (['--help'], ['--version'], []):
+            self.assertEqual(self._run(STARTUP_SCRIPT, *args)[0], [])
+            self.assertEqual(os.listdir(self.home), [])
+
+    def test_startup_time(self):
+        """
+        Benchmark the time needed for displaying the help.
+        """
+        elapsed = min(self._run(STARTUP_SCRIPT, '--help')[1] for _ in range(3))
+        self.assertLess(elapsed, MAX_STARTUP_TIME)
+
+    def test_import_package(self):
+        """
+        Test that importing the package does not import the command modules
+        and their dependencies.
+        """
+        self.assertEqual(self._run(IMPORT_SCRIPT)[0], [])
+        self.assertEqual(os.listdir(self.home), [])
+
+    def test_lazy_exports(self):
+        """
+        Test that the names of the command modules previously exported by
+        the package can still be imported from it.
+        """
+        from loadimpactcli import create_scenario, list_organizations
+        self.assertIs(create_scenario, userscenario_commands.create_scenario)
+        self.assertIs(list_organizations, organization_commands.list_organizations)
+        with self.assertRaises(ImportError):
+            from loadimpactcli import no_such_name
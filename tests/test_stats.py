@@ -0,0 +1,82 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+
+from loadimpactcli.results import Series
+from loadimpactcli.stats import STATS, compare_series, mann_whitney_u, series_origin, series_stats
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestStats(unittest.TestCase):
+
+    def test_series_stats(self):
+        # Values 1..100, one per second except a burst of points for the last
+        # ones: the time-weighted average discounts them.
+        timestamps = [i * 10 ** 6 for i in range(90)] + [90 * 10 ** 6 + i for i in range(10)]
+        stats = series_stats(Series(timestamps, list(range(1, 101))))
+
+        self.assertEqual(list(stats.keys()), list(STATS))
+        self.assertEqual(stats['count'], 100)
+        self.assertEqual(stats['min'], 1)
+        self.assertEqual(stats['max'], 100)
+        self.assertAlmostEqual(stats['mean'], 50.5)
+        self.assertAlmostEqual(stats['stddev'], 28.86607, places=5)
+        self.assertAlmostEqual(stats['p50'], 50.5)
+        self.assertAlmostEqual(stats['p90'], 90.1)
+        self.assertAlmostEqual(stats['p99'], 99.01)
+        self.assertAlmostEqual(stats['twa'], 45.5, places=3)
+
+    def test_missing_and_single_values(self):
+        stats = series_stats(Series([0, 10 ** 6], [None, 4.0]))
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(stats['twa'], 4.0)
+        self.assertEqual(stats['p99'], 4.0)
+
+    def test_empty_and_non_numeric(self):
+        stats = series_stats(Series([], []))
+        self.assertEqual(stats['count'], 0)
+        self.assertIsNone(stats['mean'])
+
+        self.assertIsNone(series_stats(Series([0], [u'error message'])))
+
+    def test_mann_whitney_u(self):
+        u, p_value = mann_whitney_u(numpy.array([1.1, 2.3, 3.3, 4.0, 5.5, 2.0, 3.1]),
+                                    numpy.array([3.0, 4.5, 6.1, 7.2, 8.8, 5.0, 6.6, 4.4]))
+        self.assertEqual(u, 7.0)
+        self.assertAlmostEqual(p_value, 0.01767, places=5)
+
+        # Identical samples.
+        self.assertEqual(mann_whitney_u(numpy.array([2.0, 2.0]), numpy.array([2.0, 2.0])), (2.0, 1.0))
+
+    def test_compare_series(self):
+        # The second run starts 1000 seconds later and lasts longer: only its
+        # first 10 seconds are compared.
+        series_a = Series([i * 10 ** 6 for i in range(10)], [100.0 + i % 3 for i in range(10)])
+        series_b = Series([(1000 + i) * 10 ** 6 for i in range(20)], [120.0 + i % 3 for i in range(10)] + [0.0] * 10)
+        comparison = compare_series(series_a, series_b, series_origin([series_a]), series_origin([series_b]))
+
+        self.assertEqual(comparison['count_a'], 10)
+        self.assertEqual(comparison['count_b'], 10)
+        self.assertAlmostEqual(comparison['change'], 19.82, places=2)
+        self.assertLess(comparison['p_value'], 0.001)
+
+        self.assertIsNone(compare_series(series_a, Series([0], [u'error message']), 0, 0))
@@ -0,0 +1,80 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from collections import OrderedDict
+
+from loadimpactcli.errors import CLIError
+from loadimpactcli.results import Series
+from loadimpactcli.store import ResultStore
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = ResultStore(os.path.join(self.tmp_dir, 'LoadImpact', 'results.db'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_save_load_series(self):
+        points = self.store.save_series(1, OrderedDict([('__li_user_load_time:1', Series([20, 10], [2.5, 1.0])),
+                                                        ('__li_log:1', Series([10], [u'message']))]))
+        self.assertEqual(points, 3)
+        self.assertEqual(self.store.load_series(1, '__li_user_load_time:1'), Series([10, 20], [1.0, 2.5]))
+        self.assertEqual(self.store.load_series(1, '__li_log:1'), Series([10], [u'message']))
+        self.assertEqual(self.store.metric_names(1), ['__li_log:1', '__li_user_load_time:1'])
+
+        # Saving the same points again replaces them.
+        self.store.save_series(1, {'__li_user_load_time:1': Series([20, 30], [3.0, 4.0])})
+        self.assertEqual(self.store.load_series(1, '__li_user_load_time:1'), Series([10, 20, 30], [1.0, 3.0, 4.0]))
+        self.assertEqual(self.store.load_series(2, '__li_user_load_time:1'), Series([], []))
+
+    def test_test_runs(self):
+        for test_run_id in (3, 1, 2):
+            self.store.save_test_run(test_run_id, test_id=10, status=3)
+        self.store.save_test_run(4, test_id=11)
+        # Fields not given are kept.
+        self.store.save_test_run(3, status=12)
+        self.store.save_series(5, {})
+
+        self.assertEqual(self.store.last_test_run_ids(10, 2), [3, 2])
+        self.assertEqual(self.store.last_test_run_ids('11', 2), [4])
+        self.assertEqual(self.store.test_run_ids(), [5, 4, 3, 2, 1])
+        self.assertEqual(self.store.connection.execute('SELECT test_id, status FROM test_runs WHERE id = 3').fetchone(),
+                         (10, 12))
+
+    def test_database_errors(self):
+        self.assertRaises(CLIError, self.store.save_series, 1, {'__li_log:1': Series([10], [{'not': 'bindable'}])})
+        self.assertRaises(CLIError, self.store.save_series, 1, {'__li_clients_active:1': Series([10], [2 ** 70])})
+        # Nothing was saved by the failed calls.
+        self.assertEqual(self.store.test_run_ids(), [])
+
+        # Locked by another connection writing to it.
+        other = ResultStore(self.store.path)
+        other.connection.execute('BEGIN EXCLUSIVE')
+        self.store.close()
+        self.store._connection = sqlite3.connect(self.store.path, timeout=0)
+        try:
+            self.assertRaises(CLIError, self.store.load_series, 1, '__li_log:1')
+        finally:
+            other.close()
@@ -0,0 +1,142 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import io
+import sys
+import unittest
+
+from loadimpact3.exceptions import ServerError
+from loadimpactcli.output import TSVWriter
+from loadimpactcli.streaming import FrameQueue, ResultStreamer
+from loadimpactcli.util import Metric
+
+from .helpers import Result
+
+try:
+    from unittest.mock import MagicMock
+except ImportError:
+    from mock import MagicMock
+
+
+def result(sid, offset, value):
+    return Result(sid, offset, [{'timestamp': 1483326240000000 + offset, 'data': {'value': value}}])
+
+
+class TestFrameQueue(unittest.TestCase):
+
+    def test_coalesce(self):
+        """
+        Test that frames are merged into the last one once the queue is full.
+        """
+        frames = FrameQueue(maxsize=2)
+        frames.put({'a': 1})
+        frames.put({'a': 2, 'b': 2})
+        frames.put({'a': 3})
+        frames.put({'c': 4})
+        frames.close()
+
+        self.assertEqual(list(frames), [{'a': 1}, {'a': 3, 'b': 2, 'c': 4}])
+        self.assertEqual(frames.coalesced, 2)
+
+    def test_unbounded(self):
+        frames = FrameQueue(maxsize=None)
+        for i in range(20):
+            frames.put({'a': i})
+        frames.close()
+
+        self.assertEqual(list(frames), [{'a': i} for i in range(20)])
+        self.assertEqual(frames.coalesced, 0)
+
+    def test_error(self):
+        frames = FrameQueue()
+        frames.put({'a': 1})
+        try:
+            raise ValueError('error')
+        except ValueError:
+            frames.close(sys.exc_info())
+
+        iterator = iter(frames)
+        self.assertEqual(next(iterator), {'a': 1})
+        self.assertRaises(ValueError, next, iterator)
+
+
+class TestResultStreamer(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.test_run = MagicMock(id=1)
+        self.test_run.is_done = MagicMock(side_effect=[False, True])
+
+    def test_stream(self):
+        self.client.list_test_run_results = MagicMock(side_effect=[
+            [],
+            [result('a', 0, 10), result('b', 0, 20)],
+            [result('a', 1, 11), result('a', 1, 11)],
+            [], [], [], []])
+
+        streamer = ResultStreamer(self.client, self.test_run, ['a', 'b'], poll_rate=0)
+        frames = [dict((k, p.value) for k, p in frame.items()) for frame in streamer]
+
+        self.assertEqual(frames, [{'a': 10, 'b': 20}, {'a': 11}])
+        # The offsets of the last results are sent, and the status is only
+        # requested after polls without new results.
+        self.assertEqual(self.client.list_test_run_results.call_args_list[2][0], (1, {'ids': 'a|0,b|0'}))
+        self.assertEqual(self.client.list_test_run_results.call_args_list[3][0], (1, {'ids': 'a|1,b|0'}))
+        self.assertEqual(self.test_run.is_done.call_count, 2)
+        self.assertEqual(self.client.list_test_run_results.call_count, 6)
+
+    def test_all_points(self):
+        """
+        Test that every point is written when the writer falls behind the
+        polling.
+        """
+        def points(sid, offset, values):
+            return Result(sid, offset, [{'timestamp': 1483326240000000 + i * 1000000, 'data': {'value': v}}
+                                        for i, v in enumerate(values, offset * 10)])
+
+        polls = [[points('__li_clients_active:1', 0, [1, 2, 3]), points('__li_user_load_time:1', 0, [4, 5])],
+                 [points('__li_clients_active:1', 1, [6, 7])],
+                 [points('__li_user_load_time:1', 1, [8])]]
+        names = ['__li_clients_active:1', '__li_user_load_time:1']
+
+        # Without `all_points` only the latest point of each metric is kept.
+        for all_points, expected in ((True, [1, 2, 3, 4, 5, 6, 7, 8]), (False, [7, 8])):
+            self.client.list_test_run_results = MagicMock(side_effect=polls + [[]] * 4)
+            self.test_run.is_done = MagicMock(return_value=True)
+            streamer = ResultStreamer(self.client, self.test_run, names, poll_rate=0, max_pending=1,
+                                      all_points=all_points)
+            # Let the polling finish before writing anything.
+            streamer.start()
+            streamer._thread.join()
+
+            f = io.StringIO()
+            if all_points:
+                writer = TSVWriter(f, [Metric.from_raw(name) for name in names])
+                for frame in streamer:
+                    writer.write(frame)
+                values = [int(line.split('\t')[2]) for line in f.getvalue().splitlines()]
+            else:
+                values = [point.value for frame in streamer for point in frame.values()]
+            self.assertEqual(sorted(values), expected)
+
+    def test_api_errors(self):
+        self.client.list_test_run_results = MagicMock(side_effect=ServerError('error'))
+
+        streamer = ResultStreamer(self.client, self.test_run, ['a'], poll_rate=0)
+        self.assertEqual(list(streamer), [])
+
+        streamer = ResultStreamer(self.client, self.test_run, ['a'], poll_rate=0, raise_api_errors=True)
+        self.assertRaises(ServerError, list, streamer)
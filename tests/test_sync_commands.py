@@ -0,0 +1,137 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+# Without this the config will prompt for a token
+import os
+os.environ['LOADIMPACT_API_V3_TOKEN'] = 'token'
+
+import shutil
+import tempfile
+import unittest
+from collections import namedtuple
+
+from click.testing import CliRunner
+from loadimpact3.exceptions import NotFoundError
+from loadimpactcli import sync_commands
+from loadimpactcli.store import open_store
+from loadimpactcli.util import TestRunStatus
+
+from .helpers import Result
+
+try:
+    from unittest.mock import MagicMock
+except ImportError:
+    from mock import MagicMock
+
+
+Test = namedtuple('Test', ['id', 'last_test_run_id'])
+TestRun = namedtuple('TestRun', ['id', 'queued', 'status'])
+
+
+class TestSync(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = CliRunner()
+        self.tmp_dir = tempfile.mkdtemp()
+        os.environ['LOADIMPACT_RESULTS_DB'] = os.path.join(self.tmp_dir, 'results.db')
+
+        self.tests = {1: [Test(10, 100), Test(11, 102), Test(12, None)], 2: [Test(20, 101)]}
+        self.test_runs = {10: [100], 11: [102], 20: [101]}
+        self.statuses = {100: TestRunStatus.STATUS_FINISHED.value, 101: TestRunStatus.STATUS_FAILED_THRESHOLD.value,
+                         102: TestRunStatus.STATUS_RUNNING.value}
+
+        def list_test_run_results(test_run_id, data):
+            name, offset = data['ids'].split('|')
+            if offset != '-1':
+                return []
+            return [Result(name, 0, [{'timestamp': 1483326240000000, 'data': {'value': float(test_run_id)}}])]
+
+        client = sync_commands.client
+        client.list_tests = MagicMock(side_effect=lambda project_id: self.tests[int(project_id)])
+        client.list_test_runs = MagicMock(side_effect=lambda test_id: [
+            TestRun(id_, None, self.statuses[id_]) for id_ in self.test_runs[test_id]])
+        client.list_test_run_results = MagicMock(side_effect=list_test_run_results)
+
+    def tearDown(self):
+        del os.environ['LOADIMPACT_RESULTS_DB']
+        shutil.rmtree(self.tmp_dir)
+
+    def _sync(self, *args):
+        return self.runner.invoke(sync_commands.sync, ['--project_id', '1', '--project_id', '2',
+                                                       '--metric', 'user_load_time'] + list(args))
+
+    def test_sync(self):
+        result = self._sync()
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output, u'Project 1: 1 new test run(s) saved, 1 still running\n'
+                                        u'Project 2: 1 new test run(s) saved\n')
+
+        with open_store() as store:
+            self.assertEqual(store.last_test_run_ids(10, 5), [100])
+            self.assertEqual(store.load_series(101, '__li_user_load_time:1').values, [101.0])
+            # The mark of project 1 stays below the running test run.
+            self.assertEqual(store.get_sync_mark(1), 100)
+            self.assertEqual(store.get_sync_mark(2), 101)
+
+        # Only the test with the test run that was running is listed again.
+        sync_commands.client.list_test_runs.reset_mock()
+        self.statuses[102] = TestRunStatus.STATUS_FINISHED.value
+        result = self._sync()
+        self.assertEqual(result.output, u'Project 1: 1 new test run(s) saved\nProject 2: 0 new test run(s) saved\n')
+        self.assertEqual([c[0][0] for c in sync_commands.client.list_test_runs.call_args_list], [11])
+
+        sync_commands.client.list_test_runs.reset_mock()
+        self._sync()
+        self.assertEqual(sync_commands.client.list_test_runs.call_count, 0)
+        with open_store() as store:
+            self.assertEqual(store.get_sync_mark(1), 102)
+
+    def test_sync_several_new_test_runs(self):
+        self._sync()
+
+        # Test 10 runs twice and test 11 (still running) runs again before
+        # the next sync.
+        self.tests[1] = [Test(10, 104), Test(11, 105), Test(12, None)]
+        self.test_runs[10] = [100, 103, 104]
+        self.test_runs[11] = [102, 105]
+        self.statuses.update({103: TestRunStatus.STATUS_FINISHED.value, 104: TestRunStatus.STATUS_FINISHED.value,
+                              105: TestRunStatus.STATUS_FINISHED.value})
+        result = self._sync()
+        self.assertEqual(result.output, u'Project 1: 3 new test run(s) saved, 1 still running\n'
+                                        u'Project 2: 0 new test run(s) saved\n')
+        with open_store() as store:
+            self.assertEqual(store.last_test_run_ids(10, 5), [104, 103, 100])
+            self.assertEqual(store.last_test_run_ids(11, 5), [105])
+            self.assertEqual(store.get_sync_mark(1), 101)
+
+        self.statuses[102] = TestRunStatus.STATUS_FINISHED.value
+        self._sync()
+        with open_store() as store:
+            self.assertEqual(store.last_test_run_ids(11, 5), [105, 102])
+            self.assertEqual(store.get_sync_mark(1), 105)
+
+    def test_sync_error(self):
+        def list_tests(project_id):
+            if project_id == '1':
+                raise NotFoundError('Not found')
+            return self.tests[int(project_id)]
+
+        sync_commands.client.list_tests = MagicMock(side_effect=list_tests)
+        result = self._sync()
+
+        self.assertEqual(result.exit_code, 1)
+        self.assertEqual(result.output, u'Project 1 could not be synced: Not found\n'
+                                        u'Project 2: 1 new test run(s) saved\n')
@@ -19,18 +19,33 @@ limitations under the License.
 import os
 os.environ['LOADIMPACT_API_V3_TOKEN'] = 'token'
 
+import json
+import shutil
+import tempfile
 import unittest
 from collections import namedtuple
 from datetime import datetime
+from time import sleep
 
+import click
 from click.testing import CliRunner
-from loadimpactcli import test_commands
-from loadimpactcli.util import Metric, ColumnFormatter
+from loadimpact3.exceptions import NotFoundError
+from loadimpactcli import streaming, test_commands
+from loadimpactcli.errors import CLIError
+from loadimpactcli.store import open_store
+from loadimpactcli.util import Metric, ColumnFormatter, TestRunStatus
+
+from .helpers import Result, mocked_test, mocked_test_run
+
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
 
 try:
-    from unittest.mock import MagicMock
+    import numpy
 except ImportError:
-    from mock import MagicMock
+    numpy = None
 
 
 Test = namedtuple('Test', ['id', 'name', 'last_test_run_id', 'config'])
@@ -136,6 +151,71 @@ class TestTestsList(unittest.TestCase):
         output = result.output.split('\n')
         self.assertEqual(len(output), 2 + 1 + 1)
 
+    def test_list_tests_concurrency(self):
+        """
+        Test "test list" fetching the last runs concurrently: the output order
+        is kept regardless of the order in which the runs are retrieved.
+        """
+        def get_test_run(test_run_id):
+            # Make the first requested runs the slowest ones to be returned.
+            sleep((test_run_id - 10000) * 0.01)
+            return TestRun(test_run_id, datetime.now(), 3, 'status')
+
+        client = test_commands.client
+
+        # Setup mockers.
+        client.list_tests = MagicMock(return_value=self.tests)
+        client.get_test_run = MagicMock(side_effect=get_test_run)
+
+        for concurrency in ('1', '3'):
+            client.get_test_run.reset_mock()
+            result = self.runner.invoke(test_commands.list_tests, ['--project_id', '1', '--full_width',
+                                                                   '--concurrency', concurrency])
+
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(client.get_test_run.call_count, 3)
+            output = result.output.split('\n')
+            self.assertTrue(output[1].startswith('1\tTest1\t'))
+            self.assertTrue(output[2].startswith('2\tTest2\t'))
+            self.assertTrue(output[3].startswith('3\tTest3\t'))
+
+        # Invalid concurrency.
+        result = self.runner.invoke(test_commands.list_tests, ['--project_id', '1', '--concurrency', '0'])
+        self.assertEqual(result.exit_code, 2)
+
+    def test_list_tests_limit_sorting(self):
+        """
+        Test "test list" displaying the tests with the most recent runs first,
+        including tests that have never been run.
+        """
+        client = test_commands.client
+
+        # Setup mockers.
+        client.list_tests = MagicMock(return_value=[Test(1, 'Test1', 10001, ''),
+                                                    Test(2, 'Test2', None, ''),
+                                                    Test(3, 'Test3', 10003, ''),
+                                                    Test(4, 'Test4', 10002, '')])
+        client.get_test_run = MagicMock(return_value=TestRun(1, datetime.now(), 0, 'status'))
+        result = self.runner.invoke(test_commands.list_tests, ['--project_id', '1', '--full_width',
+                                                               '--limit', '2'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(client.get_test_run.call_count, 2)
+        output = result.output.split('\n')
+        self.assertEqual(len(output), 2 + 2 + 1)
+        self.assertTrue(output[1].startswith('3\tTest3\t'))
+        self.assertTrue(output[2].startswith('4\tTest4\t'))
+        self.assertIn('(out of 4)', output[3])
+
+        # Tests that have never been run are displayed last.
+        client.get_test_run.reset_mock()
+        result = self.runner.invoke(test_commands.list_tests, ['--project_id', '1', '--full_width'])
+
+        self.assertEqual(client.get_test_run.call_count, 3)
+        output = result.output.split('\n')
+        self.assertEqual(len(output), 2 + 4)
+        self.assertTrue(output[4].startswith('2\tTest2\t-\t-\t'))
+
     def test_summarize_valid_config(self):
         config = {u'new_relic_applications': [],
                   u'network_emulation': {u'client': u'li', u'network': u'unlimited'},
@@ -241,30 +321,22 @@ class TestTestsRun(unittest.TestCase):
         """
         Test `test run` with streaming of the results using default metrics.
         """
-        def mocked_stream(*args, **kwargs):
-            """
-            Mimic stream() generator, yielding one row of results.
-            """
-            yield {'__li_clients_active:1': StreamData(datetime.now(), '1.23')}
-
         client = test_commands.client
 
         # Setup mockers.
-        MockedTest = namedtuple('MockedTest',
-                                ['id', 'name', 'last_test_run_id', 'config', 'start_test_run'])
-        MockedTestRun = namedtuple('MockedTestRun',
-                                   ['id', 'queued', 'status', 'status_text', 'result_stream'])
-        mocked_stream = MagicMock(return_value=mocked_stream)
-        test_run = MagicMock(return_value=MockedTestRun(222, datetime.now(), 0, 'status', mocked_stream))
-        test = MockedTest(1, 'Test1', 10001, '', test_run)
+        test = mocked_test(1, mocked_test_run(222, queued=datetime.now()))
         client.get_test = MagicMock(return_value=test)
+        client.list_test_run_results = MagicMock(side_effect=[
+            [Result('__li_clients_active:1', 0, [{'timestamp': 1483326240000000, 'data': {'value': '1.23'}}])],
+            []])
 
-        result = self.runner.invoke(test_commands.run_test, ['1', '--full_width'])
+        with patch.object(streaming, 'POST_POLLS', 0):
+            result = self.runner.invoke(test_commands.run_test, ['1', '--full_width', '--poll_rate', '1'])
 
         # Client and test methods have been called.
         self.assertEqual(client.get_test.call_count, 1)
         self.assertEqual(test.start_test_run.call_count, 1)
-        self.assertEqual(mocked_stream.call_count, 1)
+        self.assertEqual(client.list_test_run_results.call_args[0][0], 222)
 
         # Assertions on the output.
         output = result.output.split('\n')
@@ -272,3 +344,203 @@ class TestTestsRun(unittest.TestCase):
         self.assertEqual(len(output), 6)
         self.assertEqual(len(output[-2].split('\t')), 6)
         self.assertEqual(output[-2].split('\t')[1], '1.23')
+
+    def test_run_streaming_ndjson(self):
+        """
+        Test `test run` writing the results as NDJSON to stdout.
+        """
+        client = test_commands.client
+        client.get_test = MagicMock(return_value=mocked_test(1, mocked_test_run(222)))
+        client.list_test_run_results = MagicMock(side_effect=[
+            [Result('__li_clients_active:1', 0, [{'timestamp': 1483326240000000, 'data': {'value': 1.5}}])],
+            []])
+
+        with patch.object(streaming, 'POST_POLLS', 0):
+            result = self.runner.invoke(test_commands.run_test, ['1', '--output', 'ndjson', '--poll_rate', '1'])
+
+        records = [json.loads(line) for line in result.output.splitlines() if line.startswith('{')]
+        self.assertEqual(records, [{'metric': '__li_clients_active:1', 'timestamp': '2017-01-02T03:04:00+00:00',
+                                    'value': 1.5}])
+
+    def test_run_store(self):
+        """
+        Test `test run --store` saving the results once the test run is done.
+        """
+        client = test_commands.client
+        test_run = mocked_test_run(222, TestRunStatus.STATUS_FINISHED.value)
+        client.get_test = MagicMock(return_value=mocked_test(1, test_run))
+
+        def list_test_run_results(test_run_id, data):
+            name, offset = data['ids'].split('|')
+            if offset != '-1':
+                return []
+            return [Result(name, 0, [{'timestamp': 1483326240000000, 'data': {'value': 1.5}}])]
+
+        client.list_test_run_results = MagicMock(side_effect=list_test_run_results)
+
+        tmp_dir = tempfile.mkdtemp()
+        os.environ['LOADIMPACT_RESULTS_DB'] = os.path.join(tmp_dir, 'results.db')
+        try:
+            result = self.runner.invoke(test_commands.run_test, ['1', '--quiet', '--store', '--metric', 'bandwidth'])
+            with open_store() as store:
+                self.assertEqual(store.last_test_run_ids(1, 10), [222])
+                self.assertEqual(store.load_series(222, '__li_bandwidth:1').values, [1.5])
+        finally:
+            del os.environ['LOADIMPACT_RESULTS_DB']
+            shutil.rmtree(tmp_dir)
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Results saved to the local results database', result.output)
+
+    def test_run_store_error(self):
+        """
+        Test `test run --store` reporting the errors of the results database.
+        """
+        client = test_commands.client
+        test_run = mocked_test_run(222, TestRunStatus.STATUS_FINISHED.value)
+        client.get_test = MagicMock(return_value=mocked_test(1, test_run))
+
+        with patch.object(test_commands, 'store_results', side_effect=CLIError('database is locked')):
+            result = self.runner.invoke(test_commands.run_test, ['1', '--quiet', '--store'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertEqual(result.output, 'TEST_RUN_ID:\n222\ndatabase is locked\n')
+
+
+class TestTestsCompare(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = CliRunner()
+
+    def _mock_results(self, values):
+        """
+        Mock `client.list_test_run_results` returning, for each test run id,
+        the `values` of a metric, one per second.
+        """
+        def list_test_run_results(test_run_id, data):
+            name, offset = data['ids'].split('|')
+            if int(offset) >= 0:
+                return []
+            points = [{'timestamp': (int(test_run_id) * 1000 + i) * 10 ** 6, 'data': {'value': v}}
+                      for i, v in enumerate(values[test_run_id])]
+            return [Result(name, 0, points)]
+
+        test_commands.client.list_test_run_results = MagicMock(side_effect=list_test_run_results)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_compare(self):
+        self._mock_results({'1': [100.0, 101.0, 102.0] * 5, '2': [120.0, 121.0, 122.0] * 5})
+        result = self.runner.invoke(test_commands.compare_test_runs,
+                                    ['1', '2', '--metric', 'user_load_time', '--threshold', 'user_load_time=25'])
+
+        self.assertEqual(result.exit_code, 0)
+        output = result.output.splitlines()
+        self.assertEqual(len(output), 2)
+        self.assertEqual(output[1].split()[:4], ['__li_user_load_time:1', '101', '121', '+19.8%'])
+        self.assertEqual(output[1].split()[-1], 'ok')
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_compare_regression(self):
+        self._mock_results({'1': [100.0, 101.0, 102.0] * 5, '2': [120.0, 121.0, 122.0] * 5})
+        result = self.runner.invoke(test_commands.compare_test_runs,
+                                    ['1', '2', '--threshold', '__li_user_load_time:1=10'])
+
+        self.assertEqual(result.exit_code, TestRunStatus.STATUS_FAILED_THRESHOLD.value)
+        self.assertIn('regression', result.output)
+
+        # Not significant at a stricter level.
+        result = self.runner.invoke(test_commands.compare_test_runs,
+                                    ['1', '2', '--threshold', 'user_load_time=10', '--alpha', '0.000001'])
+        self.assertEqual(result.exit_code, 0)
+
+    def test_parse_thresholds(self):
+        self.assertEqual(test_commands.parse_thresholds(['user_load_time=10', 'requests_per_second=-5.5']),
+                         [('__li_user_load_time:1', 10.0), ('__li_requests_per_second:1', -5.5)])
+        with self.assertRaises(click.BadParameter):
+            test_commands.parse_thresholds(['user_load_time'])
+
+    def test_invalid_alpha(self):
+        result = self.runner.invoke(test_commands.compare_test_runs, ['1', '2', '--alpha', '1.5'])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('1.5 is not between 0 and 1', result.output)
+
+
+class TestTestsRunMany(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = CliRunner()
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def _mock_tests(self, statuses):
+        """
+        Mock `client.get_test` returning, for each test id, a test whose run
+        finishes with the status in `statuses` after streaming one row.
+        """
+        def list_test_run_results(test_run_id, data):
+            offsets = dict(rid.split('|') for rid in data['ids'].split(','))
+            if offsets.get('__li_clients_active:1') != '-1':
+                return []
+            return [Result('__li_clients_active:1', 0, [{'timestamp': 1483326240000000, 'data': {'value': '1.23'}}])]
+
+        def get_test(test_id):
+            return mocked_test(int(test_id), mocked_test_run(int(test_id) + 100, statuses[test_id]))
+
+        test_commands.client.get_test = MagicMock(side_effect=get_test)
+        test_commands.client.list_test_run_results = MagicMock(side_effect=list_test_run_results)
+
+    def _run_many(self, *args):
+        with patch.object(streaming, 'POST_POLLS', 0):
+            return self.runner.invoke(test_commands.run_many_tests,
+                                      list(args) + ['--output_dir', self.output_dir, '--poll_rate', '1'])
+
+    def test_run_many(self):
+        self._mock_tests({'1': TestRunStatus.STATUS_FINISHED.value, '2': TestRunStatus.STATUS_FINISHED.value})
+        ids_file = os.path.join(self.output_dir, 'ids.txt')
+        with open(ids_file, 'w') as f:
+            f.write('# Release gate\n2\n\n')
+
+        result = self._run_many('1', '--file', ids_file, '--concurrency', '1')
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(test_commands.client.get_test.call_count, 2)
+        self.assertIn(u'Test 1 started, TEST_RUN_ID: 101', result.output)
+        self.assertIn(u'Test 2 started, TEST_RUN_ID: 102', result.output)
+        self.assertIn(u"Test run 102 (test 2) finished with status 'status 3'", result.output)
+
+        with open(os.path.join(self.output_dir, 'test-1-run-101.tsv')) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0], 'metric\ttimestamp\tvalue')
+        self.assertEqual(lines[1].split('\t')[::2], ['__li_clients_active:1', '1.23'])
+
+    def test_run_many_exit_code(self):
+        """
+        Test that the exit code is the status of the most severe failure.
+        """
+        self._mock_tests({'1': TestRunStatus.STATUS_FAILED_THRESHOLD.value,
+                          '2': TestRunStatus.STATUS_ABORTED_SCRIPT_ERROR.value,
+                          '3': TestRunStatus.STATUS_FINISHED.value})
+        result = self._run_many('1', '2', '3')
+        self.assertEqual(result.exit_code, TestRunStatus.STATUS_ABORTED_SCRIPT_ERROR.value)
+
+    def test_run_many_start_error(self):
+        self._mock_tests({'1': TestRunStatus.STATUS_FINISHED.value})
+        get_test = test_commands.client.get_test.side_effect
+
+        def get_test_or_fail(test_id):
+            if test_id == '2':
+                raise NotFoundError('Not found')
+            return get_test(test_id)
+
+        test_commands.client.get_test.side_effect = get_test_or_fail
+        result = self._run_many('1', '2')
+
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn(u'Test 2 could not be started: Not found', result.output)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, 'test-1-run-101.tsv')))
+
+    def test_run_many_no_ids(self):
+        result = self.runner.invoke(test_commands.run_many_tests, [])
+        self.assertEqual(result.output, 'You need to provide the ids of the tests to run.\n')
@@ -0,0 +1,95 @@
+"""
+Copyright 2018 Load Impact
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from loadimpactcli.upload import BUFFER_SIZE, MultipartStream, hash_file
+
+
+class TestMultipartStream(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, 'datastore.csv')
+        self.content = b''.join(b'row,' + str(i).encode('ascii') + b'\n' for i in range(50000))
+        with open(self.file_path, 'wb') as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _parse(self, stream, body):
+        boundary = stream.content_type.split('boundary=')[1].encode('ascii')
+        parts = body.split(b'--' + boundary)
+        self.assertEqual(parts[0], b'')
+        self.assertEqual(parts[-1], b'--\r\n')
+        result = {}
+        for part in parts[1:-1]:
+            headers, _, value = part[2:-2].partition(b'\r\n\r\n')
+            disposition = headers.split(b'\r\n')[0].decode('utf-8')
+            result[disposition] = value
+        return result
+
+    def test_body(self):
+        progress = []
+        with open(self.file_path, 'rb') as f:
+            stream = MultipartStream({'name': 'Datastore', 'fromline': 1}, 'file', f, progress=progress.append)
+            body = b''.join(stream)
+
+        self.assertEqual(stream.len, len(body))
+        self.assertEqual(self._parse(stream, body), {
+            'Content-Disposition: form-data; name="fromline"': b'1',
+            'Content-Disposition: form-data; name="name"': b'Datastore',
+            'Content-Disposition: form-data; name="file"; filename="datastore.csv"': self.content,
+        })
+        self.assertEqual(sum(progress), len(self.content))
+        self.assertTrue(all(size <= BUFFER_SIZE for size in progress))
+
+    def test_read(self):
+        with open(self.file_path, 'rb') as f:
+            stream = MultipartStream({'name': 'Datastore'}, 'file', f)
+            body = b''.join(iter(lambda: stream.read(1000), b''))
+        self.assertEqual(stream.len, len(body))
+
+    def test_compress(self):
+        with open(self.file_path, 'rb') as f:
+            stream = MultipartStream({}, 'file', f, compress=True)
+            body = b''.join(stream)
+
+        self.assertFalse(hasattr(stream, 'len'))
+        parts = self._parse(stream, body)
+        compressed = parts['Content-Disposition: form-data; name="file"; filename="datastore.csv.gz"']
+        self.assertLess(len(compressed), len(self.content))
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(compressed)).read(), self.content)
+
+    def test_unknown_size(self):
+        stream = MultipartStream({}, 'file', io.BytesIO(self.content), file_name='datastore.csv')
+        self.assertIsNone(stream.file_size)
+        self.assertFalse(hasattr(stream, 'len'))
+        self.assertIn(self.content, b''.join(stream))
+
+    def test_hash_file(self):
+        with open(self.file_path, 'rb') as f:
+            f.read(4)
+            self.assertEqual(hash_file(f, buffer_size=1000), hashlib.sha256(self.content[4:]).hexdigest())
+            self.assertEqual(f.tell(), 4)
+        self.assertIsNone(hash_file(io.BytesIO(self.content)))
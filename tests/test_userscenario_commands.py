@@ -19,22 +19,34 @@ limitations under the License.
 import os
 os.environ['LOADIMPACT_API_V3_TOKEN'] = 'token'
 
+import json
+import shutil
+import tempfile
 import unittest
 from collections import namedtuple
 
 from click.testing import CliRunner
-from loadimpactcli import userscenario_commands
+from loadimpact3 import DataStore
+from loadimpact3.exceptions import NotFoundError
+from loadimpactcli import datastore_commands, polling, userscenario_commands
+from loadimpactcli.client import CLIClient
+from loadimpactcli.userscenario_commands import get_validation_results, update_user_scenario_script
 
 try:
-    from unittest.mock import MagicMock
+    from unittest.mock import MagicMock, patch
 except ImportError:
-    from mock import MagicMock
+    from mock import MagicMock, patch
 
 
 class MockValidation(object):
 
-    def __init__(self, status_text):
+    def __init__(self, status_text, done=True):
+        self.id = 1
         self.status_text = status_text
+        self.done = done
+
+    def is_done(self):
+        return self.done
 
 
 class MockValidationResult(object):
@@ -86,7 +98,8 @@ class TestUserScenarios(unittest.TestCase):
     def test_create_scenario(self):
         client = userscenario_commands.client
         client.create_user_scenario = MagicMock(return_value=self.scenario1)
-        result = self.runner.invoke(userscenario_commands.create_scenario, ['tests/script', 'my script', '--project_id', '1'])
+        result = self.runner.invoke(userscenario_commands.create_scenario,
+                                    ['tests/script', 'my script', '--project_id', '1'])
         assert result.exit_code == 0
         assert result.output == "debug\n"
 
@@ -94,16 +107,59 @@ class TestUserScenarios(unittest.TestCase):
         result = self.runner.invoke(userscenario_commands.create_scenario, [])
         assert result.exit_code == 2
 
+    def _no_sleep(self):
+        return patch.object(datastore_commands, 'poll',
+                            side_effect=lambda check, **kwargs: polling.poll(check, sleep=MagicMock(), **kwargs))
+
+    def _mock_create_data_store(self, status=DataStore.STATUS_FINISHED):
+        """
+        Mock `client.create_data_store` returning data stores with ids 10, 11...
+        whose conversion finishes with `status` on the second check.
+        """
+        def create_data_store(data, file_object):
+            data_store = MagicMock(id=10 + len(data_stores), status=DataStore.STATUS_CONVERTING)
+            data_store.name = data['name']
+
+            def has_conversion_finished():
+                data_store.status = status
+                return data_store.has_conversion_finished.call_count > 1
+
+            data_store.has_conversion_finished.side_effect = has_conversion_finished
+            data_stores.append(data_store)
+            return data_store
+
+        data_stores = []
+        userscenario_commands.client.create_data_store = MagicMock(side_effect=create_data_store)
+        return data_stores
+
     def test_create_scenario_with_datastore_files(self):
         client = userscenario_commands.client
         client.create_user_scenario = MagicMock(return_value=self.scenario1)
-        result = self.runner.invoke(userscenario_commands.create_scenario,
-                                    ['tests/script', 'my script',
-                                     '--project_id', '1',
-                                     '--datastore_file', 'tests/datastore.csv',
-                                     '--datastore_file', 'tests/script'])
+        data_stores = self._mock_create_data_store()
+        with self._no_sleep():
+            result = self.runner.invoke(userscenario_commands.create_scenario,
+                                        ['tests/script', 'my script',
+                                         '--project_id', '1',
+                                         '--datastore_file', 'tests/datastore.csv',
+                                         '--datastore_file', 'tests/script',
+                                         '--datastore_id', '1'])
         assert result.exit_code == 0
         assert result.output == "debug\n"
+        assert [d.has_conversion_finished.call_count for d in data_stores] == [2, 2]
+        assert sorted(client.create_user_scenario.call_args[1]['data']['data_store_ids']) == [1, 10, 11]
+
+    def test_create_scenario_with_failed_datastore(self):
+        client = userscenario_commands.client
+        client.create_user_scenario = MagicMock(return_value=self.scenario1)
+        self._mock_create_data_store(DataStore.STATUS_FAILED)
+        with self._no_sleep():
+            result = self.runner.invoke(userscenario_commands.create_scenario,
+                                        ['tests/script', 'my script',
+                                         '--project_id', '1',
+                                         '--datastore_file', 'tests/datastore.csv'])
+        assert result.exit_code == 1
+        assert result.output == "Data store tests/datastore.csv (10) conversion finished with status 'failed'\n"
+        assert client.create_user_scenario.call_count == 0
 
     def test_create_scenario_with_existing_datastore(self):
         client = userscenario_commands.client
@@ -146,6 +202,29 @@ class TestUserScenarios(unittest.TestCase):
 
         assert result.exit_code == 0
 
+    def test_get_validation_results(self):
+        """
+        Test that the results are streamed while the validation runs, and
+        that there is no wait once it is done.
+        """
+        client = userscenario_commands.client
+        results = [MockValidationResult(2, 'msg 1'), MockValidationResult(2, 'msg 2'),
+                   MockValidationResult(2, 'msg 3')]
+        client.get_user_scenario_validation = MagicMock(side_effect=[MockValidation('Running', done=False),
+                                                                     MockValidation('Finished')])
+        client.get_user_scenario_validation_result = MagicMock(side_effect=[results[:1], results])
+        sleep = MagicMock()
+        streamed = []
+
+        with patch.object(userscenario_commands, 'poll',
+                          side_effect=lambda check, **kwargs: polling.poll(check, sleep=sleep, **kwargs)):
+            validation_results = get_validation_results(MockValidation('Queued', done=False),
+                                                        on_result=streamed.append)
+
+        self.assertEqual(validation_results, results)
+        self.assertEqual(streamed, results)
+        self.assertEqual(sleep.call_count, 1)
+
     def test_validate_scenario_no_params(self):
         result = self.runner.invoke(userscenario_commands.delete_scenario, [])
         assert result.exit_code == 2
@@ -155,6 +234,96 @@ class TestUserScenarios(unittest.TestCase):
         MockValidationResult.level = None
         userscenario_commands.get_timestamp_as_local_time = MagicMock(return_value=2)
 
-        unformatted_validations = [MockValidationResult(2, 'msg 1'), MockValidationResult(2, 'msg 2'), MockValidationResult(2, 'msg 3')]
+        unformatted_validations = [MockValidationResult(2, 'msg 1'), MockValidationResult(2, 'msg 2'),
+                                   MockValidationResult(2, 'msg 3')]
         formatted_validations = userscenario_commands.get_formatted_validation_results(unformatted_validations)
         assert formatted_validations == "[2] msg 1\n[2] msg 2\n[2] msg 3\n"
+
+
+class TestUserScenarioSync(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = CliRunner()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.scripts_dir = os.path.join(self.tmp_dir, 'scripts')
+        os.makedirs(self.scripts_dir)
+        self.hashes_path = os.path.join(self.tmp_dir, 'config', 'scenario_hashes.json')
+
+        self._write('scenarios.json', json.dumps({'a.lua': 1, 'b.lua': 2}))
+        self._write('a.lua', u'-- a')
+        self._write('b.lua', u'-- b åäö')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, file_name, content):
+        with open(os.path.join(self.scripts_dir, file_name), 'wb') as f:
+            f.write(content.encode('utf-8'))
+
+    def _sync(self, *args, **kwargs):
+        update = MagicMock(side_effect=kwargs.get('side_effect'))
+        with patch.object(userscenario_commands, 'SCENARIO_HASHES_PATH', self.hashes_path), \
+                patch.object(userscenario_commands, 'update_user_scenario_script', update):
+            result = self.runner.invoke(userscenario_commands.sync_scenarios, [self.scripts_dir] + list(args))
+        return result, sorted(call[0] for call in update.call_args_list)
+
+    def test_sync(self):
+        result, updates = self._sync()
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(updates, [(1, u'-- a'), (2, u'-- b åäö')])
+        self.assertIn(u'2 updated, 0 unchanged, 0 failed', result.output)
+
+        # Only the changed scripts are pushed.
+        self._write('b.lua', u'-- b changed')
+        result, updates = self._sync()
+        self.assertEqual(updates, [(2, u'-- b changed')])
+        self.assertIn(u'1 updated, 1 unchanged, 0 failed', result.output)
+
+        result, updates = self._sync('--dry_run', '--force')
+        self.assertEqual(updates, [])
+        self.assertEqual(result.output, u'Would update user scenario 1 from a.lua\n'
+                                        u'Would update user scenario 2 from b.lua\n')
+
+    def test_sync_error(self):
+        def update(scenario_id, script):
+            if scenario_id == 1:
+                raise NotFoundError('Not found')
+
+        result, _ = self._sync(side_effect=update)
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn(u'User scenario 1 could not be updated from a.lua: Not found', result.output)
+
+        # The failed script is pushed again.
+        result, updates = self._sync()
+        self.assertEqual(updates, [(1, u'-- a')])
+
+    def test_sync_other_account(self):
+        result, updates = self._sync()
+        self.assertEqual(len(updates), 2)
+
+        # The hashes pushed with another token or API host do not apply.
+        other_api_client = CLIClient(api_token='token')
+        other_api_client.api_base_url = 'https://api.example.com/v3/'
+        for other_client in (CLIClient(api_token='other token'), other_api_client):
+            with patch.object(userscenario_commands, 'client', other_client):
+                result, updates = self._sync()
+            self.assertEqual(len(updates), 2)
+            self.assertIn(u'2 updated, 0 unchanged, 0 failed', result.output)
+
+    def test_sync_invalid_manifest(self):
+        self._write('scenarios.json', u'["a.lua"]')
+        result, _ = self._sync()
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn(u'Invalid manifest', result.output)
+
+    def test_update_user_scenario_script(self):
+        scenario = MagicMock(script=u'-- a')
+        userscenario_commands.client.get_user_scenario = MagicMock(return_value=scenario)
+
+        # An unchanged script is not updated.
+        self.assertIs(update_user_scenario_script(1, u'-- a'), scenario)
+        self.assertEqual(scenario.update_scenario.call_count, 0)
+
+        self.assertIs(update_user_scenario_script(1, u'-- b'), scenario.update_scenario.return_value)
+        scenario.update_scenario.assert_called_once_with({'script': u'-- b'})
+        self.assertEqual(userscenario_commands.client.get_user_scenario.call_count, 2)